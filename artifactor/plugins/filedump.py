@@ -15,6 +15,7 @@ from artifactor import ArtifactorBasePlugin
 import base64
 import os
 import re
+import shutil
 
 from cfme.utils import normalize_text, safe_string
 
@@ -47,7 +48,7 @@ class Filedump(ArtifactorBasePlugin):
     def filedump(self, description, contents, slaveid=None, mode="w", contents_base64=False,
                  display_type="primary", display_glyph=None, file_type=None,
                  dont_write=False, os_filename=None, group_id=None, test_name=None,
-                 test_location=None):
+                 test_location=None, contents_path=None):
         if not slaveid:
             slaveid = "Master"
         test_ident = "{}/{}".format(self.store[slaveid]['test_location'],
@@ -79,10 +80,14 @@ class Filedump(ArtifactorBasePlugin):
         if not dont_write:
             if os.path.isfile(os_filename):
                 os.remove(os_filename)
-            with open(os_filename, mode) as f:
-                if contents_base64:
-                    contents = base64.b64decode(contents)
-                f.write(contents)
+            if contents_path is not None:
+                # Spooled by a test worker on this machine, a rename if on the same filesystem
+                shutil.move(contents_path, os_filename)
+            else:
+                with open(os_filename, mode) as f:
+                    if contents_base64:
+                        contents = base64.b64decode(contents)
+                    f.write(contents)
 
         return None, {'artifacts': {test_ident: {'files': artifacts}}}
 
@@ -11,14 +11,15 @@ artifactor:
             enabled: True
             plugin: reporter
             only_failed: False #Only show faled tests in the report
+            report_interval: 30 #Seconds between the reports built during the session
 """
 import csv
 import datetime
 import difflib
+import json
 import math
 import shutil
 import time
-from copy import deepcopy
 
 import os
 import re
@@ -30,18 +31,26 @@ from cfme.utils import process_pytest_path
 from cfme.utils.conf import cfme_data  # Only for the provider specific reports
 from cfme.utils.path import template_path
 
-_tests_tpl = {
-    '_sub': {},
-    '_stats': {
-        'passed': 0,
-        'failed': 0,
-        'skipped': 0,
-        'error': 0,
-        'xpassed': 0,
-        'xfailed': 0
-    },
-    '_duration': 0
-}
+# Test artifacts which, when unchanged, leave a finished test's report summary unchanged
+SUMMARY_SIGNATURE_KEYS = (
+    'statuses', 'start_time', 'finish_time', 'slaveid', 'files', 'skipped', 'old', 'composite')
+
+
+def tree_level():
+    """A level of the test tree built by :py:meth:`ReporterBase.build_dict`"""
+    return {
+        '_sub': {},
+        '_stats': {
+            'passed': 0,
+            'failed': 0,
+            'skipped': 0,
+            'error': 0,
+            'xpassed': 0,
+            'xfailed': 0
+        },
+        '_duration': 0
+    }
+
 
 # Regexp, that finds all URLs in a string
 # Does not cover all the cases, but rather only those we can
@@ -64,6 +73,46 @@ def overall_test_status(statuses):
     return "passed"
 
 
+class SummaryStore(object):
+    """Append-only store of per-test report summaries
+
+    Summaries of finished tests are appended to a JSON lines file in the artifact dir as they are
+    built, so a test's files (qa contacts, tracebacks) are read only once per change of the test,
+    even across artifactor restarts. The last line stored for a test wins.
+    """
+    filename = 'reporter_summaries.jsonl'
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, self.filename)
+        self.summaries = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Cut off by a crash while being written
+                    self.summaries[record['name']] = record['signature'], record['summary']
+        except IOError:
+            pass
+        self._file = None
+
+    def get(self, name, signature):
+        stored_signature, summary = self.summaries.get(name, (None, None))
+        if stored_signature != signature:
+            return None
+        return summary
+
+    def put(self, name, signature, summary):
+        self.summaries[name] = signature, summary
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(
+            {'name': name, 'signature': signature, 'summary': summary}, default=str))
+        self._file.write('\n')
+        self._file.flush()
+
+
 class ReporterBase(object):
     def _run_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
         template_data = self.process_data(old_artifacts, artifact_dir, version, fw_version)
@@ -75,34 +124,156 @@ class ReporterBase(object):
         self.render_report(template_data, 'report', artifact_dir, 'test_report.html')
 
     def _run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        summaries = self.summarize(old_artifacts, artifact_dir)
         for mgmt in cfme_data['management_systems'].keys():
-            template_data = self.process_data(old_artifacts, artifact_dir, version, fw_version,
+            template_data = self.build_template_data(summaries, version, fw_version,
                 name_filter=mgmt)
 
             self.render_report(template_data, "report_{}".format(mgmt), artifact_dir,
                 'test_report_provider.html')
 
-    def render_report(self, report, filename, log_dir, template):
-        template_env = Environment(
-            loader=FileSystemLoader(template_path.strpath)
-        )
-        data = template_env.get_template(template).render(**report)
+    @property
+    def template_env(self):
+        if not hasattr(self, '_template_env'):
+            self._template_env = Environment(
+                loader=FileSystemLoader(template_path.strpath)
+            )
+        return self._template_env
 
+    def render_report(self, report, filename, log_dir, template):
+        # Streamed, so that the whole report is never held in memory as one string
         with open(os.path.join(log_dir, '{}.html'.format(filename)), "w") as f:
-            f.write(data)
+            self.template_env.get_template(template).stream(**report).dump(f)
         try:
             shutil.copytree(template_path.join('dist').strpath, os.path.join(log_dir, 'dist'))
         except OSError:
             pass
 
+    def summary_store(self, log_dir):
+        if not hasattr(self, '_summary_stores'):
+            self._summary_stores = {}
+        if log_dir not in self._summary_stores:
+            self._summary_stores[log_dir] = SummaryStore(log_dir)
+        return self._summary_stores[log_dir]
+
     def process_data(self, artifacts, log_dir, version, fw_version, name_filter=None):
+        return self.build_template_data(
+            self.summarize(artifacts, log_dir), version, fw_version, name_filter)
+
+    def summarize(self, artifacts, log_dir):
+        """Returns the summaries of all the tests with a status
+
+        Summaries of finished tests come from the :py:class:`SummaryStore` unless the test's
+        artifacts changed since they were stored.
+        """
+        store = self.summary_store(local(log_dir).strpath)
+        summaries = []
+        for test_name, test in artifacts.iteritems():
+            if not test.get('statuses'):
+                continue
+            # This was removed previously but is needed as the overall is not generated
+            # until the test finishes. So this is here as a shim.
+            test['statuses']['overall'] = overall_test_status(test['statuses'])
+            if not test.get('finish_time'):
+                # The duration of a test in progress changes all the time
+                summaries.append(self.summarize_test(test_name, test, log_dir))
+                continue
+            signature = json.dumps(
+                [test.get(key) for key in SUMMARY_SIGNATURE_KEYS], sort_keys=True, default=str)
+            summary = store.get(test_name, signature)
+            if summary is None:
+                summary = self.summarize_test(test_name, test, log_dir)
+                store.put(test_name, signature, summary)
+            summaries.append(summary)
+        return summaries
+
+    def summarize_test(self, test_name, test, log_dir):
+        colors = {
+            'passed': 'success',
+            'failed': 'warning',
+            'error': 'danger',
+            'xpassed': 'danger',
+            'xfailed': 'success',
+            'skipped': 'info'}
+        log_dir = local(log_dir).strpath + "/"
+        overall_status = test['statuses']['overall']
+        test_data = {'name': test_name, 'outcomes': dict(test['statuses']),
+                     'slaveid': test.get('slaveid', "Unknown"), 'color': colors[overall_status]}
+        if 'composite' in test:
+            test_data['composite'] = test['composite']
+
+        if 'skipped' in test:
+            if test['skipped'].get('type') == 'provider':
+                test_data['skip_provider'] = test['skipped'].get('reason')
+            if test['skipped'].get('type') == 'blocker':
+                test_data['skip_blocker'] = test['skipped'].get('reason')
+
+        if 'skip_blocker' in test_data:
+            # Fix the inconveniently long list of repeated blockers until we sort out sets
+            # in riggerlib somehow.
+            test_data['skip_blocker'] = sorted(set(test_data['skip_blocker']))
+
+        if test.get('old', False):
+            test_data['old'] = True
+
+        if test.get('start_time'):
+            if test.get('finish_time'):
+                test_data['in_progress'] = False
+                test_data['duration'] = test['finish_time'] - test['start_time']
+            else:
+                test_data['duration'] = time.time() - test['start_time']
+                test_data['in_progress'] = True
+
+        # Set up destinations for the files
+        test_data["file_groups"] = []
+        test_data['qa_contact'] = []
+        processed_groups = {}
+        order = 0
+        for file_dict in test.get('files', []):
+            group = file_dict["group_id"]
+            if group not in processed_groups:
+                processed_groups[group] = (order, [])
+                order += 1
+            processed_groups[group][-1].append(file_dict)
+        # Current structure:
+        # {groupid: (group_order, [{filedict1}, {filedict2}])}
+        # Sorting by group_order
+        processed_groups = sorted(processed_groups.iteritems(), key=lambda kv: kv[1][0])
+        # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
+        processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
+        for group_name, file_dicts in processed_groups:
+            group_file_list = []
+            for file_dict in file_dicts:
+                if file_dict["file_type"] == "qa_contact":
+                    with open(file_dict["os_filename"], 'rb') as qafile:
+                        qareader = csv.reader(qafile, delimiter=',', quotechar='"')
+                        for qacontact in qareader:
+                            test_data['qa_contact'].append(qacontact)
+                    continue  # Do not store, handled a different way :)
+                elif file_dict["file_type"] == "short_tb":
+                    with open(file_dict["os_filename"], 'r') as short_tb:
+                        test_data["short_tb"] = short_tb.read()
+                    continue
+                group_file_list.append(
+                    dict(file_dict, filename=file_dict["os_filename"].replace(log_dir, "")))
+
+            test_data["file_groups"].append((group_name, group_file_list))
+        # Snd remove groups that are left empty because of eg. traceback or qa contact
+        test_data["file_groups"] = filter(
+            lambda group: len(group[1]) > 0, test_data["file_groups"])
+        if "short_tb" in test_data and test_data["short_tb"]:
+            urls = [url for url in URL.findall(test_data["short_tb"])]
+            if urls:
+                test_data["urls"] = urls
+        return test_data
+
+    def build_template_data(self, summaries, version, fw_version, name_filter=None):
         tb_errors = []
         blocker_skip_count = 0
         provider_skip_count = 0
         template_data = {'tests': [], 'qa': []}
         template_data['version'] = version
         template_data['fw_version'] = fw_version
-        log_dir = local(log_dir).strpath + "/"
         counts = {
             'passed': 0,
             'failed': 0,
@@ -117,98 +288,21 @@ class ReporterBase(object):
             'error': 0,
             'xfailed': 0,
             'xpassed': 0}
-        colors = {
-            'passed': 'success',
-            'failed': 'warning',
-            'error': 'danger',
-            'xpassed': 'danger',
-            'xfailed': 'success',
-            'skipped': 'info'}
-        # Iterate through the tests and process the counts and durations
-        for test_name, test in artifacts.iteritems():
-            if not test.get('statuses'):
-                continue
-            overall_status = overall_test_status(test['statuses'])
+        # Iterate through the tests and process the counts
+        for summary in summaries:
+            overall_status = summary['outcomes']['overall']
             counts[overall_status] += 1
-            if not test.get('old', False):
+            if not summary.get('old', False):
                 current_counts[overall_status] += 1
-            color = colors[overall_status]
-            # This was removed previously but is needed as the overall is not generated
-            # until the test finishes. So this is here as a shim.
-            test['statuses']['overall'] = overall_status
-            test_data = {'name': test_name, 'outcomes': test['statuses'],
-                         'slaveid': test.get('slaveid', "Unknown"), 'color': color}
-            if 'composite' in test:
-                test_data['composite'] = test['composite']
-
-            if 'skipped' in test:
-                if test['skipped'].get('type') == 'provider':
-                    provider_skip_count += 1
-                    test_data['skip_provider'] = test['skipped'].get('reason')
-                if test['skipped'].get('type') == 'blocker':
-                    blocker_skip_count += 1
-                    test_data['skip_blocker'] = test['skipped'].get('reason')
-
-            if 'skip_blocker' in test_data:
-                # Fix the inconveniently long list of repeated blockers until we sort out sets
-                # in riggerlib somehow.
-                test_data['skip_blocker'] = sorted(set(test_data['skip_blocker']))
-
-            if test.get('old', False):
-                test_data['old'] = True
-
-            if test.get('start_time'):
-                if test.get('finish_time'):
-                    test_data['in_progress'] = False
-                    test_data['duration'] = test['finish_time'] - test['start_time']
-                else:
-                    test_data['duration'] = time.time() - test['start_time']
-                    test_data['in_progress'] = True
-
-            # Set up destinations for the files
-            test_data["file_groups"] = []
-            test_data['qa_contact'] = []
-            processed_groups = {}
-            order = 0
-            for file_dict in test.get('files', []):
-                group = file_dict["group_id"]
-                if group not in processed_groups:
-                    processed_groups[group] = (order, [])
-                    order += 1
-                processed_groups[group][-1].append(file_dict)
-            # Current structure:
-            # {groupid: (group_order, [{filedict1}, {filedict2}])}
-            # Sorting by group_order
-            processed_groups = sorted(processed_groups.iteritems(), key=lambda kv: kv[1][0])
-            # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
-            processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
-            for group_name, file_dicts in processed_groups:
-                group_file_list = []
-                for file_dict in file_dicts:
-                    if file_dict["file_type"] == "qa_contact":
-                        with open(file_dict["os_filename"], 'rb') as qafile:
-                            qareader = csv.reader(qafile, delimiter=',', quotechar='"')
-                            for qacontact in qareader:
-                                test_data['qa_contact'].append(qacontact)
-                                if qacontact[0] not in template_data['qa']:
-                                    template_data['qa'].append(qacontact[0])
-                        continue  # Do not store, handled a different way :)
-                    elif file_dict["file_type"] == "short_tb":
-                        with open(file_dict["os_filename"], 'r') as short_tb:
-                            test_data["short_tb"] = short_tb.read()
-                        continue
-                    file_dict["filename"] = file_dict["os_filename"].replace(log_dir, "")
-                    group_file_list.append(file_dict)
-
-                test_data["file_groups"].append((group_name, group_file_list))
-            # Snd remove groups that are left empty because of eg. traceback or qa contact
-            test_data["file_groups"] = filter(
-                lambda group: len(group[1]) > 0, test_data["file_groups"])
-            if "short_tb" in test_data and test_data["short_tb"]:
-                urls = [url for url in URL.findall(test_data["short_tb"])]
-                if urls:
-                    test_data["urls"] = urls
-            template_data['tests'].append(test_data)
+            if 'skip_provider' in summary:
+                provider_skip_count += 1
+            if 'skip_blocker' in summary:
+                blocker_skip_count += 1
+            for qacontact in summary['qa_contact']:
+                if qacontact[0] not in template_data['qa']:
+                    template_data['qa'].append(qacontact[0])
+            # Copied as the report formats some of the values, the summaries are reused
+            template_data['tests'].append(dict(summary))
         template_data['top10'] = self.top10(tb_errors)
         template_data['counts'] = counts
         template_data['current_counts'] = current_counts
@@ -221,8 +315,8 @@ class ReporterBase(object):
 
         # Create the tree dict that is used for js tree
         # Note template_data['tests'] != tests
-        tests = deepcopy(_tests_tpl)
-        tests['_sub']['tests'] = deepcopy(_tests_tpl)
+        tests = tree_level()
+        tests['_sub']['tests'] = tree_level()
 
         for test in template_data['tests']:
             self.build_dict(test['name'].replace('cfme/', ''), tests, test)
@@ -272,7 +366,7 @@ class ReporterBase(object):
         # If we are in a module.
         else:
             if head not in container['_sub']:
-                container['_sub'][head] = deepcopy(_tests_tpl)
+                container['_sub'][head] = tree_level()
             # Call again to recurse down the tree.
             self.build_dict(end, container['_sub'][head], contents)
             container['_stats'][contents['outcomes']['overall']] += 1
@@ -288,7 +382,7 @@ class ReporterBase(object):
                    'skipped': 'primary',
                    'xpassed': 'danger',
                    'xfailed': 'success'}
-        list_string = '<ul>\n'
+        list_parts = ['<ul>\n']
         for k, v in lev['_sub'].iteritems():
 
             # If 'name' is an attribute then we are looking at a test (leaf).
@@ -303,7 +397,7 @@ class ReporterBase(object):
                     .format(v['name'], proc_name, teststring, label, pretty_time))
                 # Do we really need the os.path.split (now process_pytest_path) here?
                 # For me it seems the name is always the leaf
-                list_string += '<li>{}</li>\n'.format(link)
+                list_parts.append('<li>{}</li>\n'.format(link))
 
             # If there is a '_sub' attribute then we know we have other modules to go.
             elif '_sub' in v:
@@ -326,15 +420,15 @@ class ReporterBase(object):
                         bimdict[level], percen)
                 modstring = '<span name="mod_lev" class="label label-primary">M</span>'
                 pretty_time = str(datetime.timedelta(seconds=math.ceil(v['_duration'])))
-                list_string += ('<li>{} {}<span>&nbsp;</span>'
-                                '{}{}<span style="color:#888888">&nbsp;<em>[{}]'
-                                '</em></span></li>\n').format(k,
-                                                              modstring,
-                                                              str(percenstring),
-                                                              self.build_li(v),
-                                                              pretty_time)
-        list_string += '</ul>\n'
-        return list_string
+                list_parts.append(('<li>{} {}<span>&nbsp;</span>'
+                                   '{}{}<span style="color:#888888">&nbsp;<em>[{}]'
+                                   '</em></span></li>\n').format(k,
+                                                                 modstring,
+                                                                 str(percenstring),
+                                                                 self.build_li(v),
+                                                                 pretty_time))
+        list_parts.append('</ul>\n')
+        return ''.join(list_parts)
 
 
 class Reporter(ArtifactorBasePlugin, ReporterBase):
@@ -342,7 +436,7 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
         self.register_plugin_hook('report_test', self.report_test)
         self.register_plugin_hook('finish_session', self.run_report)
         self.register_plugin_hook('finish_session', self.run_provider_report)
-        self.register_plugin_hook('build_report', self.run_report)
+        self.register_plugin_hook('build_report', self.build_report)
         self.register_plugin_hook('start_test', self.start_test)
         self.register_plugin_hook('skip_test', self.skip_test)
         self.register_plugin_hook('finish_test', self.finish_test)
@@ -352,6 +446,7 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
 
     def configure(self):
         self.only_failed = self.data.get('only_failed', False)
+        self.report_interval = self.data.get('report_interval', 30)
         self.configured = True
 
     @ArtifactorBasePlugin.check_configured
@@ -418,6 +513,16 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
     def run_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
         self._run_report(old_artifacts, artifact_dir, version, fw_version)
 
+    @ArtifactorBasePlugin.check_configured
+    def build_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        # Fired after every test phase, so the report in progress is only rebuilt once in a while,
+        # the final one is built by finish_session
+        now = time.time()
+        if now - self.store.get('last_build', 0) < self.report_interval:
+            return
+        self.store['last_build'] = now
+        self._run_report(old_artifacts, artifact_dir, version, fw_version)
+
     @ArtifactorBasePlugin.check_configured
     def run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
         self._run_provider_report(old_artifacts, artifact_dir, version, fw_version)
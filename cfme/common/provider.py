@@ -1,7 +1,9 @@
 import datetime
+import time
 from collections import Iterable
 
 from manageiq_client.api import APIException
+from manageiq_client.filters import Q
 from widgetastic.widget import View, Text
 from widgetastic_patternfly import Button, Input
 
@@ -20,6 +22,13 @@ from cfme.utils.varmeth import variable
 from cfme.utils.wait import wait_for, RefreshTimer
 from . import PolicyProfileAssignable
 
+# How many resources are requested in one page of a bulk REST query
+REST_PAGE_SIZE = 1000
+# How many names are looked up with one filtered REST query
+REST_FILTER_CHUNK = 50
+# For how many seconds a VM name to id index is used, see BaseProvider.build_vm_index
+VM_INDEX_TTL = 60
+
 
 # TODO: Move to collection when it happens
 def base_types():
@@ -915,42 +924,105 @@ class BaseProvider(WidgetasticTaggable, Updateable, Navigatable):
         template_details['guid'] = template.guid
         return template_details
 
+    def iter_rest_resources(self, collection, attributes, filters=None):
+        """Streams the raw resources of a REST collection, page by page
+
+        Every page is one ``expand=resources`` query, instead of a request per resource.
+
+        Args:
+            collection: REST collection to query
+            attributes: Names of the attributes to load for each resource
+            filters: Optional list of ``filter[]`` expressions
+        Yields:
+            :py:class:`dict` with ``id`` and the requested attributes of each resource
+        """
+        params = {
+            'expand': 'resources',
+            'attributes': ','.join(attributes),
+            'sort_by': 'id',
+            'sort_order': 'asc',
+            'limit': REST_PAGE_SIZE,
+        }
+        if filters:
+            params['filter[]'] = filters
+        offset = 0
+        while True:
+            params['offset'] = offset
+            resources = self.appliance.rest_api.get(collection._href, **params)['resources']
+            for resource in resources:
+                yield resource
+            if len(resources) < REST_PAGE_SIZE:
+                break
+            offset += len(resources)
+
     def get_all_template_details(self):
         """
         Returns a dictionary mapping template ids to their name, type, and guid
         """
         # TODO: Move to TemplateCollection.all
+        logger.debug('Retrieving the details of all templates')
         all_details = {}
-        for id in self.get_all_template_ids():
-            all_details[id] = self.get_template_details(id)
+        try:
+            for template in self.iter_rest_resources(
+                    self.appliance.rest_api.collections.templates, ['name', 'type', 'guid']):
+                all_details[template['id']] = {
+                    'name': template['name'],
+                    'type': template['type'],
+                    'guid': template['guid'],
+                }
+        except APIException:
+            return None
         return all_details
 
+    def build_vm_index(self):
+        """
+        Loads the ids of all VMs by name for :py:meth:`get_vm_id` and :py:meth:`get_vm_ids`
+
+        The index is used for ``VM_INDEX_TTL`` seconds. Names missing in it are still looked up.
+        """
+        logger.debug('Building the VM name index')
+        index = {}
+        try:
+            for vm in self.iter_rest_resources(self.appliance.rest_api.collections.vms, ['name']):
+                index.setdefault(vm['name'], vm['id'])
+        except APIException:
+            return None
+        self._vm_index = (time.time(), index)
+        return index
+
     def get_vm_id(self, vm_name):
         """
         Return the ID associated with the specified VM name
         """
         # TODO: Get Provider object from VMCollection.find, then use VM.id to get the id
         logger.debug('Retrieving the ID for VM: {}'.format(vm_name))
-        for vm_id in self.get_all_vm_ids():
-            details = self.get_vm_details(vm_id)
-            if details['name'] == vm_name:
-                return vm_id
+        id_map = self.get_vm_ids([vm_name])
+        if id_map is None:
+            return None
+        return id_map.get(vm_name)
 
     def get_vm_ids(self, vm_names):
         """
         Returns a dictionary mapping each VM name to it's id
         """
         # TODO: Move to VMCollection.find or VMCollection.all
-        name_list = vm_names[:]
-        logger.debug('Retrieving the IDs for {} VM(s)'.format(len(name_list)))
-        id_map = {}
-        for vm_id in self.get_all_vm_ids():
-            if not name_list:
-                break
-            vm_name = self.get_vm_details(vm_id)['name']
-            if vm_name in name_list:
-                id_map[vm_name] = vm_id
-                name_list.remove(vm_name)
+        logger.debug('Retrieving the IDs for {} VM(s)'.format(len(vm_names)))
+        built, index = getattr(self, '_vm_index', (None, {}))
+        if built is None or time.time() - built > VM_INDEX_TTL:
+            index = {}
+        id_map = {name: index[name] for name in vm_names if name in index}
+        missing = [name for name in vm_names if name not in id_map]
+        collection = self.appliance.rest_api.collections.vms
+        try:
+            for i in range(0, len(missing), REST_FILTER_CHUNK):
+                query = None
+                for name in missing[i:i + REST_FILTER_CHUNK]:
+                    name_q = Q('name', '=', name)
+                    query = name_q if query is None else query | name_q
+                for vm in self.iter_rest_resources(collection, ['name'], query.as_filters):
+                    id_map.setdefault(vm['name'], vm['id'])
+        except APIException:
+            return None
         return id_map
 
     def get_template_guids(self, template_dict):
@@ -9,7 +9,7 @@ from cfme.services.catalogs.catalog import Catalog
 from cfme.services.catalogs.catalog_item import CatalogItem
 from cfme.utils import version
 from cfme.utils.log import logger
-from cfme.utils.rest import create_resource
+from cfme.utils.rest import create_resource, delete_existing_resources
 from cfme.utils.virtual_machines import deploy_template
 from cfme.utils.wait import wait_for
 from fixtures.provider import setup_one_by_class_or_skip
@@ -501,11 +501,7 @@ def _creating_skeleton(request, rest_api, col_name, col_data, col_action='create
     @request.addfinalizer
     def _finished():
         collection = getattr(rest_api.collections, col_name)
-        collection.reload()
-        ids = [e.id for e in original_entities]
-        delete_entities = [e for e in collection if e.id in ids]
-        if delete_entities:
-            collection.action.delete(*delete_entities)
+        delete_existing_resources(collection, original_entities)
 
     return entities
 
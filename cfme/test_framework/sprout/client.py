@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import json
 import os
+import re
 import requests
+import time
+from contextlib import contextmanager
 
 import attr
 
@@ -21,6 +24,15 @@ class AuthException(SproutException):
     pass
 
 
+class MethodNotFound(SproutException):
+    """The Sprout server does not have the called method, e.g. it was not upgraded yet"""
+    pass
+
+
+#: How often the pool status is checked when the server cannot wait for its changes
+REQUEST_CHECK_DELAY = 5
+
+
 @attr.s
 class APIMethodCall(object):
     _client = attr.ib()
@@ -30,6 +42,69 @@ class APIMethodCall(object):
         return self._client.call_method(self._method_name, *args, **kwargs)
 
 
+@attr.s
+class BatchedResult(object):
+    """Placeholder for the result of a call made in a :py:class:`SproutBatch`.
+
+    Available after the batch was sent, :py:attr:`result` raises the call's exception if it failed.
+    """
+    _name = attr.ib()
+    _result = attr.ib(init=False, default=None)
+    _exception = attr.ib(init=False, default=None)
+    _done = attr.ib(init=False, default=False)
+
+    def _set(self, result=None, exception=None):
+        self._result = result
+        self._exception = exception
+        self._done = True
+
+    @property
+    def result(self):
+        if not self._done:
+            raise SproutException("The batch with {} call was not sent yet!".format(self._name))
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+@attr.s
+class BatchedMethodCall(object):
+    _batch = attr.ib()
+    _method_name = attr.ib()
+
+    def __call__(self, *args, **kwargs):
+        return self._batch.add(self._method_name, *args, **kwargs)
+
+
+@attr.s
+class SproutBatch(object):
+    """Collects method calls and sends them to Sprout in a single request on :py:meth:`send`.
+
+    Usually used through :py:meth:`SproutClient.batch`.
+    """
+    _client = attr.ib()
+    _calls = attr.ib(init=False, default=attr.Factory(list))
+
+    def add(self, name, *args, **kwargs):
+        placeholder = BatchedResult(name)
+        self._calls.append((placeholder, (name, args, kwargs)))
+        return placeholder
+
+    def send(self):
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        results = self._client.call_methods([call for _, call in calls])
+        for (placeholder, _), result in zip(calls, results):
+            if isinstance(result, SproutException):
+                placeholder._set(exception=result)
+            else:
+                placeholder._set(result=result)
+
+    def __getattr__(self, attr):
+        return BatchedMethodCall(self, attr)
+
+
 @attr.s
 class SproutClient(object):
     _proto = attr.ib(default="http")
@@ -37,6 +112,7 @@ class SproutClient(object):
     _port = attr.ib(default=8000)
     _entry = attr.ib(default="appliances/api")
     _auth = attr.ib(default=None)
+    _wait_request_change_missing = attr.ib(init=False, default=False, repr=False)
 
     @property
     def api_entry(self):
@@ -55,18 +131,13 @@ class SproutClient(object):
         )
         return result.out.json()
 
-    def call_method(self, name, *args, **kwargs):
-        req_data = {
-            "method": name,
-            "args": args,
-            "kwargs": kwargs,
-        }
-        logger.info("SPROUT: Called {} with {} {}".format(name, args, kwargs))
-        if self._auth is not None:
-            req_data["auth"] = self._auth
-        result = self._call_post(**req_data)
+    @staticmethod
+    def _unpack(result):
         try:
             if result["status"] == "exception":
+                if result["result"]["class"] == "NameError" and re.match(
+                        r"^Method \S+ not found!$", result["result"]["message"]):
+                    raise MethodNotFound(result["result"]["message"])
                 raise SproutException(
                     "Exception {} raised! {}".format(
                         result["result"]["class"], result["result"]["message"]))
@@ -78,6 +149,75 @@ class SproutClient(object):
         except KeyError:
             raise Exception("Malformed response from Sprout!")
 
+    def call_method(self, name, *args, **kwargs):
+        req_data = {
+            "method": name,
+            "args": args,
+            "kwargs": kwargs,
+        }
+        logger.info("SPROUT: Called {} with {} {}".format(name, args, kwargs))
+        if self._auth is not None:
+            req_data["auth"] = self._auth
+        return self._unpack(self._call_post(**req_data))
+
+    def call_methods(self, calls):
+        """Calls multiple methods in a single request.
+
+        Args:
+            calls: Iterable of ``(name, args, kwargs)`` tuples.
+        Returns:
+            List of the results in the order of ``calls``. A call that failed has its
+            :py:class:`SproutException` in place of the result.
+        """
+        req_data = {
+            "calls": [
+                {"method": name, "args": args, "kwargs": kwargs}
+                for name, args, kwargs in calls],
+        }
+        logger.info("SPROUT: Called batch of {}".format(
+            ", ".join(call["method"] for call in req_data["calls"])))
+        if self._auth is not None:
+            req_data["auth"] = self._auth
+        results = []
+        for result in self._unpack(self._call_post(**req_data)):
+            try:
+                results.append(self._unpack(result))
+            except SproutException as e:
+                results.append(e)
+        return results
+
+    @contextmanager
+    def batch(self):
+        """Coalesces the calls made in the block into a single request sent when it exits.
+
+        .. code-block:: python
+
+            with client.batch() as batch:
+                checks = [batch.request_check(pool) for pool in pools]
+            fulfilled = [check.result["fulfilled"] for check in checks]
+        """
+        batch = SproutBatch(self)
+        yield batch
+        batch.send()
+
+    def wait_request_change(self, request_id, version=None):
+        """Blocks on the server until the pool changes from ``version``, then checks it.
+
+        Returns the ``request_check`` result, together with the ``version`` to pass next time.
+        Servers without the method get polled with ``request_check`` instead, every
+        :py:data:`REQUEST_CHECK_DELAY` seconds.
+        """
+        if not self._wait_request_change_missing:
+            try:
+                return self.call_method('wait_request_change', str(request_id), version)
+            except MethodNotFound:
+                logger.info("SPROUT: wait_request_change not available, polling request_check")
+                self._wait_request_change_missing = True
+        time.sleep(REQUEST_CHECK_DELAY)
+        result = self.call_method('request_check', str(request_id))
+        result['version'] = None
+        return result
+
     def __getattr__(self, attr):
         return APIMethodCall(self, attr)
 
@@ -111,10 +251,16 @@ class SproutClient(object):
             'request_appliances', preconfigured=preconfigured, version=version,
             group=stream, provider=provider, lease_time=lease_time, ram=ram, cpu=cpu, count=count
         )
+        data = {'version': None}
+
+        def _finished():
+            # Blocks on the server side until the pool changes
+            data.update(self.wait_request_change(request_id, data['version']))
+            return data['finished']
+
         wait_for(
-            lambda: self.call_method('request_check', str(request_id))['finished'], num_sec=300,
+            _finished, num_sec=300,
             message='provision {} appliance(s) from sprout'.format(count))
-        data = self.call_method('request_check', str(request_id))
         logger.debug(data)
         appliances = []
         for appliance in data['appliances']:
@@ -126,6 +126,7 @@ class SproutManager(object):
     pool = attr.ib(init=False, default=None)
     lease_time = attr.ib(init=False, default=None, repr=False)
     timer = attr.ib(init=False, default=None, repr=False)
+    pool_version = attr.ib(init=False, default=None, repr=False)
 
     def request_appliances(self, provision_request):
         self.request_pool(provision_request)
@@ -134,7 +135,7 @@ class SproutManager(object):
             result = wait_for(
                 self.check_fullfilled,
                 num_sec=provision_request.provision_timeout * 60,
-                delay=5,
+                delay=1,
                 message="requesting appliances was fulfilled"
             )
         except Exception:
@@ -184,9 +185,15 @@ class SproutManager(object):
     def request_check(self):
         return self.client.request_check(self.pool)
 
+    def wait_request_change(self):
+        """Like :py:meth:`request_check`, but waits for the pool to change since the last call"""
+        result = self.client.wait_request_change(self.pool, self.pool_version)
+        self.pool_version = result['version']
+        return result
+
     def check_fullfilled(self):
         try:
-            result = self.request_check()
+            result = self.wait_request_change()
         except SproutException as e:
             # TODO: ensure we only exit this way on sprout usage
             self.destroy_pool()
@@ -201,12 +208,15 @@ class SproutManager(object):
             log.info(
                 "Check if pool already exists for this %r Jenkins job", jenkins_job[0])
             jenkins_job_pools = self.client.find_pools_by_description(jenkins_job[0], partial=True)
-            for pool in jenkins_job_pools:
+            with self.client.batch() as batch:
+                descriptions = [
+                    (pool, batch.get_pool_description(pool)) for pool in jenkins_job_pools]
+            for pool, description in descriptions:
                 # Some jobs have overlapping descriptions, sprout API doesn't support regex
                 # job-name-12345 vs job-name-master-12345
                 # the partial match alone will catch both of these, use regex to confirm pool
                 # description is an accurate match
-                if self.client.get_pool_description(pool) == '{}{}'.format(jenkins_job[0], pool):
+                if description.result == '{}{}'.format(jenkins_job[0], pool):
                     log.info("Destroying the old pool %s for %r job.", pool, jenkins_job[0])
                     self.client.destroy_pool(pool)
                 else:
@@ -271,11 +281,11 @@ class ShutdownPlugin(object):
             log.debug("Trying to end appliance {}".format(ip_address))
             if config.getoption('--use-sprout'):
                 try:
-                    call_method = config._sprout_mgr.client.call_method
-                    log.debug("appliance data %r", call_method('appliance_data', ip_address))
-                    log.debug(
-                        "destroy appliance result: %r",
-                        call_method('destroy_appliance', ip_address))
+                    with config._sprout_mgr.client.batch() as batch:
+                        data = batch.appliance_data(ip_address)
+                        destroyed = batch.destroy_appliance(ip_address)
+                    log.debug("appliance data %r", data.result)
+                    log.debug("destroy appliance result: %r", destroyed.result)
                 except Exception as e:
                     log.debug('Error trying to end sprout appliance %s', ip_address)
                     log.debug(e)
@@ -900,7 +900,8 @@ class IPAppliance(object):
                 'container': self.container,
                 'is_pod': self.is_pod,
                 'port': self.ssh_port,
-                'project': self.project
+                'project': self.project,
+                'pooled': True,
             }
         else:
             connect_kwargs = {
@@ -910,6 +911,7 @@ class IPAppliance(object):
                 'container': self.container,
                 'is_pod': self.is_pod,
                 'port': self.ssh_port,
+                'pooled': True,
             }
         ssh_client = ssh.SSHClient(**connect_kwargs)
         try:
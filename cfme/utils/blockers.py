@@ -217,6 +217,8 @@ class BZ(Blocker):
 
 
 class JIRA(Blocker):
+    _status_cache = {}
+
     @classproperty
     def jira(cls):  # noqa
         if not hasattr(cls, "_jira"):
@@ -245,8 +247,10 @@ class JIRA(Blocker):
         if jira is None:
             # JIRA unspecified, shut up and don't block
             return False
-        issue = jira.issue(self.jira_id, fields='status')
-        return issue.fields.status.name.lower() != 'done'
+        if self.jira_id not in self._status_cache:
+            issue = jira.issue(self.jira_id, fields='status')
+            self._status_cache[self.jira_id] = issue.fields.status.name.lower()
+        return self._status_cache[self.jira_id] != 'done'
 
     def __str__(self):
         return 'Jira card {}'.format(self.url)
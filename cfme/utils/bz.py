@@ -1,15 +1,28 @@
 # -*- coding: utf-8 -*-
+import errno
+import os
 import re
+import tempfile
+import time
 from bugzilla import Bugzilla as _Bugzilla
+from bugzilla.bug import Bug as _Bug
 from collections import Sequence
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 from cached_property import cached_property
 from cfme.utils.conf import cfme_data, credentials
 from cfme.utils.log import logger
+from cfme.utils.path import log_path
 from cfme.utils.version import (
     LATEST, Version, current_version, appliance_build_datetime, appliance_is_downstream)
 
 NONE_FIELDS = {"---", "undefined", "unspecified"}
+# How many bugs are requested in one getbugs call
+GETBUGS_BATCH_SIZE = 200
 
 
 class Product(object):
@@ -45,12 +58,51 @@ class Product(object):
         return self.versions[-1]
 
 
+class BugCache(object):
+    """On-disk cache of raw bug data, shared by all the processes of a test run.
+
+    Every bug is stored in its own file which is replaced atomically, so parallel slaves can read
+    and write the cache at the same time. Entries older than ``ttl`` seconds are not used.
+    """
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, bug_id):
+        return os.path.join(self.directory, "{}.pickle".format(bug_id))
+
+    def get(self, bug_id):
+        path = self._path(bug_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, bug_id, data):
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self._path(bug_id))
+
+
 class Bugzilla(object):
     def __init__(self, **kwargs):
         self.__product = kwargs.pop("product", None)
+        cache_dir = kwargs.pop("cache_dir", None)
+        cache_ttl = kwargs.pop("cache_ttl", 3600)
         self.__kwargs = kwargs
         self.__bug_cache = {}
         self.__product_cache = {}
+        self.__resolved_cache = {}
+        self.__disk_cache = BugCache(cache_dir, cache_ttl) if cache_dir else None
 
     @property
     def bug_count(self):
@@ -86,7 +138,10 @@ class Bugzilla(object):
         password = credentials.get(cr_root, {}).get("password")
         return cls(
             url=url, user=username, password=password, cookiefile=None,
-            tokenfile=None, product=product)
+            tokenfile=None, product=product,
+            cache_dir=cfme_data.get("bugzilla", {}).get(
+                "cache_dir", log_path.join("bugzilla_cache").strpath),
+            cache_ttl=cfme_data.get("bugzilla", {}).get("cache_ttl", 3600))
 
     @cached_property
     def bugzilla(self):
@@ -107,12 +162,53 @@ class Bugzilla(object):
         else:
             return Version(cfme_data.get("bugzilla", {}).get("upstream_version", "9.9"))
 
+    def get_bugs(self, ids):
+        """Returns a dict of :py:class:`BugWrapper` of the bugs with given ids.
+
+        Bugs that are neither in memory nor in the disk cache are requested with batched
+        ``getbugs`` calls. Bugs that Bugzilla did not return (nonexistent, private) are left out.
+        """
+        ids = set(map(int, ids))
+        missing = [bug_id for bug_id in ids if bug_id not in self.__bug_cache]
+        if self.__disk_cache is not None:
+            for bug_id in missing:
+                data = self.__disk_cache.get(bug_id)
+                if data is not None:
+                    self.__bug_cache[bug_id] = BugWrapper(self, _Bug(self.bugzilla, dict=data))
+            missing = [bug_id for bug_id in missing if bug_id not in self.__bug_cache]
+        for i in range(0, len(missing), GETBUGS_BATCH_SIZE):
+            for bug in self.bugzilla.getbugs(missing[i:i + GETBUGS_BATCH_SIZE]):
+                if bug is None:
+                    continue
+                self.__bug_cache[bug.id] = BugWrapper(self, bug)
+                if self.__disk_cache is not None:
+                    self.__disk_cache.put(bug.id, bug.__getstate__())
+        return {bug_id: self.__bug_cache[bug_id] for bug_id in ids if bug_id in self.__bug_cache}
+
     def get_bug(self, id):
         id = int(id)
         if id not in self.__bug_cache:
+            self.get_bugs([id])
+        if id not in self.__bug_cache:
+            # Not returned by getbugs, getbug raises the appropriate fault
             self.__bug_cache[id] = BugWrapper(self, self.bugzilla.getbug(id))
         return self.__bug_cache[id]
 
+    def prefetch(self, ids):
+        """Loads the bugs and everything needed to resolve them as blockers in few requests."""
+        bugs = self.get_bugs(ids).values()
+        # The bugs the variants are looked for in, for all the bugs at once
+        related = set()
+        for bug in bugs:
+            related.update(bug._bug.blocks)
+            if bug.status == "CLOSED" and bug.resolution == "DUPLICATE":
+                related.add(bug.dupe_of)
+            if bug.copy_of:
+                related.add(bug.copy_of)
+        self.get_bugs(related)
+        for bug in bugs:
+            self.get_bug_variants(bug)
+
     def get_bug_variants(self, id):
         if isinstance(id, BugWrapper):
             bug = id
@@ -136,6 +232,17 @@ class Bugzilla(object):
         return found
 
     def resolve_blocker(self, blocker, version=None, ignore_bugs=None, force_block_streams=None):
+        if version is None:
+            version = current_version()
+        key = (
+            getattr(blocker, "id", blocker), str(version), frozenset(ignore_bugs or []),
+            tuple(force_block_streams or []))
+        if key not in self.__resolved_cache:
+            self.__resolved_cache[key] = self._resolve_blocker(
+                blocker, version, ignore_bugs, force_block_streams)
+        return self.__resolved_cache[key]
+
+    def _resolve_blocker(self, blocker, version, ignore_bugs=None, force_block_streams=None):
         # ignore_bugs is mutable but is not mutated here! Same force_block_streams
         force_block_streams = force_block_streams or []
         ignore_bugs = set([]) if not ignore_bugs else ignore_bugs
@@ -143,8 +250,6 @@ class Bugzilla(object):
             bug = blocker
         else:
             bug = self.get_bug(blocker)
-        if version is None:
-            version = current_version()
         if version == LATEST:
             version = bug.product.latest_version
         is_upstream = version == bug.product.latest_version
@@ -283,6 +388,8 @@ class BugWrapper(object):
     def copies(self):
         """Returns list of copies of this bug."""
         result = []
+        # One request for all the blocked bugs instead of one per bug
+        self._bugzilla.get_bugs(self._bug.blocks)
         for bug_id in self._bug.blocks:
             bug = self._bugzilla.get_bug(bug_id)
             if bug.copy_of == self._bug.id:
@@ -6,12 +6,11 @@
 
 from cached_property import cached_property
 from contextlib import contextmanager
-from collections import Iterable
+from collections import Iterable, defaultdict
 from datetime import datetime
 from numbers import Number
 from sqlalchemy.sql.expression import func
-from time import sleep
-from threading import Thread, Event as ThreadEvent
+from threading import Lock, Thread, Event as ThreadEvent
 
 from cfme.utils.log import create_sublogger
 
@@ -291,13 +290,29 @@ class EventListener(Thread):
     """
      accepts "expected" events, listens to db events and compares showed up events with expected
      events. Runs callback function if expected events have it.
+
+     New events are fetched in id order past the last processed id, which only touches the
+     primary key index. When no events come, the polling interval backs off from
+     ``MIN_POLL_INTERVAL`` to ``MAX_POLL_INTERVAL`` and it drops back as soon as events arrive.
+     Expected events are indexed by their ``event_type`` and ``target_type``, so each new event
+     is only compared to the expected events it can possibly match.
     """
+    #: polling interval bounds, in seconds
+    MIN_POLL_INTERVAL = 0.2
+    MAX_POLL_INTERVAL = 3.0
+    #: how many events are fetched at most by one query
+    PORTION_SIZE = 500
+    #: attributes the expected events are indexed by
+    INDEXED_ATTRS = ('event_type', 'target_type')
+
     def __init__(self, appliance):
         super(EventListener, self).__init__()
         self._appliance = appliance
         self._tool = EventTool(self._appliance)
 
         self._events_to_listen = []
+        self._index = None
+        self._index_lock = Lock()
         # last_id is used to ignore already arrived messages the database
         # When database is "cleared" the id of the last event is placed here. That is then used
         # in queries to prevent events of this id and earlier to get in.
@@ -310,7 +325,7 @@ class EventListener(Thread):
         else:
             try:
                 self._last_processed_id = self._tool.query(
-                    func.max(self._tool.event_streams.id)).one()
+                    func.max(self._tool.event_streams.id)).scalar()
             except IndexError:
                 # No events yet, so do nothing
                 pass
@@ -363,15 +378,43 @@ class EventListener(Thread):
             for evt in evts:
                 if isinstance(evt, Event):
                     logger.info("event {} is added to listening queue".format(evt))
-                    self._events_to_listen.append({'event': evt,
-                                                   'callback': callback,
-                                                   'matched_events': [],
-                                                   'first_event': first_event})
+                    with self._index_lock:
+                        self._events_to_listen.append({'event': evt,
+                                                       'callback': callback,
+                                                       'matched_events': [],
+                                                       'first_event': first_event})
+                        self._index = None
                 else:
                     raise ValueError("one of events doesn't belong to Event class")
         else:
             raise ValueError('incorrect is passed')
 
+    def _index_key(self, exp_event):
+        """Values of the indexed attributes an expected event requires, None where it doesn't"""
+        key = []
+        for name in self.INDEXED_ATTRS:
+            attr = exp_event['event'].event_attrs.get(name)
+            if attr is None or attr.value is None or attr.cmp_func is not None:
+                key.append(None)
+            else:
+                key.append(attr.value)
+        return tuple(key)
+
+    def _candidates(self, raw_event):
+        """Expected events which can match the raw event, judging by the indexed attributes"""
+        with self._index_lock:
+            if self._index is None:
+                self._index = defaultdict(list)
+                for exp_event in self._events_to_listen:
+                    self._index[self._index_key(exp_event)].append(exp_event)
+            index = self._index
+        event_type, target_type = [getattr(raw_event, name) for name in self.INDEXED_ATTRS]
+        candidates = []
+        for key in ((event_type, target_type), (event_type, None), (None, target_type),
+                    (None, None)):
+            candidates.extend(index.get(key, []))
+        return candidates
+
     def start(self):
         logger.info('Event Listener has been started')
         self.set_last_record()
@@ -394,23 +437,28 @@ class EventListener(Thread):
         processes all new db events and compares them with expected events.
         processed events are ignored next time
         """
+        poll_interval = self.MIN_POLL_INTERVAL
         while not self._stop_event.is_set():
             events = self.get_next_portion()
             if len(events) == 0:
-                sleep(0.2)
+                self._stop_event.wait(poll_interval)
+                poll_interval = min(poll_interval * 2, self.MAX_POLL_INTERVAL)
                 continue
-            for got_event in events:
-                logger.debug("processing event id {}".format(got_event.id))
-                got_event = Event(event_tool=self._tool).build_from_raw_event(got_event)
-                for exp_event in self._events_to_listen:
-                    if exp_event['first_event'] and len(exp_event['matched_events']) > 0:
-                        continue
-
-                    if exp_event['event'].matches(got_event):
-                        if exp_event['callback']:
-                            exp_event['callback'](exp_event=exp_event['event'], got_event=got_event)
-                        exp_event['matched_events'].append(got_event)
-                self.set_last_record(got_event)
+            poll_interval = self.MIN_POLL_INTERVAL
+            for raw_event in events:
+                logger.debug("processing event id {}".format(raw_event.id))
+                candidates = [
+                    exp_event for exp_event in self._candidates(raw_event)
+                    if not (exp_event['first_event'] and exp_event['matched_events'])]
+                if candidates:
+                    got_event = Event(event_tool=self._tool).build_from_raw_event(raw_event)
+                    for exp_event in candidates:
+                        if exp_event['event'].matches(got_event):
+                            if exp_event['callback']:
+                                exp_event['callback'](exp_event=exp_event['event'],
+                                                      got_event=got_event)
+                            exp_event['matched_events'].append(got_event)
+                self._last_processed_id = raw_event.id
 
                 if self._stop_event.is_set():
                     break
@@ -429,13 +477,16 @@ class EventListener(Thread):
             event['matched_events'] = []
 
     def reset_events(self):
-        self._events_to_listen = []
+        with self._index_lock:
+            self._events_to_listen = []
+            self._index = None
 
     def get_next_portion(self):
         logger.debug("obtaining next portion of events")
-        return self._tool.query(self._tool.event_streams)\
-            .filter(self._tool.event_streams.id > self._last_processed_id)\
-            .order_by(self._tool.event_streams.id).yield_per(100).all()
+        query = self._tool.query(self._tool.event_streams)
+        if self._last_processed_id is not None:
+            query = query.filter(self._tool.event_streams.id > self._last_processed_id)
+        return query.order_by(self._tool.event_streams.id).limit(self.PORTION_SIZE).all()
 
     def check_expected_events(self):
         return all([len(event['matched_events']) for event in self.got_events])
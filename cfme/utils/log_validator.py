@@ -4,6 +4,18 @@ import pytest
 from ssh import SSHTail
 from cfme.utils.log import logger
 
+# numbered and named backreferences, they would refer to other groups in a combined regex
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+class AnyMatch(object):
+    """Matches where any of the compiled regexes would ``match``, trying them one by one"""
+    def __init__(self, regexes):
+        self.regexes = regexes
+
+    def match(self, line):
+        return any(regex.match(line) for regex in self.regexes)
+
 
 class LogValidator(object):
     """
@@ -46,17 +58,55 @@ class LogValidator(object):
         self._remote_file_tail = SSHTail(remote_filename, **kwargs)
         self.matches = {}
 
+    @staticmethod
+    def _combine(patterns):
+        """Compile the patterns into a matcher for lines where any of them would ``re.match``
+
+        The patterns are joined into one regex when that is equivalent. Inline flags would apply
+        to the whole joined regex and backreferences to the wrong groups, so patterns using them
+        are checked one by one instead.
+        """
+        if not patterns:
+            return None
+        regexes = [re.compile(pattern) for pattern in patterns]
+        if not any(regex.flags & ~re.UNICODE or BACKREFERENCE.search(regex.pattern)
+                   for regex in regexes):
+            try:
+                return re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))
+            except re.error:
+                # e.g. the same group name used in more patterns
+                pass
+        return AnyMatch(regexes)
+
     def fix_before_start(self):
         self._remote_file_tail.set_initial_file_end()
 
     def validate_logs(self):
+        # Most lines match none of the patterns, so they are sorted out with a single combined
+        # regex; the individual patterns are only checked for lines that matched some of them
+        skip_re = self._combine(self.skip_patterns)
+        failure_re = self._combine(self.failure_patterns)
+        match_re = self._combine(self._unmatched_patterns())
+        any_re = self._combine(
+            self.skip_patterns + self.failure_patterns + self._unmatched_patterns())
         for line in self._remote_file_tail:
-            if self._check_skip_logs(line):
+            if any_re is None or not any_re.match(line):
+                continue
+            if skip_re is not None and self._check_skip_logs(line):
                 continue
-            self._check_fail_logs(line)
-            self._check_match_logs(line)
+            if failure_re is not None and failure_re.match(line):
+                self._check_fail_logs(line)
+            if match_re is not None and match_re.match(line):
+                self._check_match_logs(line)
+                # patterns which matched once don't need to be looked for anymore
+                match_re = self._combine(self._unmatched_patterns())
+                any_re = self._combine(
+                    self.skip_patterns + self.failure_patterns + self._unmatched_patterns())
         self._verify_match_logs()
 
+    def _unmatched_patterns(self):
+        return [pattern for pattern in self.matched_patterns if pattern not in self.matches]
+
     def _check_skip_logs(self, line):
         for pattern in self.skip_patterns:
             if re.match(pattern, line):
@@ -71,7 +121,7 @@ class LogValidator(object):
                 pytest.fail('Failure pattern {} was matched on line {}'.format(pattern, line))
 
     def _check_match_logs(self, line):
-        for pattern in self.matched_patterns:
+        for pattern in self._unmatched_patterns():
             if re.match(pattern, line):
                 logger.info('Expected pattern {} was matched on line {}'.format(pattern, line))
                 self.matches[pattern] = True
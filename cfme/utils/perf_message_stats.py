@@ -11,6 +11,8 @@ import dateutil.parser as du_parser
 from datetime import timedelta
 from time import time
 import csv
+import mmap
+import multiprocessing
 import numpy
 import os
 import pygal
@@ -59,84 +61,152 @@ miq_top = re.compile(r'([0-9]+)\s+[0-9]+\s+[A-Za-z0-9]+\s+[0-9]+\s+[0-9\-]+\s+([
     r'([0-9\.mg]+)\s+([0-9\.mg]+)\s+[SRDZ]\s+([0-9\.]+)\s+([0-9\.]+)')
 
 
-def evm_to_messages(evm_file, filters):
+# Kinds of message events collected from evm.log chunks, replayed in file order by the merge
+MSG_PUT, MSG_GET, MSG_DELIVERED = range(3)
+
+# Chunks are parsed in separate processes, each chunk is about this many bytes of evm.log
+EVM_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def evm_chunks(evm_file, chunk_size=EVM_CHUNK_SIZE):
+    """Split evm_file into (start, end) byte ranges of about chunk_size, on line boundaries"""
+    size = os.path.getsize(evm_file)
+    if not size:
+        return []
+    bounds = [0]
+    with open(evm_file, 'rb') as evmlogfile:
+        evm_map = mmap.mmap(evmlogfile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = chunk_size
+            while pos < size:
+                newline = evm_map.find(b'\n', pos)
+                if newline == -1:
+                    break
+                bounds.append(newline + 1)
+                pos = newline + 1 + chunk_size
+        finally:
+            evm_map.close()
+    if bounds[-1] < size:
+        bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+
+def parse_evm_chunk(args):
+    """Parses a chunk of evm.log into message events
+
+    Only lines mentioning a queue message are run through the regular expressions. Messages are not
+    tracked here, a get or delivered line can belong to a message put in an earlier chunk, so the
+    events are returned in file order and matched up by :py:func:`evm_to_messages`.
+
+    Returns:
+        A ``(first_stamp, line_count, events)`` tuple, ``first_stamp`` is ``None`` if the chunk has
+        no MIQ message lines at all
+    """
+    evm_file, start, end = args
+    first_stamp = None
+    line_count = 0
+    events = []
+    with open(evm_file, 'rb') as evmlogfile:
+        evm_map = mmap.mmap(evmlogfile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            evm_map.seek(start)
+            while evm_map.tell() < end:
+                evm_log_line = evm_map.readline()
+                line_count += 1
+                # MiqQueue messages are the only lines of interest once the first stamp is known
+                if first_stamp is not None and 'MIQ(MiqQueue.' not in evm_log_line:
+                    continue
+                evm_log_line = evm_log_line.strip()
+                miqmsg_result = miqmsg.search(evm_log_line)
+                if not miqmsg_result:
+                    continue
+                if first_stamp is None:
+                    first_stamp, pid = get_msg_timestamp_pid(evm_log_line)
+
+                msg_type = miqmsg_result.group(1)
+                if msg_type == 'MiqQueue.put':
+                    ts, pid = get_msg_timestamp_pid(evm_log_line)
+                    events.append((MSG_PUT, line_count, get_msg_id(evm_log_line), ts, pid,
+                        get_msg_cmd(evm_log_line), get_msg_args(evm_log_line)))
+                elif msg_type == 'MiqQueue.get_via_drb':
+                    ts, pid = get_msg_timestamp_pid(evm_log_line)
+                    events.append((MSG_GET, line_count, get_msg_id(evm_log_line), ts, pid,
+                        get_msg_deq(evm_log_line), None))
+                elif msg_type == 'MiqQueue.delivered':
+                    ts, pid = get_msg_timestamp_pid(evm_log_line)
+                    events.append((MSG_DELIVERED, line_count, get_msg_id(evm_log_line), ts, pid,
+                        get_msg_del(evm_log_line), None))
+        finally:
+            evm_map.close()
+    return first_stamp, line_count, events
+
+
+def evm_to_messages(evm_file, filters, processes=None, chunk_size=EVM_CHUNK_SIZE):
     test_start = ''
     test_end = ''
     line_count = 0
     messages = {}
     msg_cmds = {}
 
-    runningtime = time()
-    evmlogfile = open(evm_file, 'r')
-    evm_log_line = evmlogfile.readline()
-    while evm_log_line:
-        line_count += 1
-        evm_log_line = evm_log_line.strip()
-
-        miqmsg_result = miqmsg.search(evm_log_line)
-        if miqmsg_result:
-
+    chunks = [(evm_file, start, end) for start, end in evm_chunks(evm_file, chunk_size)]
+    processes = min(processes or multiprocessing.cpu_count(), len(chunks))
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        parsed_chunks = pool.imap(parse_evm_chunk, chunks) if pool else map(parse_evm_chunk,
+            chunks)
+        runningtime = time()
+        # Chunks come back in file order, replaying their events keeps the sequential semantics
+        for first_stamp, chunk_lines, events in parsed_chunks:
             # Obtains the first timestamp in the log file
-            if test_start == '':
-                ts, pid = get_msg_timestamp_pid(evm_log_line)
-                test_start = ts
+            if test_start == '' and first_stamp is not None:
+                test_start = first_stamp
 
-            # A message was first put on the queue, this starts its queuing time
-            if (miqmsg_result.group(1) == 'MiqQueue.put'):
+            for msg_event, chunk_line, msg_id, ts, pid, value, msg_args in events:
+                if not msg_id:
+                    logger.error('Could not obtain message id, line #: %s',
+                        line_count + chunk_line)
 
-                msg_cmd = get_msg_cmd(evm_log_line)
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
+                # A message was first put on the queue, this starts its queuing time
+                elif msg_event == MSG_PUT:
                     test_end = ts
-                    messages[msg_id] = MiqMsgStat()
-                    messages[msg_id].msg_id = msg_id
-                    messages[msg_id].msg_id = '\'' + msg_id + '\''
-                    messages[msg_id].msg_cmd = msg_cmd
-                    messages[msg_id].pid_put = pid
-                    messages[msg_id].puttime = ts
-                    msg_args = get_msg_args(evm_log_line)
+                    msg = messages[msg_id] = MiqMsgStat()
+                    msg.msg_id = '\'' + msg_id + '\''
+                    msg.msg_cmd = value
+                    msg.pid_put = pid
+                    msg.puttime = ts
                     if msg_args is False:
-                        logger.debug('Could not obtain message args line #: %s', line_count)
+                        logger.debug('Could not obtain message args line #: %s',
+                            line_count + chunk_line)
                     else:
-                        messages[msg_id].msg_args = msg_args
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
+                        msg.msg_args = msg_args
 
-            elif (miqmsg_result.group(1) == 'MiqQueue.get_via_drb'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
+                elif msg_event == MSG_GET:
                     if msg_id in messages:
-                        ts, pid = get_msg_timestamp_pid(evm_log_line)
                         test_end = ts
-                        messages[msg_id].pid_get = pid
-                        messages[msg_id].gettime = ts
-                        messages[msg_id].deq_time = get_msg_deq(evm_log_line)
+                        msg = messages[msg_id]
+                        msg.pid_get = pid
+                        msg.gettime = ts
+                        msg.deq_time = value
                     else:
                         logger.error('Message ID not in dictionary: %s', msg_id)
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
 
-            elif (miqmsg_result.group(1) == 'MiqQueue.delivered'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
+                elif msg_event == MSG_DELIVERED:
                     test_end = ts
                     if msg_id in messages:
-                        messages[msg_id].del_time = get_msg_del(evm_log_line)
-                        messages[msg_id].total_time = messages[msg_id].deq_time + \
-                            messages[msg_id].del_time
+                        msg = messages[msg_id]
+                        msg.del_time = value
+                        msg.total_time = msg.deq_time + msg.del_time
                     else:
                         logger.error('Message ID not in dictionary: %s', msg_id)
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
 
-        if (line_count % 100000) == 0:
+            line_count += chunk_lines
             timediff = time() - runningtime
             runningtime = time()
-            logger.info('Count {} : Parsed 100000 lines in %s', line_count, timediff)
-
-        evm_log_line = evmlogfile.readline()
+            logger.info('Count %s : Parsed %s lines in %s', line_count, chunk_lines, timediff)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
 
     # I tried to avoid two loops but this reduced the complexity of filtering on messages.
     # By filtering over messages, we can better display what is occuring under the covers, as a
@@ -1029,10 +1099,12 @@ def perf_process_evm(evm_file, top_file):
 
 
 class MiqMsgStat(object):
+    # One of these is kept per message id of a whole evm.log, slots keep them small
+    __slots__ = ('msg_id', 'msg_cmd', 'msg_args', 'pid_put', 'pid_get', 'puttime', 'gettime',
+        'deq_time', 'del_time', 'total_time')
+    headers = list(__slots__)
 
     def __init__(self):
-        self.headers = ['msg_id', 'msg_cmd', 'msg_args', 'pid_put', 'pid_get', 'puttime', 'gettime',
-            'deq_time', 'del_time', 'total_time']
         self.msg_id = ''
         self.msg_cmd = ''
         self.msg_args = ''
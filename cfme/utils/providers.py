@@ -22,6 +22,8 @@ from cfme.utils.log import logger
 providers_data = conf.cfme_data.get("management_systems", {})
 # Dict of active provider filters {name: ProviderFilter}
 global_filters = {}
+# Dict of provider registries {id(appliance): ProviderRegistry}
+_registries = {}
 
 
 def load_setuptools_entrypoints():
@@ -59,6 +61,15 @@ class ProviderFilter(object):
                                         ('!=', operator.ne),
                                         ('>', operator.gt),
                                         ('<', operator.lt)])
+    # (attribute, subfilter method) pairs; a subfilter only depends on its attribute
+    _subfilters = (
+        ('keys', '_filter_keys'),
+        ('classes', '_filter_classes'),
+        ('required_fields', '_filter_required_fields'),
+        ('required_tags', '_filter_required_tags'),
+        ('required_flags', '_filter_required_flags'),
+        ('restrict_version', '_filter_restricted_version'),
+    )
 
     def __init__(self, keys=None, classes=None, required_fields=None, required_tags=None,
                  required_flags=None, restrict_version=False, inverted=False, conjunctive=True):
@@ -222,6 +233,132 @@ class ProviderFilter(object):
     def copy(self):
         return copy(self)
 
+    @property
+    def signature(self):
+        """ Hashable description of this filter, ``None`` if it has unhashable requirements """
+        signature = (tuple(_freeze(getattr(self, attr)) for attr, _ in self._subfilters) +
+                     (self.inverted, self.conjunctive))
+        try:
+            hash(signature)
+        except TypeError:
+            return None
+        return signature
+
+
+def _freeze(value):
+    """ Turns (nested) lists, tuples, sets and dicts from filters and yamls into tuples """
+    if isinstance(value, Mapping):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class ProviderRegistry(object):
+    """ Cached provider filter results of one appliance
+
+    Subfilter results are kept as bitsets over the providers, indexed by the subfilter and its
+    requirements (classes, tags, flags, version restriction...), so a filter is evaluated against
+    all providers only the first time its requirements are seen.
+
+    The crud objects the filters are evaluated on are built once and never handed out;
+    :py:meth:`list` builds new ones for the matching providers.
+
+    Args:
+        appliance: :py:class:`utils.appliance.IPAppliance` passed to the crud objects
+    """
+    def __init__(self, appliance):
+        self.appliance = appliance
+        self.keys = list(providers_data)
+        self.providers = [get_crud(prov_key, appliance=appliance) for prov_key in self.keys]
+        self.all_bits = (1 << len(self.providers)) - 1
+        self._subfilter_bits = {}
+        self._filter_bits = {}
+
+    @staticmethod
+    def _version_key(prov_filter):
+        """ Part of the cache keys for results which depend on the appliance version """
+        if not prov_filter.restrict_version:
+            return ()
+        try:
+            return (str(version.current_version()), )
+        except Exception:
+            # the version restriction lets everything pass then, but it may work later
+            return (None, )
+
+    def _subfilter(self, prov_filter, attr, method):
+        """ Bitsets of providers the subfilter passes and providers it does not apply to """
+        key = (method, _freeze(getattr(prov_filter, attr)))
+        if method == '_filter_restricted_version':
+            key += self._version_key(prov_filter)
+        try:
+            return self._subfilter_bits[key]
+        except TypeError:
+            key = None
+        except KeyError:
+            pass
+        passed_bits = not_applied_bits = 0
+        subfilter = getattr(prov_filter, method)
+        for index, provider in enumerate(self.providers):
+            result = subfilter(provider)
+            if result is None:
+                not_applied_bits |= 1 << index
+            elif result:
+                passed_bits |= 1 << index
+        if key is not None:
+            self._subfilter_bits[key] = passed_bits, not_applied_bits
+        return passed_bits, not_applied_bits
+
+    def filter_bits(self, prov_filter):
+        """ Bitset of the providers which pass the filter, same as calling it on each of them """
+        signature = prov_filter.signature
+        if signature is not None:
+            signature += self._version_key(prov_filter)
+        if signature is not None and signature in self._filter_bits:
+            return self._filter_bits[signature]
+        if prov_filter.conjunctive:
+            bits = self.all_bits
+            for attr, method in prov_filter._subfilters:
+                passed_bits, not_applied_bits = self._subfilter(prov_filter, attr, method)
+                bits &= passed_bits | not_applied_bits
+        else:
+            bits = 0
+            for attr, method in prov_filter._subfilters:
+                bits |= self._subfilter(prov_filter, attr, method)[0]
+        if prov_filter.inverted:
+            bits = self.all_bits & ~bits
+        if signature is not None:
+            self._filter_bits[signature] = bits
+        return bits
+
+    def list(self, filters):
+        """ New crud objects of the providers that pass all the filters """
+        bits = self.all_bits
+        for prov_filter in filters:
+            if not bits:
+                break
+            bits &= self.filter_bits(prov_filter)
+        # new objects, so changes done by one test (endpoints included) don't leak to the others
+        return [get_crud(prov_key, appliance=self.appliance)
+                for index, prov_key in enumerate(self.keys) if bits & (1 << index)]
+
+
+def get_provider_registry(appliance=None):
+    """ Returns the :py:class:`ProviderRegistry` of an appliance, the current one by default """
+    if appliance is None:
+        from cfme.utils.appliance import get_or_create_current_appliance
+        appliance = get_or_create_current_appliance()
+    try:
+        registry = _registries[id(appliance)]
+    except KeyError:
+        registry = _registries[id(appliance)] = ProviderRegistry(appliance)
+    return registry
+
+
+def clear_provider_registries():
+    """ Drops all cached provider crud objects and filter results """
+    _registries.clear()
+
 
 # Only providers without the 'disabled' tag
 global_filters['enabled_only'] = ProviderFilter(required_tags=['disabled'], inverted=True)
@@ -249,10 +386,7 @@ def list_providers(filters=None, use_global_filters=True, appliance=None):
     filters = filters or []
     if use_global_filters:
         filters = filters + global_filters.values()
-    providers = [get_crud(prov_key, appliance=appliance) for prov_key in providers_data]
-    for prov_filter in filters:
-        providers = filter(prov_filter, providers)
-    return providers
+    return get_provider_registry(appliance).list(filters)
 
 
 def list_providers_by_class(prov_class, use_global_filters=True, appliance=None):
@@ -3,10 +3,15 @@
 
 from collections import namedtuple
 
+from manageiq_client.filters import Q
+
 from cfme.exceptions import OptionNotAvailable
 from cfme.utils import error
 from cfme.utils.wait import wait_for
 
+# How many values are looked up with one filtered query
+FILTER_CHUNK = 50
+
 
 def assert_response(
         rest_obj, success=None, http_status=None, results_num=None, task_wait=600):
@@ -80,8 +85,36 @@ def get_vms_in_service(service):
     return [rest_api.get_entity('vms', vm['id']) for vm in service.vms.all]
 
 
+def find_resources(collection, attr, values):
+    """Finds resources whose ``attr`` matches any of the ``values``.
+
+    All the values are looked up in one filtered query (per ``FILTER_CHUNK`` values) instead of
+    a query per value. Values may contain the ``%`` wildcard.
+
+    Returns: list of raw resource dicts with ``id`` and ``attr``
+    """
+    values = list(values)
+    found = []
+    for i in range(0, len(values), FILTER_CHUNK):
+        query = None
+        for value in values[i:i + FILTER_CHUNK]:
+            value_q = Q(attr, '=', value)
+            query = value_q if query is None else query | value_q
+        response = collection._api.get(
+            collection._href, expand='resources', attributes=attr,
+            **{'filter[]': query.as_filters})
+        found.extend(response['resources'])
+    return found
+
+
+def _existing_ids(collection, ids):
+    found = find_resources(collection, 'id', [int(resource_id) for resource_id in ids])
+    # the filter may be ignored (e.g. on subcollections), only the ids asked about count
+    return {str(resource['id']) for resource in found} & set(map(str, ids))
+
+
 def create_resource(rest_api, col_name, col_data, col_action='create', substr_search=False):
-    """Creates new resource in collection."""
+    """Creates new resources in collection with one request and waits for all of them."""
     collection = getattr(rest_api.collections, col_name)
     try:
         action = getattr(collection.action, col_action)
@@ -89,20 +122,32 @@ def create_resource(rest_api, col_name, col_data, col_action='create', substr_se
         raise OptionNotAvailable(
             "Action `{}` for {} is not implemented in this version".format(col_action, col_name))
 
-    entities = action(*col_data)
-    action_response = rest_api.response
-    search_str = '%{}%' if substr_search else '{}'
+    expected = {}
     for entity in col_data:
         if entity.get('name'):
-            wait_for(lambda: collection.find_by(
-                name=search_str.format(entity.get('name'))) or False, num_sec=180, delay=10)
+            expected.setdefault('name', []).append(entity['name'])
         elif entity.get('description'):
-            wait_for(lambda: collection.find_by(
-                description=search_str.format(entity.get('description'))) or False,
-                num_sec=180, delay=10)
+            expected.setdefault('description', []).append(entity['description'])
         else:
             raise NotImplementedError
 
+    def _all_created():
+        for attr, values in expected.items():
+            search_str = '%{}%' if substr_search else '{}'
+            found = [resource.get(attr) or '' for resource in find_resources(
+                collection, attr, [search_str.format(value) for value in values])]
+            for value in values:
+                if substr_search:
+                    if not any(value in found_value for found_value in found):
+                        return False
+                elif value not in found:
+                    return False
+        return True
+
+    entities = action(*col_data)
+    action_response = rest_api.response
+    wait_for(_all_created, num_sec=180, delay=10, message='{} created'.format(col_name))
+
     # make sure action response is preserved
     rest_api.response = action_response
     return entities
@@ -115,11 +160,17 @@ def delete_resources_from_collection(
         if check_response:
             assert_response(collection._api, *args, **kwargs)
 
+    # ids are read before the resources are gone
+    ids = [resource.id for resource in resources]
     collection.action.delete(*resources)
     _assert_response()
 
-    for resource in resources:
-        resource.wait_not_exists(num_sec=num_sec, delay=delay)
+    wait_for(
+        lambda: not _existing_ids(collection, ids),
+        num_sec=num_sec,
+        delay=delay,
+        message='{} deleted'.format(collection.name),
+    )
 
     current_version = collection._api.server_info.get('version')
     if not_found or current_version < '5.9':
@@ -131,6 +182,15 @@ def delete_resources_from_collection(
         _assert_response(success=False)
 
 
+def delete_existing_resources(collection, resources):
+    """Deletes those of the resources that still exist, with one query and one request."""
+    existing_ids = _existing_ids(collection, [resource.id for resource in resources])
+    to_delete = [resource for resource in resources if str(resource.id) in existing_ids]
+    if to_delete:
+        collection.action.delete(*to_delete)
+    return to_delete
+
+
 def query_resource_attributes(resource, soft_assert=None):
     """Checks that all available attributes/subcollections are really accessible."""
     collection = resource.collection
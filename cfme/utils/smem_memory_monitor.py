@@ -1,7 +1,10 @@
 """Monitor Memory on a CFME/Miq appliance and builds report&graphs displaying usage per process."""
 import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
+import numpy
 import os
+import shutil
+import tempfile
 import time
 import traceback
 import yaml
@@ -137,6 +140,118 @@ test_ts = time.strftime('%Y%m%d%H%M%S')
 # 10s sample interval (occasionally sampling can take almost 4s on an appliance doing a lot of work)
 SAMPLE_INTERVAL = 10
 
+APPLIANCE_MEASUREMENTS = ('total', 'free', 'used', 'buffers', 'cached', 'slab', 'swap_total',
+    'swap_free')
+PROCESS_MEASUREMENTS = ('rss', 'pss', 'uss', 'vss', 'swap')
+
+# Samples kept in memory per series (a day of sampling), longer series spill to a memory-mapped file
+MAX_IN_MEMORY_SAMPLES = 24 * 60 * 60 // SAMPLE_INTERVAL
+
+
+class MemorySamples(object):
+    """Time series of memory measurements stored in columns of numpy arrays
+
+    Sample times and each measurement are kept in their own preallocated array, which doubles in
+    size as it fills up. Once a series outgrows ``MAX_IN_MEMORY_SAMPLES`` its columns are moved to
+    memory-mapped files in a temporary directory, so multi-day workloads don't keep every sample
+    in memory. Call :py:meth:`close` to remove those files when the report has been created.
+    """
+
+    def __init__(self, measurements, capacity=64):
+        self.measurements = tuple(measurements)
+        self._index = {name: i for i, name in enumerate(self.measurements)}
+        self._count = 0
+        self._spill_dir = None
+        self._times, self._values = self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        shapes = ((capacity,), (len(self.measurements), capacity))
+        if capacity <= MAX_IN_MEMORY_SAMPLES:
+            return numpy.empty(shapes[0], dtype='M8[us]'), numpy.empty(shapes[1], dtype='f8')
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='smem-')
+        return (numpy.memmap(os.path.join(self._spill_dir, 'times-{}'.format(capacity)),
+                    dtype='M8[us]', mode='w+', shape=shapes[0]),
+                numpy.memmap(os.path.join(self._spill_dir, 'values-{}'.format(capacity)),
+                    dtype='f8', mode='w+', shape=shapes[1]))
+
+    def _grow(self):
+        old_times, old_values = self._times, self._values
+        self._times, self._values = self._allocate(len(old_times) * 2)
+        self._times[:self._count] = old_times[:self._count]
+        self._values[:, :self._count] = old_values[:, :self._count]
+        for column in (old_times, old_values):
+            if isinstance(column, numpy.memmap):
+                os.remove(column.filename)
+
+    def append(self, timestamp, values):
+        """Add a sample, ``values`` maps each measurement name to its value"""
+        if self._count == len(self._times):
+            self._grow()
+        self._times[self._count] = timestamp
+        for name, i in self._index.items():
+            self._values[i, self._count] = values[name]
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def _position(self, timestamp):
+        # samples are appended in time order, so the times column is sorted
+        times = self._times[:self._count]
+        timestamp = numpy.datetime64(timestamp, 'us')
+        i = numpy.searchsorted(times, timestamp)
+        if i < self._count and times[i] == timestamp:
+            return i
+        return None
+
+    def __contains__(self, timestamp):
+        return self._position(timestamp) is not None
+
+    def __getitem__(self, measurement):
+        return self._values[self._index[measurement], :self._count]
+
+    @property
+    def dates(self):
+        return self._times[:self._count].tolist()
+
+    @property
+    def start(self):
+        return self._times[0].tolist()
+
+    @property
+    def end(self):
+        return self._times[self._count - 1].tolist()
+
+    def at(self, timestamp, measurement):
+        return float(self._values[self._index[measurement], self._position(timestamp)])
+
+    def first(self, measurement):
+        return float(self[measurement][0])
+
+    def last(self, measurement):
+        return float(self[measurement][-1])
+
+    def maximum(self, measurement):
+        return float(self[measurement].max())
+
+    def summary(self, measurement):
+        """Returns the first, last, maximum and 90th percentile value of a measurement"""
+        values = self[measurement]
+        return (float(values[0]), float(values[-1]), float(values.max()),
+            float(numpy.percentile(values, 90)))
+
+    def rows(self):
+        """Yields ``(timestamp, [values in measurement order])`` for each sample"""
+        for timestamp, values in zip(self.dates, self._values[:, :self._count].T.tolist()):
+            yield timestamp, values
+
+    def close(self):
+        if self._spill_dir is not None:
+            self._times = self._values = None
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
 
 class SmemMemoryMonitor(Thread):
     def __init__(self, ssh_client, scenario_data):
@@ -153,20 +268,10 @@ class SmemMemoryMonitor(Thread):
         if process_pid in memory_by_pid.keys():
             if process_name not in process_results:
                 process_results[process_name] = OrderedDict()
-                process_results[process_name][process_pid] = OrderedDict()
             if process_pid not in process_results[process_name]:
-                process_results[process_name][process_pid] = OrderedDict()
-            process_results[process_name][process_pid][starttime] = {}
-            rss_mem = memory_by_pid[process_pid]['rss']
-            pss_mem = memory_by_pid[process_pid]['pss']
-            uss_mem = memory_by_pid[process_pid]['uss']
-            vss_mem = memory_by_pid[process_pid]['vss']
-            swap_mem = memory_by_pid[process_pid]['swap']
-            process_results[process_name][process_pid][starttime]['rss'] = rss_mem
-            process_results[process_name][process_pid][starttime]['pss'] = pss_mem
-            process_results[process_name][process_pid][starttime]['uss'] = uss_mem
-            process_results[process_name][process_pid][starttime]['vss'] = vss_mem
-            process_results[process_name][process_pid][starttime]['swap'] = swap_mem
+                process_results[process_name][process_pid] = MemorySamples(PROCESS_MEASUREMENTS)
+            process_results[process_name][process_pid].append(starttime,
+                memory_by_pid[process_pid])
             del memory_by_pid[process_pid]
         else:
             logger.warn('Process {} PID, not found: {}'.format(process_name, process_pid))
@@ -177,19 +282,17 @@ class SmemMemoryMonitor(Thread):
         # 5.4 - RHEL 6 / Centos 6
         # Application Memory Used : MemTotal - (MemFree + Buffers + Cached)
         # Available memory could potentially be better metric
-        appliance_results[plottime] = {}
-
         exit_status, meminfo_raw = self.ssh_client.run_command('cat /proc/meminfo')
         if exit_status:
             logger.error('Exit_status nonzero in get_appliance_memory: {}, {}'.format(exit_status,
                 meminfo_raw))
-            del appliance_results[plottime]
         else:
             meminfo_raw = meminfo_raw.replace('kB', '').strip()
             meminfo = OrderedDict((k.strip(), v.strip()) for k, v in
                 (value.strip().split(':') for value in meminfo_raw.split('\n')))
-            appliance_results[plottime]['total'] = float(meminfo['MemTotal']) / 1024
-            appliance_results[plottime]['free'] = float(meminfo['MemFree']) / 1024
+            sample = {}
+            sample['total'] = float(meminfo['MemTotal']) / 1024
+            sample['free'] = float(meminfo['MemFree']) / 1024
             if 'MemAvailable' in meminfo:  # 5.5, RHEL 7/Centos 7
                 self.use_slab = True
                 mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
@@ -197,12 +300,13 @@ class SmemMemoryMonitor(Thread):
             else:  # 5.4, RHEL 6/Centos 6
                 mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
                     meminfo['Buffers']) + float(meminfo['Cached']))) / 1024
-            appliance_results[plottime]['used'] = mem_used
-            appliance_results[plottime]['buffers'] = float(meminfo['Buffers']) / 1024
-            appliance_results[plottime]['cached'] = float(meminfo['Cached']) / 1024
-            appliance_results[plottime]['slab'] = float(meminfo['Slab']) / 1024
-            appliance_results[plottime]['swap_total'] = float(meminfo['SwapTotal']) / 1024
-            appliance_results[plottime]['swap_free'] = float(meminfo['SwapFree']) / 1024
+            sample['used'] = mem_used
+            sample['buffers'] = float(meminfo['Buffers']) / 1024
+            sample['cached'] = float(meminfo['Cached']) / 1024
+            sample['slab'] = float(meminfo['Slab']) / 1024
+            sample['swap_total'] = float(meminfo['SwapTotal']) / 1024
+            sample['swap_free'] = float(meminfo['SwapFree']) / 1024
+            appliance_results.append(plottime, sample)
 
     def get_evm_workers(self):
         exit_status, worker_types = self.ssh_client.run_command(
@@ -274,25 +378,13 @@ class SmemMemoryMonitor(Thread):
         return memory_by_pid
 
     def _real_run(self):
-        """ Result dictionaries:
-        appliance_results[timestamp][measurement] = value
-        appliance_results[timestamp]['total'] = value
-        appliance_results[timestamp]['free'] = value
-        appliance_results[timestamp]['used'] = value
-        appliance_results[timestamp]['buffers'] = value
-        appliance_results[timestamp]['cached'] = value
-        appliance_results[timestamp]['slab'] = value
-        appliance_results[timestamp]['swap_total'] = value
-        appliance_results[timestamp]['swap_free'] = value
+        """ Results (see :py:class:`MemorySamples`):
+        appliance_results[measurement] = array of values, one per sample
         appliance measurements: total/free/used/buffers/cached/slab/swap_total/swap_free
-        process_results[name][pid][timestamp][measurement] = value
-        process_results[name][pid][timestamp]['rss'] = value
-        process_results[name][pid][timestamp]['pss'] = value
-        process_results[name][pid][timestamp]['uss'] = value
-        process_results[name][pid][timestamp]['vss'] = value
-        process_results[name][pid][timestamp]['swap'] = value
+        process_results[name][pid][measurement] = array of values, one per sample
+        process measurements: rss/pss/uss/vss/swap
         """
-        appliance_results = OrderedDict()
+        appliance_results = MemorySamples(APPLIANCE_MEASUREMENTS)
         process_results = OrderedDict()
         install_smem(self.ssh_client)
         self.get_miq_server_id()
@@ -353,8 +445,14 @@ class SmemMemoryMonitor(Thread):
             time.sleep(time_to_sleep)
         logger.info('Monitoring CFME Memory Terminating')
 
-        create_report(self.scenario_data, appliance_results, process_results, self.use_slab,
-            self.grafana_urls)
+        try:
+            create_report(self.scenario_data, appliance_results, process_results, self.use_slab,
+                self.grafana_urls)
+        finally:
+            appliance_results.close()
+            for process_pids in process_results.values():
+                for samples in process_pids.values():
+                    samples.close()
 
     def run(self):
         try:
@@ -434,13 +532,14 @@ def compile_per_process_results(procs_to_compile, process_results, ts_end):
     for process in procs_to_compile:
         if process in process_results:
             for pid in process_results[process]:
-                if ts_end in process_results[process][pid]:
+                samples = process_results[process][pid]
+                if ts_end in samples:
                     alive_pids += 1
-                    total_running_rss += process_results[process][pid][ts_end]['rss']
-                    total_running_pss += process_results[process][pid][ts_end]['pss']
-                    total_running_uss += process_results[process][pid][ts_end]['uss']
-                    total_running_vss += process_results[process][pid][ts_end]['vss']
-                    total_running_swap += process_results[process][pid][ts_end]['swap']
+                    total_running_rss += samples.at(ts_end, 'rss')
+                    total_running_pss += samples.at(ts_end, 'pss')
+                    total_running_uss += samples.at(ts_end, 'uss')
+                    total_running_vss += samples.at(ts_end, 'vss')
+                    total_running_swap += samples.at(ts_end, 'swap')
                 else:
                     recycled_pids += 1
     return alive_pids, recycled_pids, total_running_rss, total_running_pss, total_running_uss, \
@@ -452,24 +551,15 @@ def generate_raw_data_csv(directory, appliance_results, process_results):
     file_name = str(directory.join('appliance.csv'))
     with open(file_name, 'w') as csv_file:
         csv_file.write('TimeStamp,Total,Free,Used,Buffers,Cached,Slab,Swap_Total,Swap_Free\n')
-        for ts in appliance_results:
-            csv_file.write('{},{},{},{},{},{},{},{},{}\n'.format(ts,
-                appliance_results[ts]['total'], appliance_results[ts]['free'],
-                appliance_results[ts]['used'], appliance_results[ts]['buffers'],
-                appliance_results[ts]['cached'], appliance_results[ts]['slab'],
-                appliance_results[ts]['swap_total'], appliance_results[ts]['swap_free']))
+        for ts, values in appliance_results.rows():
+            csv_file.write('{},{},{},{},{},{},{},{},{}\n'.format(ts, *values))
     for process_name in process_results:
         for process_pid in process_results[process_name]:
             file_name = str(directory.join('{}-{}.csv'.format(process_pid, process_name)))
             with open(file_name, 'w') as csv_file:
                 csv_file.write('TimeStamp,RSS,PSS,USS,VSS,SWAP\n')
-                for ts in process_results[process_name][process_pid]:
-                    csv_file.write('{},{},{},{},{},{}\n'.format(ts,
-                        process_results[process_name][process_pid][ts]['rss'],
-                        process_results[process_name][process_pid][ts]['pss'],
-                        process_results[process_name][process_pid][ts]['uss'],
-                        process_results[process_name][process_pid][ts]['vss'],
-                        process_results[process_name][process_pid][ts]['swap']))
+                for ts, values in process_results[process_name][process_pid].rows():
+                    csv_file.write('{},{},{},{},{},{}\n'.format(ts, *values))
     timediff = time.time() - starttime
     logger.info('Generated Raw Data CSVs in: {}'.format(timediff))
 
@@ -479,30 +569,15 @@ def generate_summary_csv(file_name, appliance_results, process_results, provider
     starttime = time.time()
     with open(str(file_name), 'w') as csv_file:
         csv_file.write('Version: {}, Provider(s): {}\n'.format(version_string, provider_names))
-        csv_file.write('Measurement,Start of test,End of test\n')
-        start = appliance_results.keys()[0]
-        end = appliance_results.keys()[-1]
-        csv_file.write('Appliance Total Memory,{},{}\n'.format(
-            round(appliance_results[start]['total'], 2), round(appliance_results[end]['total'], 2)))
-        csv_file.write('Appliance Free Memory,{},{}\n'.format(
-            round(appliance_results[start]['free'], 2), round(appliance_results[end]['free'], 2)))
-        csv_file.write('Appliance Used Memory,{},{}\n'.format(
-            round(appliance_results[start]['used'], 2), round(appliance_results[end]['used'], 2)))
-        csv_file.write('Appliance Buffers,{},{}\n'.format(
-            round(appliance_results[start]['buffers'], 2),
-            round(appliance_results[end]['buffers'], 2)))
-        csv_file.write('Appliance Cached,{},{}\n'.format(
-            round(appliance_results[start]['cached'], 2),
-            round(appliance_results[end]['cached'], 2)))
-        csv_file.write('Appliance Slab,{},{}\n'.format(
-            round(appliance_results[start]['slab'], 2),
-            round(appliance_results[end]['slab'], 2)))
-        csv_file.write('Appliance Total Swap,{},{}\n'.format(
-            round(appliance_results[start]['swap_total'], 2),
-            round(appliance_results[end]['swap_total'], 2)))
-        csv_file.write('Appliance Free Swap,{},{}\n'.format(
-            round(appliance_results[start]['swap_free'], 2),
-            round(appliance_results[end]['swap_free'], 2)))
+        csv_file.write('Measurement,Start of test,End of test,Max,90th Percentile\n')
+        for name, measurement in (('Appliance Total Memory', 'total'),
+                ('Appliance Free Memory', 'free'), ('Appliance Used Memory', 'used'),
+                ('Appliance Buffers', 'buffers'), ('Appliance Cached', 'cached'),
+                ('Appliance Slab', 'slab'), ('Appliance Total Swap', 'swap_total'),
+                ('Appliance Free Swap', 'swap_free')):
+            csv_file.write('{},{}\n'.format(name,
+                ','.join(str(round(value, 2)) for value in appliance_results.summary(
+                    measurement))))
 
         summary_csv_measurement_dump(csv_file, process_results, 'rss')
         summary_csv_measurement_dump(csv_file, process_results, 'pss')
@@ -541,17 +616,14 @@ def generate_summary_html(directory, version_string, appliance_results, process_
         html_file.write(' : <b><a href=\'workload.html\'>Workload Info</a></b>')
         html_file.write(' : <b><a href=\'graphs/\'>Graphs directory</a></b>\n')
         html_file.write(' : <b><a href=\'rawdata/\'>CSVs directory</a></b><br>\n')
-        start = appliance_results.keys()[0]
-        end = appliance_results.keys()[-1]
+        start = appliance_results.start
+        end = appliance_results.end
         timediff = end - start
         total_proc_count = 0
         for proc_name in process_results:
             total_proc_count += len(process_results[proc_name].keys())
-        growth = appliance_results[end]['used'] - appliance_results[start]['used']
-        max_used_memory = 0
-        for ts in appliance_results:
-            if appliance_results[ts]['used'] > max_used_memory:
-                max_used_memory = appliance_results[ts]['used']
+        growth = appliance_results.last('used') - appliance_results.first('used')
+        max_used_memory = max(appliance_results.maximum('used'), 0)
         html_file.write('<table border="1">\n')
         html_file.write('<tr><td>\n')
         # Appliance Wide Results
@@ -573,9 +645,9 @@ def generate_summary_html(directory, version_string, appliance_results, process_
         html_file.write('<td>{}</td>\n'.format(start.replace(microsecond=0)))
         html_file.write('<td>{}</td>\n'.format(end.replace(microsecond=0)))
         html_file.write('<td>{}</td>\n'.format(unicode(timediff).partition('.')[0]))
-        html_file.write('<td>{}</td>\n'.format(round(appliance_results[end]['total'], 2)))
-        html_file.write('<td>{}</td>\n'.format(round(appliance_results[start]['used'], 2)))
-        html_file.write('<td>{}</td>\n'.format(round(appliance_results[end]['used'], 2)))
+        html_file.write('<td>{}</td>\n'.format(round(appliance_results.last('total'), 2)))
+        html_file.write('<td>{}</td>\n'.format(round(appliance_results.first('used'), 2)))
+        html_file.write('<td>{}</td>\n'.format(round(appliance_results.last('used'), 2)))
         html_file.write('<td>{}</td>\n'.format(round(growth, 2)))
         html_file.write('<td>{}</td>\n'.format(round(max_used_memory, 2)))
         html_file.write('<td>{}</td>\n'.format(total_proc_count))
@@ -751,11 +823,8 @@ def generate_summary_html(directory, version_string, appliance_results, process_
         html_file.write('<img src=\'graphs/{}\'>\n'.format(file_name))
         file_name = '{}-appliance_swap.png'.format(version_string)
         # Check for swap usage through out time frame:
-        max_swap_used = 0
-        for ts in appliance_results:
-            swap_used = appliance_results[ts]['swap_total'] - appliance_results[ts]['swap_free']
-            if swap_used > max_swap_used:
-                max_swap_used = swap_used
+        max_swap_used = max(
+            (appliance_results['swap_total'] - appliance_results['swap_free']).max(), 0)
         if max_swap_used < 10:  # Less than 10MiB Max, then hide graph
             html_file.write('<br><a href=\'graphs/{}\'>Swap Graph '.format(file_name))
             html_file.write('(Hidden, max_swap_used < 10 MiB)</a>\n')
@@ -781,8 +850,9 @@ def generate_summary_html(directory, version_string, appliance_results, process_
         for ordered_name in process_order:
             if ordered_name in process_results:
                 for pid in process_results[ordered_name]:
-                    start = process_results[ordered_name][pid].keys()[0]
-                    end = process_results[ordered_name][pid].keys()[-1]
+                    samples = process_results[ordered_name][pid]
+                    start = samples.start
+                    end = samples.end
                     timediff = end - start
                     html_file.write('<tr>\n')
                     if len(process_results[ordered_name]) > 1:
@@ -797,19 +867,13 @@ def generate_summary_html(directory, version_string, appliance_results, process_
                     html_file.write('<td>{}</td>\n'.format(start.replace(microsecond=0)))
                     html_file.write('<td>{}</td>\n'.format(end.replace(microsecond=0)))
                     html_file.write('<td>{}</td>\n'.format(unicode(timediff).partition('.')[0]))
-                    rss_change = process_results[ordered_name][pid][end]['rss'] - \
-                        process_results[ordered_name][pid][start]['rss']
-                    html_file.write('<td>{}</td>\n'.format(
-                        round(process_results[ordered_name][pid][start]['rss'], 2)))
-                    html_file.write('<td>{}</td>\n'.format(
-                        round(process_results[ordered_name][pid][end]['rss'], 2)))
+                    rss_change = samples.last('rss') - samples.first('rss')
+                    html_file.write('<td>{}</td>\n'.format(round(samples.first('rss'), 2)))
+                    html_file.write('<td>{}</td>\n'.format(round(samples.last('rss'), 2)))
                     html_file.write('<td>{}</td>\n'.format(round(rss_change, 2)))
-                    pss_change = process_results[ordered_name][pid][end]['pss'] - \
-                        process_results[ordered_name][pid][start]['pss']
-                    html_file.write('<td>{}</td>\n'.format(
-                        round(process_results[ordered_name][pid][start]['pss'], 2)))
-                    html_file.write('<td>{}</td>\n'.format(
-                        round(process_results[ordered_name][pid][end]['pss'], 2)))
+                    pss_change = samples.last('pss') - samples.first('pss')
+                    html_file.write('<td>{}</td>\n'.format(round(samples.first('pss'), 2)))
+                    html_file.write('<td>{}</td>\n'.format(round(samples.last('pss'), 2)))
                     html_file.write('<td>{}</td>\n'.format(round(pss_change, 2)))
                     html_file.write('<td><a href=\'rawdata/{}-{}.csv\'>csv</a></td>\n'.format(
                         pid, ordered_name))
@@ -994,17 +1058,15 @@ def create_dict(attr_dict):
 def graph_appliance_measurements(graphs_path, ver, appliance_results, use_slab, provider_names):
     starttime = time.time()
 
-    dates = appliance_results.keys()
-    total_memory_list = list(appliance_results[ts]['total'] for ts in appliance_results.keys())
-    free_memory_list = list(appliance_results[ts]['free'] for ts in appliance_results.keys())
-    used_memory_list = list(appliance_results[ts]['used'] for ts in appliance_results.keys())
-    buffers_memory_list = list(
-        appliance_results[ts]['buffers'] for ts in appliance_results.keys())
-    cache_memory_list = list(appliance_results[ts]['cached'] for ts in appliance_results.keys())
-    slab_memory_list = list(appliance_results[ts]['slab'] for ts in appliance_results.keys())
-    swap_total_list = list(appliance_results[ts]['swap_total'] for ts in
-        appliance_results.keys())
-    swap_free_list = list(appliance_results[ts]['swap_free'] for ts in appliance_results.keys())
+    dates = appliance_results.dates
+    total_memory_list = appliance_results['total']
+    free_memory_list = appliance_results['free']
+    used_memory_list = appliance_results['used']
+    buffers_memory_list = appliance_results['buffers']
+    cache_memory_list = appliance_results['cached']
+    slab_memory_list = appliance_results['slab']
+    swap_total_list = appliance_results['swap_total']
+    swap_free_list = appliance_results['swap_free']
 
     # Stack Plot Memory Usage
     file_name = graphs_path.join('{}-appliance_memory.png'.format(ver))
@@ -1076,7 +1138,7 @@ def graph_appliance_measurements(graphs_path, ver, appliance_results, use_slab,
     plt.xlabel('Date / Time')
     plt.ylabel('Swap (MiB)')
 
-    swap_used_list = [t - f for f, t in zip(swap_free_list, swap_total_list)]
+    swap_used_list = swap_total_list - swap_free_list
     y = [swap_used_list, swap_free_list]
     plt.stackplot(dates, *y, baseline='zero')
     ax.annotate(str(round(swap_total_list[0], 2)), xy=(dates[0], swap_total_list[0]),
@@ -1115,12 +1177,11 @@ def graph_all_miq_workers(graph_file_path, process_results, provider_names):
     for process_name in process_results:
         if 'Worker' in process_name or 'Handler' in process_name or 'Catcher' in process_name:
             for process_pid in process_results[process_name]:
-                dates = process_results[process_name][process_pid].keys()
+                samples = process_results[process_name][process_pid]
+                dates = samples.dates
 
-                rss_samples = list(process_results[process_name][process_pid][ts]['rss']
-                        for ts in process_results[process_name][process_pid].keys())
-                vss_samples = list(process_results[process_name][process_pid][ts]['vss']
-                        for ts in process_results[process_name][process_pid].keys())
+                rss_samples = samples['rss']
+                vss_samples = samples['vss']
                 plt.plot(dates, rss_samples, linewidth=1, label='{} {} RSS'.format(process_pid,
                     process_name))
                 plt.plot(dates, vss_samples, linewidth=1, label='{} {} VSS'.format(
@@ -1145,17 +1206,13 @@ def graph_individual_process_measurements(graph_file_path, process_results, prov
 
             file_name = graph_file_path.join('{}-{}.png'.format(process_name, process_pid))
 
-            dates = process_results[process_name][process_pid].keys()
-            rss_samples = list(process_results[process_name][process_pid][ts]['rss']
-                    for ts in process_results[process_name][process_pid].keys())
-            pss_samples = list(process_results[process_name][process_pid][ts]['pss']
-                    for ts in process_results[process_name][process_pid].keys())
-            uss_samples = list(process_results[process_name][process_pid][ts]['uss']
-                    for ts in process_results[process_name][process_pid].keys())
-            vss_samples = list(process_results[process_name][process_pid][ts]['vss']
-                    for ts in process_results[process_name][process_pid].keys())
-            swap_samples = list(process_results[process_name][process_pid][ts]['swap']
-                    for ts in process_results[process_name][process_pid].keys())
+            samples = process_results[process_name][process_pid]
+            dates = samples.dates
+            rss_samples = samples['rss']
+            pss_samples = samples['pss']
+            uss_samples = samples['uss']
+            vss_samples = samples['vss']
+            swap_samples = samples['swap']
 
             fig, ax = plt.subplots()
             plt.title('Provider(s)/Size: {}\nProcess/Worker: {}\nPID: {}'.format(provider_names,
@@ -1168,27 +1225,27 @@ def graph_individual_process_measurements(graph_file_path, process_results, prov
             plt.plot(dates, vss_samples, linewidth=1, label='VSS')
             plt.plot(dates, swap_samples, linewidth=1, label='Swap')
 
-            if rss_samples:
+            if len(rss_samples):
                 ax.annotate(str(round(rss_samples[0], 2)), xy=(dates[0], rss_samples[0]),
                     xytext=(4, 4), textcoords='offset points')
                 ax.annotate(str(round(rss_samples[-1], 2)), xy=(dates[-1], rss_samples[-1]),
                     xytext=(4, -4), textcoords='offset points')
-            if pss_samples:
+            if len(pss_samples):
                 ax.annotate(str(round(pss_samples[0], 2)), xy=(dates[0], pss_samples[0]),
                     xytext=(4, 4), textcoords='offset points')
                 ax.annotate(str(round(pss_samples[-1], 2)), xy=(dates[-1], pss_samples[-1]),
                     xytext=(4, -4), textcoords='offset points')
-            if uss_samples:
+            if len(uss_samples):
                 ax.annotate(str(round(uss_samples[0], 2)), xy=(dates[0], uss_samples[0]),
                     xytext=(4, 4), textcoords='offset points')
                 ax.annotate(str(round(uss_samples[-1], 2)), xy=(dates[-1], uss_samples[-1]),
                     xytext=(4, -4), textcoords='offset points')
-            if vss_samples:
+            if len(vss_samples):
                 ax.annotate(str(round(vss_samples[0], 2)), xy=(dates[0], vss_samples[0]),
                     xytext=(4, 4), textcoords='offset points')
                 ax.annotate(str(round(vss_samples[-1], 2)), xy=(dates[-1], vss_samples[-1]),
                     xytext=(4, -4), textcoords='offset points')
-            if swap_samples:
+            if len(swap_samples):
                 ax.annotate(str(round(swap_samples[0], 2)), xy=(dates[0], swap_samples[0]),
                     xytext=(4, 4), textcoords='offset points')
                 ax.annotate(str(round(swap_samples[-1], 2)), xy=(dates[-1], swap_samples[-1]),
@@ -1225,44 +1282,40 @@ def graph_same_miq_workers(graph_file_path, process_results, provider_names):
             plt.ylabel('Memory (MiB)')
 
             for process_pid in process_results[process_name]:
-                dates = process_results[process_name][process_pid].keys()
-
-                rss_samples = list(process_results[process_name][process_pid][ts]['rss']
-                        for ts in process_results[process_name][process_pid].keys())
-                pss_samples = list(process_results[process_name][process_pid][ts]['pss']
-                        for ts in process_results[process_name][process_pid].keys())
-                uss_samples = list(process_results[process_name][process_pid][ts]['uss']
-                        for ts in process_results[process_name][process_pid].keys())
-                vss_samples = list(process_results[process_name][process_pid][ts]['vss']
-                        for ts in process_results[process_name][process_pid].keys())
-                swap_samples = list(process_results[process_name][process_pid][ts]['swap']
-                        for ts in process_results[process_name][process_pid].keys())
+                samples = process_results[process_name][process_pid]
+                dates = samples.dates
+
+                rss_samples = samples['rss']
+                pss_samples = samples['pss']
+                uss_samples = samples['uss']
+                vss_samples = samples['vss']
+                swap_samples = samples['swap']
                 plt.plot(dates, rss_samples, linewidth=1, label='{} RSS'.format(process_pid))
                 plt.plot(dates, pss_samples, linewidth=1, label='{} PSS'.format(process_pid))
                 plt.plot(dates, uss_samples, linewidth=1, label='{} USS'.format(process_pid))
                 plt.plot(dates, vss_samples, linewidth=1, label='{} VSS'.format(process_pid))
                 plt.plot(dates, swap_samples, linewidth=1, label='{} SWAP'.format(process_pid))
-                if rss_samples:
+                if len(rss_samples):
                     ax.annotate(str(round(rss_samples[0], 2)), xy=(dates[0], rss_samples[0]),
                         xytext=(4, 4), textcoords='offset points')
                     ax.annotate(str(round(rss_samples[-1], 2)), xy=(dates[-1],
                         rss_samples[-1]), xytext=(4, -4), textcoords='offset points')
-                if pss_samples:
+                if len(pss_samples):
                     ax.annotate(str(round(pss_samples[0], 2)), xy=(dates[0],
                         pss_samples[0]), xytext=(4, 4), textcoords='offset points')
                     ax.annotate(str(round(pss_samples[-1], 2)), xy=(dates[-1],
                         pss_samples[-1]), xytext=(4, -4), textcoords='offset points')
-                if uss_samples:
+                if len(uss_samples):
                     ax.annotate(str(round(uss_samples[0], 2)), xy=(dates[0],
                         uss_samples[0]), xytext=(4, 4), textcoords='offset points')
                     ax.annotate(str(round(uss_samples[-1], 2)), xy=(dates[-1],
                         uss_samples[-1]), xytext=(4, -4), textcoords='offset points')
-                if vss_samples:
+                if len(vss_samples):
                     ax.annotate(str(round(vss_samples[0], 2)), xy=(dates[0],
                         vss_samples[0]), xytext=(4, 4), textcoords='offset points')
                     ax.annotate(str(round(vss_samples[-1], 2)), xy=(dates[-1],
                         vss_samples[-1]), xytext=(4, -4), textcoords='offset points')
-                if swap_samples:
+                if len(swap_samples):
                     ax.annotate(str(round(swap_samples[0], 2)), xy=(dates[0],
                         swap_samples[0]), xytext=(4, 4), textcoords='offset points')
                     ax.annotate(str(round(swap_samples[-1], 2)), xy=(dates[-1],
@@ -1284,12 +1337,10 @@ def summary_csv_measurement_dump(csv_file, process_results, measurement):
     csv_file.write('---------------------------------------------\n')
     csv_file.write('Per Process {} Memory Usage\n'.format(measurement.upper()))
     csv_file.write('---------------------------------------------\n')
-    csv_file.write('Process/Worker Type,PID,Start of test,End of test\n')
+    csv_file.write('Process/Worker Type,PID,Start of test,End of test,Max,90th Percentile\n')
     for ordered_name in process_order:
         if ordered_name in process_results:
             for process_pid in sorted(process_results[ordered_name]):
-                start = process_results[ordered_name][process_pid].keys()[0]
-                end = process_results[ordered_name][process_pid].keys()[-1]
-                csv_file.write('{},{},{},{}\n'.format(ordered_name, process_pid,
-                    round(process_results[ordered_name][process_pid][start][measurement], 2),
-                    round(process_results[ordered_name][process_pid][end][measurement], 2)))
+                samples = process_results[ordered_name][process_pid]
+                csv_file.write('{},{},{}\n'.format(ordered_name, process_pid,
+                    ','.join(str(round(value, 2)) for value in samples.summary(measurement))))
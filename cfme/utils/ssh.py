@@ -2,9 +2,14 @@
 import fauxfactory
 import iso8601
 import re
+import select
 import socket
 import sys
-from collections import namedtuple
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from functools import partial
 from os import path as os_path
 from subprocess import check_call
 from urlparse import urlparse
@@ -15,7 +20,7 @@ import paramiko
 from scp import SCPClient
 import diaper
 
-from cfme.utils import conf, ports, version
+from cfme.utils import at_exit, conf, ports, version
 from cfme.utils.log import logger
 from cfme.utils.net import net_check
 from cfme.utils.version import Version
@@ -29,6 +34,12 @@ from cfme.utils.timeutil import parsetime
 # in seconds (float)
 RUNCMD_TIMEOUT = 1200.0
 
+# Limits of the shared transport pools, keep the channel count under sshd's MaxSessions (10)
+POOL_MAX_TRANSPORTS = 2
+POOL_MAX_CHANNELS = 8
+# Keepalive interval of pooled transports, idle transports are health checked after this, too
+POOL_KEEPALIVE = 30
+
 
 class SSHResult(namedtuple("SSHResult", ["rc", "output"])):
     """Allows rich comparison for more convenient testing.
@@ -93,6 +104,278 @@ _ssh_pubkey_file = project_path.join('.generated_ssh_key.pub')
 _client_session = []
 
 
+class _PooledTransport(object):
+    def __init__(self, client):
+        # keep the connecting client around, it owns the transport
+        self.client = client
+        self.transport = client.get_transport()
+        self.channels = 0
+        self.last_used = time.time()
+
+    @property
+    def healthy(self):
+        if not self.transport.is_active():
+            return False
+        if self.channels or time.time() - self.last_used < POOL_KEEPALIVE:
+            return True
+        try:
+            self.transport.send_ignore()
+        except (EOFError, socket.error, paramiko.SSHException):
+            return False
+        return True
+
+    def close(self):
+        with diaper:
+            self.client.close()
+
+
+class SSHTransportPool(object):
+    """A small set of shared, keepalive'd transports to one host
+
+    Channels (commands, scp transfers, sftp sessions) are spread over at most
+    ``max_transports`` transports with at most ``max_channels`` channels open on each, so many
+    concurrent users of the same host neither pay the handshake cost repeatedly nor exceed
+    sshd's MaxSessions. When all the slots are taken, :py:meth:`channel_slot` blocks until one
+    is released.
+
+    Use :py:func:`get_transport_pool` to get the pool for a host instead of instantiating this.
+    """
+    def __init__(self, connect_kwargs, max_transports=POOL_MAX_TRANSPORTS,
+                 max_channels=POOL_MAX_CHANNELS):
+        self._connect_kwargs = connect_kwargs
+        self.max_transports = max_transports
+        self.max_channels = max_channels
+        self._transports = []
+        self._cond = threading.Condition()
+
+    def __repr__(self):
+        return '<SSHTransportPool hostname={!r} transports={}>'.format(
+            self._connect_kwargs.get('hostname'), len(self._transports))
+
+    def _connect(self):
+        logger.debug('%r: opening new transport', self)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(**self._connect_kwargs)
+        client.get_transport().set_keepalive(POOL_KEEPALIVE)
+        pooled = _PooledTransport(client)
+        self._transports.append(pooled)
+        return pooled
+
+    def _prune(self):
+        for pooled in list(self._transports):
+            if not pooled.healthy:
+                logger.debug('%r: dropping dead transport', self)
+                self._transports.remove(pooled)
+                pooled.close()
+
+    def transport(self):
+        """Get the least busy healthy transport, connecting one if there is none"""
+        with self._cond:
+            self._prune()
+            if not self._transports:
+                return self._connect().transport
+            return min(self._transports, key=lambda pooled: pooled.channels).transport
+
+    def reserve(self, count=1):
+        """Reserve ``count`` channel slots at once, blocking until all of them are free
+
+        The slots are taken all together or not at all, so concurrent callers each waiting for
+        more slots while holding some can't deadlock each other.
+
+        Returns:
+            A list of ``count`` pooled transports, one per slot (a transport may be repeated);
+            pass it to :py:meth:`release` when done
+        """
+        if count > self.max_transports * self.max_channels:
+            raise ValueError('{!r} has only {} channel slots, {} requested'.format(
+                self, self.max_transports * self.max_channels, count))
+        with self._cond:
+            while True:
+                self._prune()
+                free = sum(self.max_channels - pooled.channels for pooled in self._transports)
+                free += (self.max_transports - len(self._transports)) * self.max_channels
+                if free >= count:
+                    break
+                self._cond.wait(1)
+            reserved = []
+            for pooled in self._transports:
+                while len(reserved) < count and pooled.channels < self.max_channels:
+                    pooled.channels += 1
+                    reserved.append(pooled)
+            while len(reserved) < count:
+                pooled = self._connect()
+                while len(reserved) < count and pooled.channels < self.max_channels:
+                    pooled.channels += 1
+                    reserved.append(pooled)
+            return reserved
+
+    def release(self, reserved):
+        """Give back channel slots taken by :py:meth:`reserve`"""
+        with self._cond:
+            for pooled in reserved:
+                pooled.channels -= 1
+                pooled.last_used = time.time()
+            self._cond.notify_all()
+
+    @contextmanager
+    def channel_slots(self, count):
+        """Reserve ``count`` channel slots, yielding the transport of each of them"""
+        reserved = self.reserve(count)
+        try:
+            yield [pooled.transport for pooled in reserved]
+        finally:
+            self.release(reserved)
+
+    @contextmanager
+    def channel_slot(self):
+        """Reserve a channel slot on one of the transports, yielding that transport"""
+        with self.channel_slots(1) as transports:
+            yield transports[0]
+
+    def close(self):
+        with self._cond:
+            for pooled in self._transports:
+                pooled.close()
+            self._transports = []
+
+
+_transport_pools = {}
+_transport_pools_lock = threading.Lock()
+
+
+def get_transport_pool(connect_kwargs):
+    """Get the shared transport pool for the host, port and user in ``connect_kwargs``"""
+    key = (
+        connect_kwargs['hostname'], connect_kwargs.get('port', ports.SSH),
+        connect_kwargs.get('username'))
+    with _transport_pools_lock:
+        if key not in _transport_pools:
+            pool = SSHTransportPool(dict(connect_kwargs))
+            _transport_pools[key] = pool
+            at_exit(pool.close)
+        return _transport_pools[key]
+
+
+class _PooledSFTPClient(paramiko.SFTPClient):
+    """SFTP client that gives its channel slot back to the transport pool when closed"""
+    release = None
+
+    def close(self):
+        try:
+            super(_PooledSFTPClient, self).close()
+        finally:
+            release, self.release = self.release, None
+            if release is not None:
+                release()
+
+
+@contextmanager
+def _sessions_on(transports):
+    """Open a channel session on each of the transports, closing all of them afterwards"""
+    sessions = []
+    try:
+        for transport in transports:
+            sessions.append(transport.open_session())
+        yield sessions
+    finally:
+        for session in sessions:
+            session.close()
+
+
+class _ChannelReader(object):
+    """Collects the output of one command channel as the data arrives
+
+    stdout and stderr are kept interleaved in arrival order, like the combined output of a
+    terminal. If ``output_limit`` is set, only the last ``output_limit`` bytes are kept.
+    The callbacks are called with complete lines.
+    """
+    chunk_size = 32768
+
+    def __init__(self, stdout_callback=None, stderr_callback=None, output_limit=None):
+        self.session = None
+        self.exit_status = None
+        self.output_limit = output_limit
+        self.stdout_callback = stdout_callback
+        self.stderr_callback = stderr_callback
+        self._chunks = deque()
+        self._size = 0
+        self._partial = {'stdout': '', 'stderr': ''}
+
+    def start(self, session, command, uses_sudo, timeout):
+        self.session = session
+        if uses_sudo:
+            # We need a pseudo-tty for sudo
+            session.get_pty()
+        if timeout:
+            session.settimeout(float(timeout))
+        session.exec_command(command)
+
+    @property
+    def output(self):
+        return ''.join(self._chunks)
+
+    def _store(self, chunk):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        while self.output_limit is not None and self._size > self.output_limit:
+            excess = self._size - self.output_limit
+            head = self._chunks.popleft()
+            if len(head) > excess:
+                self._chunks.appendleft(head[excess:])
+                self._size -= excess
+            else:
+                self._size -= len(head)
+
+    def _feed(self, stream, chunk, callback):
+        self._store(chunk)
+        if callback is None:
+            return
+        lines = (self._partial[stream] + chunk).split('\n')
+        self._partial[stream] = lines.pop()
+        for line in lines:
+            callback(line + '\n')
+
+    def pump(self):
+        """Read all the data that is available now, without blocking
+
+        Returns:
+            True once the command finished and all of its output was read
+        """
+        session = self.session
+        while session.recv_ready():
+            self._feed('stdout', session.recv(self.chunk_size), self.stdout_callback)
+        while session.recv_stderr_ready():
+            self._feed('stderr', session.recv_stderr(self.chunk_size), self.stderr_callback)
+        # sshd may send the exit status before all of the output, only EOF means it is all here
+        if not (session.eof_received or session.closed) or not session.exit_status_ready() or \
+                session.recv_ready() or session.recv_stderr_ready():
+            return False
+        for stream, callback in [('stdout', self.stdout_callback),
+                                 ('stderr', self.stderr_callback)]:
+            if callback is not None and self._partial[stream]:
+                callback(self._partial[stream])
+        self.exit_status = session.recv_exit_status()
+        return True
+
+
+def _wait_for_readers(readers, timeout=None):
+    """Pump the readers until all of their commands finished, sleeping until data arrives"""
+    deadline = time.time() + float(timeout) if timeout else None
+    pending = [reader for reader in readers if not reader.pump()]
+    while pending:
+        wait = 1.0
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise socket.timeout('SSH command timed out')
+            wait = min(wait, remaining)
+        # channels become readable on data, EOF and close; the wait is capped in case the exit
+        # status arrives without any of those
+        select.select([reader.session for reader in pending], [], [], wait)
+        pending = [reader for reader in pending if not reader.pump()]
+
+
 class SSHClient(paramiko.SSHClient):
     """paramiko.SSHClient wrapper
 
@@ -107,10 +390,14 @@ class SSHClient(paramiko.SSHClient):
             app and ``container`` then specifies the name of the pod to interact with.
         stdout: If specified, overrides the system stdout file for streaming output.
         stderr: If specified, overrides the system stderr file for streaming output.
+        pooled: If True, the client shares transports with the other pooled clients of the same
+            host and user (see :py:class:`SSHTransportPool`). Defaults to True for clients of
+            the current appliance, that is when no ``hostname`` is passed.
     """
     def __init__(self, stream_output=False, **connect_kwargs):
         super(SSHClient, self).__init__()
         self._streaming = stream_output
+        self._pooled = connect_kwargs.pop('pooled', not connect_kwargs.get('hostname'))
         # deprecated/useless karg, included for backward-compat
         self._keystate = connect_kwargs.pop('keystate', None)
         # Container is used to store both docker VM's container name and Openshift pod name.
@@ -167,7 +454,7 @@ class SSHClient(paramiko.SSHClient):
     def __call__(self, **connect_kwargs):
         # Update a copy of this instance's connect kwargs with passed in kwargs,
         # then return a new instance with the updated kwargs
-        new_connect_kwargs = dict(self._connect_kwargs)
+        new_connect_kwargs = dict(self._connect_kwargs, pooled=self._pooled)
         new_connect_kwargs.update(connect_kwargs)
         # pass the key state if the hostname is the same, under the assumption that the same
         # host will still have keys installed if they have already been
@@ -196,10 +483,20 @@ class SSHClient(paramiko.SSHClient):
         if sent > 0:
             logger.debug('scp progress for %r: %s of %s ', filename, sent, size)
 
+    @property
+    def pool(self):
+        """The shared transport pool this client uses, None if it isn't pooled"""
+        if self._pooled:
+            return get_transport_pool(self._connect_kwargs)
+
     def close(self):
         with diaper:
             _client_session.remove(self)
-        super(SSHClient, self).close()
+        if self._pooled:
+            # the transport is shared, only let go of it
+            self._transport = None
+        else:
+            super(SSHClient, self).close()
 
     @property
     def connected(self):
@@ -214,8 +511,11 @@ class SSHClient(paramiko.SSHClient):
         if not self.connected:
             self._connect_kwargs.update(kwargs)
             self._check_port()
-            # Only install ssh keys if they aren't installed (or currently being installed)
-            conn = super(SSHClient, self).connect(**self._connect_kwargs)
+            if self._pooled:
+                self._transport = self.pool.transport()
+                conn = None
+            else:
+                conn = super(SSHClient, self).connect(**self._connect_kwargs)
         else:
             conn = None
 
@@ -246,29 +546,48 @@ class SSHClient(paramiko.SSHClient):
             logger.warning(
                 'You are about to use sftp on a containerized appliance. It may not work.')
         self.connect()
-        return super(SSHClient, self).open_sftp(*args, **kwargs)
+        if not self._pooled:
+            return super(SSHClient, self).open_sftp(*args, **kwargs)
+        # the sftp channel holds its slot of the pool until the client is closed
+        reserved = self.pool.reserve()
+        try:
+            sftp = _PooledSFTPClient.from_transport(reserved[0].transport, *args, **kwargs)
+        except Exception:
+            self.pool.release(reserved)
+            raise
+        if sftp is None:
+            self.pool.release(reserved)
+            return None
+        sftp.release = partial(self.pool.release, reserved)
+        return sftp
+
+    def _scp_transfer(self, method, *args, **kwargs):
+        """Run :py:class:`SCPClient` ``put`` or ``get``, in a channel slot if pooled"""
+        if not self.connected:
+            self.connect()
+        if not self._pooled:
+            scp = SCPClient(self.get_transport(), progress=self._progress_callback)
+            return getattr(scp, method)(*args, **kwargs)
+        with self.pool.channel_slot() as transport:
+            scp = SCPClient(transport, progress=self._progress_callback)
+            return getattr(scp, method)(*args, **kwargs)
 
     def get_transport(self, *args, **kwargs):
         if not self.connected:
             self.connect()
         return super(SSHClient, self).get_transport(*args, **kwargs)
 
-    def run_command(
-            self, command, timeout=RUNCMD_TIMEOUT, reraise=False, ensure_host=False,
-            ensure_user=False):
-        """Run a command over SSH.
+    @contextmanager
+    def _open_session(self):
+        """Open a channel session, in a channel slot of the transport pool if pooled"""
+        with self._open_sessions(1) as sessions:
+            yield sessions[0]
 
-        Args:
-            command: The command. Supports taking dicts as version picking.
-            timeout: Timeout after which the command execution fails.
-            reraise: Does not muffle the paramiko exceptions in the log.
-            ensure_host: Ensure that the command is run on the machine with the IP given, not any
-                container or such that we might be using by default.
-            ensure_user: Ensure that the command is run as the user we logged in, so in case we are
-                not root, setting this to True will prevent from running sudo.
+    def _prepare_command(self, command, ensure_host=False, ensure_user=False):
+        """Wrap the command for containers, pods and sudo as needed
 
         Returns:
-            A :py:class:`SSHResult` instance.
+            A ``(command, uses_sudo)`` tuple
         """
         if isinstance(command, dict):
             command = version.pick(command, active_version=self.vmdb_version)
@@ -293,39 +612,65 @@ class SSHClient(paramiko.SSHClient):
 
         if command != original_command:
             logger.info("> Actually running command %r", command)
-        command += '\n'
+        return command + '\n', uses_sudo
+
+    def _reader(self, stdout_callback=None, stderr_callback=None, output_limit=None):
+        if self._streaming:
+            stdout_callback = stdout_callback or self.f_stdout.write
+            stderr_callback = stderr_callback or self.f_stderr.write
+        return _ChannelReader(
+            stdout_callback=stdout_callback, stderr_callback=stderr_callback,
+            output_limit=output_limit)
+
+    @contextmanager
+    def _open_sessions(self, count):
+        """Open ``count`` channel sessions at once
+
+        If pooled, the channel slots for all of them are reserved together.
+        """
+        if not self.connected:
+            self.connect()
+        if self._pooled:
+            with self.pool.channel_slots(count) as transports:
+                with _sessions_on(transports) as sessions:
+                    yield sessions
+        else:
+            with _sessions_on([self.get_transport()] * count) as sessions:
+                yield sessions
+
+    def run_command(
+            self, command, timeout=RUNCMD_TIMEOUT, reraise=False, ensure_host=False,
+            ensure_user=False, stdout_callback=None, stderr_callback=None, output_limit=None):
+        """Run a command over SSH.
 
-        output = []
+        The output is read as it arrives, blocking on the channel in between, so long running
+        commands don't keep the test runner busy.
+
+        Args:
+            command: The command. Supports taking dicts as version picking.
+            timeout: Timeout after which the command execution fails.
+            reraise: Does not muffle the paramiko exceptions in the log.
+            ensure_host: Ensure that the command is run on the machine with the IP given, not any
+                container or such that we might be using by default.
+            ensure_user: Ensure that the command is run as the user we logged in, so in case we are
+                not root, setting this to True will prevent from running sudo.
+            stdout_callback: Called with each complete line of stdout as it arrives.
+            stderr_callback: Called with each complete line of stderr as it arrives.
+            output_limit: If set, only the last ``output_limit`` bytes of output are kept in the
+                result. Useful together with the callbacks for commands with huge output.
+
+        Returns:
+            A :py:class:`SSHResult` instance.
+        """
+        command, uses_sudo = self._prepare_command(command, ensure_host, ensure_user)
+        reader = self._reader(stdout_callback, stderr_callback, output_limit)
         try:
-            session = self.get_transport().open_session()
-            if uses_sudo:
-                # We need a pseudo-tty for sudo
-                session.get_pty()
-            if timeout:
-                session.settimeout(float(timeout))
-
-            session.exec_command(command)
-            stdout = session.makefile()
-            stderr = session.makefile_stderr()
-            while True:
-                if session.recv_ready:
-                    for line in stdout:
-                        output.append(line)
-                        if self._streaming:
-                            self.f_stdout.write(line)
-
-                if session.recv_stderr_ready:
-                    for line in stderr:
-                        output.append(line)
-                        if self._streaming:
-                            self.f_stderr.write(line)
-
-                if session.exit_status_ready():
-                    break
-            exit_status = session.recv_exit_status()
-            if exit_status != 0:
-                logger.warning('Exit code %d!', exit_status)
-            return SSHResult(exit_status, ''.join(output))
+            with self._open_session() as session:
+                reader.start(session, command, uses_sudo, timeout)
+                _wait_for_readers([reader], timeout)
+            if reader.exit_status != 0:
+                logger.warning('Exit code %d!', reader.exit_status)
+            return SSHResult(reader.exit_status, reader.output)
         except paramiko.SSHException:
             if reraise:
                 raise
@@ -335,12 +680,45 @@ class SSHClient(paramiko.SSHClient):
             logger.exception(
                 "Command %r timed out. Output before it failed was:\n%r",
                 command,
-                ''.join(output))
+                reader.output)
             raise
 
         # Returning two things so tuple unpacking the return works even if the ssh client fails
         # Return whatever we have in the output
-        return SSHResult(1, ''.join(output))
+        return SSHResult(1, reader.output)
+
+    def run_commands(self, commands, timeout=RUNCMD_TIMEOUT, ensure_host=False,
+                     ensure_user=False, output_limit=None):
+        """Run several commands concurrently, each on its own channel of the same connection
+
+        At most :py:data:`POOL_MAX_CHANNELS` commands run at the same time. Unlike
+        :py:meth:`run_command`, SSH errors are always raised.
+
+        Args:
+            commands: Iterable of commands, see :py:meth:`run_command`.
+            timeout: Timeout after which the execution of each batch of commands fails.
+            ensure_host: See :py:meth:`run_command`.
+            ensure_user: See :py:meth:`run_command`.
+            output_limit: See :py:meth:`run_command`.
+
+        Returns:
+            A list of :py:class:`SSHResult` instances, in the order of ``commands``.
+        """
+        prepared = [
+            self._prepare_command(command, ensure_host, ensure_user) for command in commands]
+        results = []
+        for offset in range(0, len(prepared), POOL_MAX_CHANNELS):
+            batch = prepared[offset:offset + POOL_MAX_CHANNELS]
+            readers = [self._reader(output_limit=output_limit) for _ in batch]
+            with self._open_sessions(len(batch)) as sessions:
+                for reader, session, (command, uses_sudo) in zip(readers, sessions, batch):
+                    reader.start(session, command, uses_sudo, timeout)
+                _wait_for_readers(readers, timeout)
+            for reader in readers:
+                if reader.exit_status != 0:
+                    logger.warning('Exit code %d!', reader.exit_status)
+                results.append(SSHResult(reader.exit_status, reader.output))
+        return results
 
     def cpu_spike(self, seconds=60, cpus=2, **kwargs):
         """Creates a CPU spike of specific length and processes.
@@ -385,8 +763,7 @@ class SSHClient(paramiko.SSHClient):
         if self.is_container:
             tempfilename = '/share/temp_{}'.format(fauxfactory.gen_alpha())
             logger.info('For this purpose, temporary file name is %r', tempfilename)
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                local_file, tempfilename, **kwargs)
+            scp = self._scp_transfer('put', local_file, tempfilename, **kwargs)
             self.run_command('mv {} {}'.format(tempfilename, remote_file))
             return scp
         elif self.is_pod:
@@ -400,8 +777,7 @@ class SSHClient(paramiko.SSHClient):
             # Now upload the file to the openshift host
             tmp_file_name = 'file-{}'.format(fauxfactory.gen_alpha().lower())
             tmp_full_name = '/tmp/{}/{}'.format(tmp_folder_name, tmp_file_name)
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                local_file, tmp_full_name, **kwargs)
+            scp = self._scp_transfer('put', local_file, tmp_full_name, **kwargs)
             # use oc rsync to put the file in the container
             rsync_cmd = 'oc rsync --namespace={proj} /tmp/{file} {pod}:/tmp/'
             assert self.run_command(rsync_cmd.format(proj=self._project, file=tmp_folder_name,
@@ -412,14 +788,12 @@ class SSHClient(paramiko.SSHClient):
             return scp
         else:
             if self.username == 'root':
-                return SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                    local_file, remote_file, **kwargs)
+                return self._scp_transfer('put', local_file, remote_file, **kwargs)
             # scp client is not sudo, may not work for non sudo
             tempfilename = '/home/{user_name}/temp_{random_alpha}'.format(
                 user_name=self.username, random_alpha=fauxfactory.gen_alpha())
             logger.info('For this purpose, temporary file name is %r', tempfilename)
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                local_file, tempfilename, **kwargs)
+            scp = self._scp_transfer('put', local_file, tempfilename, **kwargs)
             self.run_command('mv {temp_file} {remote_file}'.format(temp_file=tempfilename,
                                                                    remote_file=remote_file))
             return scp
@@ -432,8 +806,7 @@ class SSHClient(paramiko.SSHClient):
             tempfilename = '/share/{}'.format(tmp_file_name)
             logger.info('For this purpose, temporary file name is %r', tempfilename)
             self.run_command('cp {} {}'.format(remote_file, tempfilename))
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).get(
-                tempfilename, local_path, **kwargs)
+            scp = self._scp_transfer('get', tempfilename, local_path, **kwargs)
             self.run_command('rm {}'.format(tempfilename))
             check_call([
                 'mv',
@@ -458,16 +831,14 @@ class SSHClient(paramiko.SSHClient):
                                                      file=tmp_folder_name),
                                     ensure_host=True)
             # Now download the file to the openshift host
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).get(
-                tmp_full_name, local_path, **kwargs)
+            scp = self._scp_transfer('get', tmp_full_name, local_path, **kwargs)
             check_call([
                 'mv',
                 os_path.join(local_path, tmp_file_name),
                 os_path.join(local_path, base_name)])
             return scp
         else:
-            return SCPClient(self.get_transport(), progress=self._progress_callback).get(
-                remote_file, local_path, **kwargs)
+            return self._scp_transfer('get', remote_file, local_path, **kwargs)
 
     def patch_file(self, local_path, remote_path, md5=None):
         """ Patches a single file on the appliance
@@ -635,28 +1006,68 @@ class SSHClient(paramiko.SSHClient):
 
 
 class SSHTail(SSHClient):
+    """Follows a remote file, yielding the lines appended to it since the last read
+
+    New data is fetched with pipelined SFTP block reads. Rotation (the file was replaced, so its
+    inode changed) and truncation (the file shrank) are detected, in which case the new file is
+    read from its start. Only complete lines are yielded, a line still being written is picked
+    up by the next read.
+    """
+    #: Size of the blocks new data is fetched in
+    block_size = 4 * 1024 * 1024
 
     def __init__(self, remote_filename, **connect_kwargs):
         super(SSHTail, self).__init__(stream_output=False, **connect_kwargs)
         self._remote_filename = remote_filename
         self._sftp_client = None
         self._remote_file_size = None
+        self._remote_inode = None
 
     def __iter__(self):
         for line in self.raw_lines():
             yield line.rstrip()
 
+    def _remote_stat(self):
+        """Returns ``(inode, size)`` of the remote file, the inode may be None if unavailable"""
+        result = self.run_command(
+            'stat -L -c "%i %s" {}'.format(quote(self._remote_filename)),
+            ensure_host=True, ensure_user=True)
+        try:
+            inode, size = result.output.split()
+            return int(inode), int(size)
+        except ValueError:
+            # SFTP doesn't know inodes, so rotation can only be detected as truncation
+            return None, self._sftp_client.stat(self._remote_filename).st_size
+
     def raw_lines(self):
         with self as sshtail:
-            fstat = sshtail._sftp_client.stat(self._remote_filename)
-            if self._remote_file_size is not None:
-                if self._remote_file_size < fstat.st_size:
+            inode, size = sshtail._remote_stat()
+            offset = self._remote_file_size
+            if offset is not None:
+                if inode != self._remote_inode or size < offset:
+                    logger.info('%s was rotated or truncated, following the new file',
+                                self._remote_filename)
+                    offset = 0
+                if offset < size:
                     remote_file = self._sftp_client.open(self._remote_filename, 'r')
-                    remote_file.seek(self._remote_file_size, 0)
-                    while (remote_file.tell() < fstat.st_size):
-                        line = remote_file.readline()  # Note the  missing rstrip() here!
-                        yield line
-            self._remote_file_size = fstat.st_size
+                    try:
+                        blocks = [(block_start, min(self.block_size, size - block_start))
+                                  for block_start in range(offset, size, self.block_size)]
+                        partial = ''
+                        for block in remote_file.readv(blocks):
+                            data = partial + block
+                            complete = data.rfind('\n') + 1
+                            partial = data[complete:]
+                            if not complete:
+                                continue
+                            for line in data[:complete - 1].split('\n'):
+                                offset += len(line) + 1
+                                yield line + '\n'  # Note the  missing rstrip() here!
+                    finally:
+                        remote_file.close()
+                size = offset
+            self._remote_file_size = size
+            self._remote_inode = inode
 
     def raw_string(self):
         return ''.join(self)
@@ -671,8 +1082,8 @@ class SSHTail(SSHClient):
 
     def set_initial_file_end(self):
         with self as sshtail:
-            fstat = sshtail._sftp_client.stat(self._remote_filename)
-            self._remote_file_size = fstat.st_size  # Seed initial size of file
+            # Seed initial size of file
+            self._remote_inode, self._remote_file_size = sshtail._remote_stat()
 
     def lines_as_list(self):
         """Return lines as list"""
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from fixtures.artifactor_plugin import AsyncHookSender
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakeClient(object):
+    """Records the delivered hooks, can be stalled to let the hook queue fill up"""
+    def __init__(self):
+        self.hooks = []
+        self.busy = threading.Event()
+        self.resume = threading.Event()
+        self.resume.set()
+
+    def fire_hook(self, hook, **hook_args):
+        self.busy.set()
+        self.resume.wait()
+        if hook == 'broken':
+            raise ValueError('broken hook')
+        self.hooks.append((hook, hook_args))
+
+    def __nonzero__(self):
+        return True
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+def stall(sender, client):
+    """Keep the sender thread busy delivering a hook, so the queued ones stay queued"""
+    client.resume.clear()
+    client.busy.clear()
+    sender.fire_hook('stalled')
+    assert client.busy.wait(5)
+
+
+def test_hooks_delivered_in_order_on_close(client):
+    sender = AsyncHookSender(client, maxsize=5, batch_size=2)
+    for i in range(20):
+        sender.fire_hook('start_test', test_name=str(i))
+    sender.close()
+    assert client.hooks == [('start_test', {'test_name': str(i)}) for i in range(20)]
+    stats = sender.stats()
+    assert stats['sent'] == 20
+    assert stats['depth'] == 0
+    assert stats['max_depth'] <= 5
+    # after close the hooks are delivered right away
+    sender.fire_hook('finish_session')
+    assert client.hooks[-1] == ('finish_session', {})
+
+
+def test_droppable_hooks_dropped_when_full(client):
+    sender = AsyncHookSender(client, maxsize=2)
+    stall(sender, client)
+    sender.fire_hook('start_test')
+    sender.fire_hook('log_message', message='queued')
+    sender.fire_hook('log_message', message='dropped')
+    client.resume.set()
+    sender.close()
+    assert [hook for hook, hook_args in client.hooks] == ['stalled', 'start_test', 'log_message']
+    assert client.hooks[-1][1] == {'message': 'queued'}
+    assert sender.stats()['dropped'] == 1
+
+
+def test_coalesced_hooks_sent_once_while_waiting(client):
+    sender = AsyncHookSender(client, maxsize=10)
+    stall(sender, client)
+    for _ in range(3):
+        sender.fire_hook('build_report')
+    sender.fire_hook('start_test')
+    client.resume.set()
+    sender.close()
+    assert [hook for hook, hook_args in client.hooks] == ['stalled', 'build_report', 'start_test']
+    assert sender.stats()['coalesced'] == 2
+
+
+def test_other_hooks_block_when_full(client):
+    sender = AsyncHookSender(client, maxsize=1)
+    stall(sender, client)
+    sender.fire_hook('start_test')
+    blocked = threading.Thread(target=sender.fire_hook, args=('finish_test', ))
+    blocked.daemon = True
+    blocked.start()
+    blocked.join(0.5)
+    assert blocked.is_alive()
+    client.resume.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    sender.close()
+    assert [hook for hook, hook_args in client.hooks] == ['stalled', 'start_test', 'finish_test']
+    stats = sender.stats()
+    assert stats['blocked'] == 1
+    assert stats['dropped'] == 0
+
+
+def test_failed_hooks_counted(client):
+    sender = AsyncHookSender(client)
+    sender.fire_hook('broken')
+    sender.fire_hook('start_test')
+    sender.close()
+    stats = sender.stats()
+    assert stats['failed'] == 1
+    assert stats['sent'] == 1
+    assert stats['max_latency'] >= stats['avg_latency'] >= 0
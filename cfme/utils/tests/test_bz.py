@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import threading
+import xmlrpclib
+from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+import pytest
+
+from cfme.utils.bz import Bugzilla
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+def bug_data(bug_id, blocks=(), comment="Description"):
+    return {
+        "id": bug_id,
+        "summary": "Bug {}".format(bug_id),
+        "status": "NEW",
+        "resolution": "",
+        "product": "CFME",
+        "blocks": list(blocks),
+        "flags": [],
+        "comments": [{"text": comment}],
+    }
+
+
+class FakeBugzillaApi(object):
+    """Just enough of the Bugzilla XML-RPC API for python-bugzilla to fetch bugs"""
+    def __init__(self, bugs):
+        self.bugs = {bug["id"]: bug for bug in bugs}
+        self.calls = []
+
+    def _dispatch(self, method, params):
+        self.calls.append(method)
+        if method == "Bugzilla.version":
+            return {"version": "5.0"}
+        elif method == "Bugzilla.extensions":
+            return {"extensions": {}}
+        elif method == "Bug.get":
+            ids = [int(bug_id) for bug_id in params[0]["ids"]]
+            return {
+                "bugs": [self.bugs[bug_id] for bug_id in ids if bug_id in self.bugs],
+                "faults": [],
+            }
+        raise xmlrpclib.Fault(32000, "Unknown method {}".format(method))
+
+    @property
+    def bug_requests(self):
+        return self.calls.count("Bug.get")
+
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ("/xmlrpc.cgi", )
+
+
+@pytest.fixture
+def fake_bugzilla():
+    api = FakeBugzillaApi([
+        bug_data(1, blocks=[2, 3]),
+        bug_data(2, comment="+++ This bug was initially created as a clone of Bug #1 +++"),
+        bug_data(3),
+        bug_data(4),
+        bug_data(6, blocks=[7]),
+        bug_data(7, comment="+++ This bug was initially created as a clone of Bug #6 +++"),
+    ])
+    server = SimpleXMLRPCServer(
+        ("127.0.0.1", 0), requestHandler=RequestHandler, allow_none=True, logRequests=False)
+    server.register_instance(api)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    api.url = "http://127.0.0.1:{}/xmlrpc.cgi".format(server.server_address[1])
+    yield api
+    server.shutdown()
+    server.server_close()
+
+
+def make_bugzilla(api, cache_dir, **kwargs):
+    return Bugzilla(url=api.url, cookiefile=None, tokenfile=None, cache_dir=cache_dir, **kwargs)
+
+
+def test_get_bugs_batched(fake_bugzilla, tmpdir):
+    bugzilla = make_bugzilla(fake_bugzilla, tmpdir.strpath)
+    bugs = bugzilla.get_bugs([1, 2, 3, 4, 5])
+    assert sorted(bugs) == [1, 2, 3, 4]
+    assert bugs[3].summary == "Bug 3"
+    assert fake_bugzilla.bug_requests == 1
+    bugzilla.get_bug(4)
+    assert fake_bugzilla.bug_requests == 1
+
+
+def test_disk_cache_shared(fake_bugzilla, tmpdir):
+    make_bugzilla(fake_bugzilla, tmpdir.strpath).get_bugs([1, 2])
+    # Another process (slave) with the same cache
+    bugzilla = make_bugzilla(fake_bugzilla, tmpdir.strpath)
+    assert bugzilla.get_bug(2).copy_of == 1
+    assert fake_bugzilla.bug_requests == 1
+
+
+def test_disk_cache_expires(fake_bugzilla, tmpdir):
+    make_bugzilla(fake_bugzilla, tmpdir.strpath, cache_ttl=-1).get_bugs([1])
+    make_bugzilla(fake_bugzilla, tmpdir.strpath, cache_ttl=-1).get_bugs([1])
+    assert fake_bugzilla.bug_requests == 2
+
+
+def test_prefetch_variants(fake_bugzilla, tmpdir):
+    bugzilla = make_bugzilla(fake_bugzilla, tmpdir.strpath)
+    bugzilla.prefetch([1])
+    # The bug itself, then all the bugs it blocks at once
+    assert fake_bugzilla.bug_requests == 2
+    variants = bugzilla.get_bug_variants(1)
+    assert sorted(bug.id for bug in variants) == [1, 2]
+    assert fake_bugzilla.bug_requests == 2
+
+
+def test_prefetch_batches_blocked_bugs(fake_bugzilla, tmpdir):
+    bugzilla = make_bugzilla(fake_bugzilla, tmpdir.strpath)
+    bugzilla.prefetch([1, 6])
+    # The bugs, then the bugs blocked by any of them at once
+    assert fake_bugzilla.bug_requests == 2
+    assert sorted(bug.id for bug in bugzilla.get_bug_variants(6)) == [6, 7]
+    assert fake_bugzilla.bug_requests == 2
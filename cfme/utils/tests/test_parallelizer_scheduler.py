@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from fixtures.parallelizer.scheduler import (
+    DurationHistory, ProviderAffinityPlanner, order_longest_first, split_tail)
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakeCache(object):
+    def __init__(self, **values):
+        self.values = values
+
+    def get(self, key, default):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class FakeReport(object):
+    def __init__(self, nodeid, duration, when='call'):
+        self.nodeid = nodeid
+        self.duration = duration
+        self.when = when
+
+
+@pytest.fixture
+def history():
+    return DurationHistory(FakeCache(**{DurationHistory.cache_key: {
+        'a': 10.0, 'b': 1.0, 'c': 1.0, 'd': 4.0, 'e': 2.0}}))
+
+
+def test_history_estimate_falls_back_to_median(history):
+    assert history.estimate('a') == 10.0
+    assert history.estimate('unknown') == 2.0
+    assert history.group_cost(['a', 'b', 'unknown']) == 13.0
+
+
+def test_history_default_without_any_durations():
+    history = DurationHistory(FakeCache(), default=3.0)
+    assert history.estimate('unknown') == 3.0
+
+
+def test_history_save_merges_measurements():
+    cache = FakeCache(**{DurationHistory.cache_key: {'a': 10.0}})
+    history = DurationHistory(cache, weight=0.5)
+    # setup, call and teardown of one test add up
+    for duration in (1.0, 2.0, 3.0):
+        history.record(FakeReport('a', duration))
+    history.record(FakeReport('b', 4.0))
+    assert history.save() == 2
+    assert cache.values[DurationHistory.cache_key] == {'a': 8.0, 'b': 4.0}
+    # the fallback is recomputed from the merged history
+    assert history.estimate('unknown') == 8.0
+    assert history.save() == 0
+
+
+def test_order_longest_first(history):
+    groups = [['b'], ['a'], ['c', 'd'], ['e']]
+    order_longest_first(groups, history)
+    assert groups == [['a'], ['c', 'd'], ['e'], ['b']]
+
+
+def test_split_tail_balances_halves(history):
+    groups = [['b'], ['d', 'b', 'c', 'e']]
+    order_longest_first(groups, history)
+    split_tail(groups, history, 3)
+    assert groups == [['d'], ['b', 'c', 'e'], ['b']]
+
+
+def test_split_tail_only_for_idle_slaves(history):
+    groups = [['d', 'b', 'c', 'e']]
+    split_tail(groups, history, 1)
+    assert groups == [['d', 'b', 'c', 'e']]
+
+
+def test_split_tail_stops_at_single_tests(history):
+    groups = [['a', 'b']]
+    split_tail(groups, history, 5)
+    assert groups == [['a'], ['b']]
+
+
+class FakeSlave(object):
+    def __init__(self, id, provider_allocation=()):
+        self.id = id
+        self.provider_allocation = list(provider_allocation)
+
+
+@pytest.fixture
+def planner():
+    return ProviderAffinityPlanner(
+        FakeCache(**{ProviderAffinityPlanner.cache_key: {'rhv': 30.0, 'vsphere': 90.0}}),
+        ['rhv', 'vsphere', 'vsphere65', 'ec2'], capacity=2)
+
+
+def tests_for(provider=None):
+    if provider is None:
+        return ['test_module.py::test_plain']
+    return ['test_module.py::test_a[{}]'.format(provider),
+            'test_module.py::test_b[{}-param]'.format(provider)]
+
+
+def test_planner_longest_key_wins(planner):
+    assert planner.providers_of(tests_for('vsphere65')) == ['vsphere65']
+    assert planner.providers_of(tests_for('vsphere')) == ['vsphere']
+    assert planner.providers_of(tests_for()) == []
+
+
+def test_planner_empty_pool(planner):
+    assert planner.plan(FakeSlave('slave00'), [], []) is None
+
+
+def test_planner_keeps_held_provider(planner):
+    slave = FakeSlave('slave00', ['ec2'])
+    pool = [tests_for(), tests_for('rhv'), tests_for('ec2')]
+    assert planner.plan(slave, pool, [slave]) == (2, 'ec2', planner.KEEP)
+
+
+def test_planner_ranks_with_capacity(planner):
+    slave = FakeSlave('slave00', ['ec2'])
+    other = FakeSlave('slave01', ['rhv'])
+    slaves = [slave, other]
+    pool = [tests_for('rhv'), tests_for(), tests_for('vsphere')]
+    # a provider nobody holds yet comes first
+    assert planner.plan(slave, pool, slaves) == (2, 'vsphere', planner.ADD_NEW)
+    pool.pop(2)
+    # then groups needing no provider at all
+    assert planner.plan(slave, pool, slaves) == (1, None, planner.NO_PROVIDER)
+    pool.pop(1)
+    # setting up a provider another slave already has is the last resort
+    assert planner.plan(slave, pool, slaves) == (0, 'rhv', planner.ADD_DUPLICATE)
+
+
+def test_planner_ranks_without_capacity(planner):
+    slave = FakeSlave('slave00', ['ec2', 'vsphere65'])
+    other = FakeSlave('slave01', ['rhv'])
+    slaves = [slave, other]
+    pool = [tests_for('rhv'), tests_for('vsphere'), tests_for()]
+    assert planner.plan(slave, pool, slaves) == (2, None, planner.NO_PROVIDER)
+    pool.pop(2)
+    assert planner.plan(slave, pool, slaves) == (1, 'vsphere', planner.CLEANSE_NEW)
+    pool.pop(1)
+    assert planner.plan(slave, pool, slaves) == (0, 'rhv', planner.CLEANSE_DUPLICATE)
+
+
+def test_planner_prefers_cheaper_duplicate(planner):
+    slave = FakeSlave('slave00')
+    other = FakeSlave('slave01', ['vsphere', 'rhv'])
+    pool = [tests_for('vsphere'), tests_for('rhv')]
+    assert planner.plan(slave, pool, [slave, other]) == (1, 'rhv', planner.ADD_DUPLICATE)
+
+
+def test_planner_measures_setup_cost(planner):
+    slave = FakeSlave('slave00')
+    tests = tests_for('rhv')
+    planner.provider_added(slave, 'rhv', tests, cleansed=True)
+    planner.record(slave, FakeReport(tests[0], 50.0, when='call'))
+    planner.record(slave, FakeReport(tests[0], 50.0, when='setup'))
+    planner.record(slave, FakeReport(tests[0], 1000.0, when='setup'))
+    assert planner.add_cost('rhv') == 40.0
+    assert planner.summary() == 'provider adds: 1, appliance cleanses: 1'
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from cfme.utils import providers, version
+from cfme.utils.providers import ProviderFilter, ProviderRegistry
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakeProvider(object):
+    def __init__(self, key, data):
+        self.key = key
+        self.data = data
+        self.name = data['name']
+        self.endpoints = {'default': {'hostname': data['name']}}
+
+    def one_of(self, *classes):
+        return isinstance(self, classes)
+
+
+class FakeCloudProvider(FakeProvider):
+    pass
+
+
+class FakeInfraProvider(FakeProvider):
+    pass
+
+
+class FakeRHEVMProvider(FakeInfraProvider):
+    pass
+
+
+class FakeConf(object):
+    cfme_data = {'test_flags': 'f1,f2'}
+
+
+FAKE_TYPES = {
+    'cloud': FakeCloudProvider, 'infra': FakeInfraProvider, 'rhevm': FakeRHEVMProvider}
+
+
+def fake_providers_data(rnd, count=30):
+    data = {}
+    for i in range(count):
+        prov_data = {
+            'name': 'provider {}'.format(i),
+            'type': rnd.choice(sorted(FAKE_TYPES)),
+            'tags': rnd.sample(['disabled', 'a', 'b', 'c'], rnd.randint(0, 2)),
+        }
+        if rnd.random() < 0.3:
+            prov_data['restricted_version'] = rnd.choice(['>= 5.8', '< 5.9', '== 5.9'])
+        if rnd.random() < 0.5:
+            prov_data['small_template'] = rnd.choice(['x', 'y'])
+        if rnd.random() < 0.3:
+            prov_data['excluded_test_flags'] = 'f1'
+        data['key{}'.format(i)] = prov_data
+    return data
+
+
+def random_filter(rnd, keys):
+    kwargs = {
+        'inverted': rnd.random() < 0.3,
+        'conjunctive': rnd.random() < 0.6,
+    }
+    if rnd.random() < 0.3:
+        kwargs['keys'] = rnd.sample(keys, 10)
+    if rnd.random() < 0.4:
+        kwargs['classes'] = rnd.sample(
+            [FAKE_TYPES[name] for name in sorted(FAKE_TYPES)], rnd.randint(1, 2))
+    if rnd.random() < 0.3:
+        kwargs['required_fields'] = rnd.choice(
+            [['small_template'], [('small_template', 'x')], [['tags', 0]]])
+    if rnd.random() < 0.4:
+        kwargs['required_tags'] = rnd.sample(['a', 'b', 'c', 'disabled'], 1)
+    if rnd.random() < 0.3:
+        kwargs['required_flags'] = rnd.choice([['f1'], ['f2'], [], ['f3']])
+    if rnd.random() < 0.3:
+        kwargs['restrict_version'] = True
+    return ProviderFilter(**kwargs)
+
+
+@pytest.fixture
+def fake_providers(monkeypatch):
+    rnd = random.Random(42)
+    data = fake_providers_data(rnd)
+    appliance_version = ['5.9']
+
+    def fake_get_crud(provider_key, appliance=None):
+        prov_data = data[provider_key]
+        return FAKE_TYPES[prov_data['type']](provider_key, prov_data)
+
+    monkeypatch.setattr(providers, 'providers_data', data)
+    monkeypatch.setattr(providers, 'get_crud', fake_get_crud)
+    monkeypatch.setattr(providers, 'conf', FakeConf)
+    monkeypatch.setattr(version, 'current_version', lambda: appliance_version[0])
+    return rnd, data, appliance_version
+
+
+def test_registry_matches_filtering(fake_providers):
+    rnd, data, appliance_version = fake_providers
+    registry = ProviderRegistry(appliance=None)
+    keys = sorted(data)
+    filters = [random_filter(rnd, keys) for _ in range(30)]
+    for i in range(1000):
+        if i == 500:
+            appliance_version[0] = '5.8'
+        used_filters = rnd.sample(filters, rnd.randint(0, 3))
+        expected = [providers.get_crud(key) for key in data]
+        for prov_filter in used_filters:
+            expected = filter(prov_filter, expected)
+        assert ([provider.key for provider in registry.list(used_filters)] ==
+                [provider.key for provider in expected])
+
+
+def test_registry_returns_new_objects(fake_providers):
+    registry = ProviderRegistry(appliance=None)
+    first = registry.list([])[0]
+    first.endpoints['default']['hostname'] = 'changed'
+    assert registry.list([])[0].endpoints['default']['hostname'] != 'changed'
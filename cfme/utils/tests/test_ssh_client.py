@@ -20,6 +20,31 @@ def test_ssh_client_run_command(appliance):
     assert 'Testing!' in output
 
 
+def test_ssh_client_run_command_streams_lines(appliance):
+    # Make sure output is handed to the callback line by line and can be limited in the result
+    lines = []
+    result = appliance.ssh_client.run_command(
+        'echo first; echo second', stdout_callback=lines.append, output_limit=7)
+    assert result.success
+    assert [line.strip() for line in lines] == ['first', 'second']
+    assert result.output.strip() == 'second'
+
+
+def test_ssh_client_run_commands(appliance):
+    # Make sure concurrently run commands return their results in order
+    results = appliance.ssh_client.run_commands(
+        ['echo {}; exit {}'.format(i, i % 2) for i in range(10)])
+    assert [result.output.strip() for result in results] == [str(i) for i in range(10)]
+    assert [result.rc for result in results] == [i % 2 for i in range(10)]
+
+
+def test_ssh_client_run_command_reads_output_to_the_end(appliance):
+    # Make sure output arriving after the exit status is not lost
+    result = appliance.ssh_client.run_command('seq 1 200000; exit 3')
+    assert result.rc == 3
+    assert result.output.split() == [str(i) for i in range(1, 200001)]
+
+
 def test_scp_client_can_put_a_file(appliance, tmpdir):
     # Make sure we can put a file, get a file, and they all match
     tmpfile = tmpdir.mkdir("sub").join("temp.txt")
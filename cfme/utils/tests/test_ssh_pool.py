@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from cfme.utils.ssh import SSHTransportPool
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakePooledTransport(object):
+    healthy = True
+
+    def __init__(self):
+        self.transport = self
+        self.channels = 0
+        self.last_used = 0
+
+    def close(self):
+        pass
+
+
+class FakeTransportPool(SSHTransportPool):
+    def _connect(self):
+        pooled = FakePooledTransport()
+        self._transports.append(pooled)
+        return pooled
+
+
+def test_reserve_spreads_over_transports():
+    pool = FakeTransportPool({}, max_transports=2, max_channels=3)
+    reserved = pool.reserve(5)
+    assert len(reserved) == 5
+    assert sorted(pooled.channels for pooled in pool._transports) == [2, 3]
+    pool.release(reserved)
+    assert [pooled.channels for pooled in pool._transports] == [0, 0]
+
+
+def test_reserve_more_than_capacity():
+    pool = FakeTransportPool({}, max_transports=2, max_channels=3)
+    with pytest.raises(ValueError):
+        pool.reserve(7)
+
+
+def test_concurrent_multi_slot_reservations_do_not_deadlock():
+    # every caller needs more than half of the slots, so at most one can hold them at a time
+    pool = FakeTransportPool({}, max_transports=2, max_channels=8)
+    finished = []
+
+    def use_slots():
+        for _ in range(20):
+            with pool.channel_slots(9) as transports:
+                assert len(transports) == 9
+        finished.append(True)
+
+    threads = [threading.Thread(target=use_slots) for _ in range(3)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert len(finished) == 3
+    assert all(pooled.channels == 0 for pooled in pool._transports)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from markers.uncollect import UncollectifEvaluator
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakePluginManager(object):
+    def getplugin(self, name):
+        return None
+
+
+class FakeConfig(object):
+    pluginmanager = FakePluginManager()
+
+
+class FakeCallSpec(object):
+    def __init__(self, params):
+        self.params = params
+
+
+class FakeItem(object):
+    name = 'test_fake'
+
+    def __init__(self, marker, **params):
+        self.marker = marker
+        if params:
+            self.callspec = FakeCallSpec(params)
+
+    def get_marker(self, name):
+        return self.marker if name == 'uncollectif' else None
+
+
+@pytest.fixture
+def evaluator():
+    return UncollectifEvaluator(FakeConfig())
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def marker(calls):
+    return pytest.mark.uncollectif(
+        lambda provider: calls.append(provider) or provider == 'rhv', reason='Not for rhv')
+
+
+def test_equal_values_evaluated_once(evaluator, marker, calls):
+    # other parameters of the items don't matter, the condition doesn't ask for them
+    assert not evaluator(FakeItem(marker, provider='rhv', browser='firefox'))
+    assert not evaluator(FakeItem(marker, provider='rhv', browser='chrome'))
+    assert calls == ['rhv']
+    cost = evaluator.costs[marker.args[0]]
+    assert (cost.items, cost.evaluations, cost.hits) == (2, 1, 1)
+
+
+def test_different_values_evaluated_again(evaluator, marker, calls):
+    assert not evaluator(FakeItem(marker, provider='rhv'))
+    assert evaluator(FakeItem(marker, provider='ec2'))
+    assert evaluator(FakeItem(marker, provider='ec2'))
+    assert calls == ['rhv', 'ec2']
+
+
+def test_unhashable_values_not_memoised(evaluator, calls):
+    marker = pytest.mark.uncollectif(
+        lambda providers: calls.append(providers) or 'rhv' in providers)
+    assert not evaluator(FakeItem(marker, providers=['rhv']))
+    assert not evaluator(FakeItem(marker, providers=['rhv']))
+    assert evaluator(FakeItem(marker, providers=['ec2']))
+    assert calls == [['rhv'], ['rhv'], ['ec2']]
+    assert evaluator.costs[marker.args[0]].evaluations == 3
+
+
+def test_already_uncollected(evaluator, marker, calls):
+    # an item without parameters although the condition asks for some
+    assert evaluator(FakeItem(marker)) is None
+    assert calls == []
+
+
+def test_no_marker(evaluator):
+    assert evaluator(FakeItem(None)) is True
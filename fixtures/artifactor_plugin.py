@@ -18,11 +18,25 @@
 ``reuse_dir`` if this is False and Artifactor comes across a dir that has
 already been used, it will die
 
+``hook_queue_size`` how many hooks may wait for delivery to the server. Hooks are sent from a
+background thread, so that slow artifactor plugins don't hold up the tests. A report build is
+not queued again while one is still waiting. When the queue is full, log messages are dropped
+and other hooks wait for a free slot.
+
+``spool_threshold`` contents of file dumps bigger than this many bytes are not sent to a local
+artifactor server, they are written to a spool dir in the artifact dir instead and the server
+just moves the file into place. Defaults to 64 KiB, 0 disables the spooling.
+
 
 """
 import atexit
+import base64
 import subprocess
-from threading import RLock
+import tempfile
+import time
+from collections import Counter
+from Queue import Empty, Full, Queue
+from threading import Lock, RLock, Thread
 
 import diaper
 import os
@@ -33,12 +47,22 @@ from cfme.utils.blockers import BZ, Blocker
 from cfme.utils.conf import env, credentials
 from cfme.utils.log import logger
 from cfme.utils.net import random_port, net_check
+from cfme.utils.path import log_path
 from cfme.utils.wait import wait_for
 from fixtures.pytest_store import write_line, store
 from markers.polarion import extract_polarion_ids
 
 UNDER_TEST = False  # set to true for artifactor using tests
 
+SPOOL_THRESHOLD = 64 * 1024
+LOCAL_ADDRESSES = {'127.0.0.1', 'localhost'}
+
+HOOK_QUEUE_SIZE = 1000
+#: Hooks dropped when the hook queue is full
+DROPPABLE_HOOKS = {'log_message'}
+#: Hooks sent only once however many times they are fired while one of them waits in the queue
+COALESCED_HOOKS = {'build_report'}
+
 
 # Create a list of all our passwords for use with the sanitize request later in this module
 # Filter out all Nones as it will mess the output up.
@@ -75,6 +99,126 @@ class DummyClient(object):
         return False
 
 
+class AsyncHookSender(object):
+    """Delivers hooks to the artifactor server from a background thread
+
+    Firing a hook only puts it on a bounded queue. The sender thread takes the hooks from the
+    queue in batches and fires them in order through the artifactor client.
+    :py:data:`COALESCED_HOOKS` are coalesced with the same hook if it is still waiting in the
+    queue, full or not. When the queue is full, :py:data:`DROPPABLE_HOOKS` are dropped and all
+    the other hooks block until there is space (backpressure).
+
+    Args:
+        client: The :py:class:`artifactor.ArtifactorClient` to deliver the hooks with
+        maxsize: Size of the queue
+        batch_size: Maximum number of hooks taken from the queue at once
+    """
+    def __init__(self, client, maxsize=HOOK_QUEUE_SIZE, batch_size=50):
+        self.client = client
+        self.batch_size = batch_size
+        self.queue = Queue(maxsize)
+        self.counts = Counter()
+        self.max_depth = 0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self._coalesced_pending = set()
+        self._lock = Lock()
+        self._closed = False
+        self._thread = Thread(target=self._run, name='artifactor-hook-sender')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __nonzero__(self):
+        return bool(self.client)
+
+    def fire_hook(self, hook, **hook_args):
+        if self._closed:
+            # Too late to queue anything, deliver directly
+            return self.client.fire_hook(hook, **hook_args)
+        if hook in COALESCED_HOOKS:
+            with self._lock:
+                if hook in self._coalesced_pending:
+                    self.counts['coalesced'] += 1
+                    return
+                self._coalesced_pending.add(hook)
+        item = hook, hook_args, time.time()
+        if hook in DROPPABLE_HOOKS:
+            try:
+                self.queue.put_nowait(item)
+            except Full:
+                self.counts['dropped'] += 1
+                return
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except Full:
+                self.counts['blocked'] += 1
+                self.queue.put(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            for hook, hook_args, queued_at in batch:
+                if hook is None:
+                    # close() was called
+                    return
+                if hook in COALESCED_HOOKS:
+                    with self._lock:
+                        self._coalesced_pending.discard(hook)
+                try:
+                    self.client.fire_hook(hook, **hook_args)
+                except Exception:
+                    self.counts['failed'] += 1
+                    if self.counts['failed'] == 1:
+                        logger.exception('Delivering artifactor hook %s failed', hook)
+                else:
+                    self.counts['sent'] += 1
+                latency = time.time() - queued_at
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        """Returns the queue depth and latency metrics of the hook delivery"""
+        delivered = self.counts['sent'] + self.counts['failed']
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'sent': self.counts['sent'],
+            'failed': self.counts['failed'],
+            'dropped': self.counts['dropped'],
+            'coalesced': self.counts['coalesced'],
+            'blocked': self.counts['blocked'],
+            'avg_latency': self.total_latency / delivered if delivered else 0.0,
+            'max_latency': self.max_latency,
+        }
+
+    def close(self):
+        """Delivers the queued hooks and stops the sender thread"""
+        if self._closed:
+            return
+        self.queue.put((None, None, time.time()))
+        self._thread.join()
+        self._closed = True
+        logger.info('Artifactor hook delivery: %r', self.stats())
+
+    def terminate(self):
+        self.close()
+        return self.client.terminate()
+
+    def task_status(self):
+        return self.client.task_status()
+
+
 def get_client(art_config, pytest_config):
     if art_config and not UNDER_TEST:
         port = getattr(pytest_config.option, 'artifactor_port', None) or \
@@ -129,6 +273,8 @@ def pytest_configure(config):
             func_kwargs={'force': True},
             num_sec=10, message="wait for artifactor to start")
         art_client.ready = True
+        art_client = AsyncHookSender(
+            art_client, maxsize=env.get('artifactor', {}).get('hook_queue_size', HOOK_QUEUE_SIZE))
     else:
         config._art_proc = None
     from cfme.utils.log import artifactor_handler
@@ -143,11 +289,42 @@ def merkyl_setup(request, appliance):
     fire_art_hook(request.config, 'setup_merkyl', ip=appliance.hostname)
 
 
+def spool_filedump(art_config, hook_args):
+    """Hands big file dump contents over to a local artifactor server as a spooled file
+
+    The contents are written to a spool dir in the artifact dir, which is on the same filesystem
+    as the artifacts, so the filedump plugin only renames the file into place instead of
+    receiving (and possibly base64 decoding) the contents over the socket.
+    """
+    threshold = art_config.get('spool_threshold', SPOOL_THRESHOLD)
+    contents = hook_args.get('contents')
+    if (not threshold or hook_args.get('dont_write') or
+            art_config.get('server_address') not in LOCAL_ADDRESSES or
+            not isinstance(contents, basestring) or len(contents) < threshold):
+        return hook_args
+    if hook_args.get('contents_base64'):
+        contents = base64.b64decode(contents)
+    elif isinstance(contents, unicode):
+        contents = contents.encode('utf-8')
+    artifact_dir = art_config.get('artifact_dir', log_path.join('artifacts').strpath)
+    spool_dir = os.path.join(artifact_dir, '.spool')
+    if not os.path.isdir(spool_dir):
+        with diaper:
+            os.makedirs(spool_dir)
+    fd, contents_path = tempfile.mkstemp(dir=spool_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(contents)
+    os.chmod(contents_path, 0o644)
+    return dict(hook_args, contents='', contents_base64=False, contents_path=contents_path)
+
+
 def fire_art_hook(config, hook, **hook_args):
     client = getattr(config, '_art_client', None)
     if client is None:
         assert UNDER_TEST, 'missing artifactor is only valid for inprocess tests'
     else:
+        if hook == 'filedump' and client:
+            hook_args = spool_filedump(env.get('artifactor', {}), hook_args)
         client.fire_hook(hook, **hook_args)
 
 
@@ -311,3 +488,7 @@ def shutdown(config):
                     proc = config._art_proc
                     if proc:
                         proc.wait()
+    client = getattr(config, '_art_client', None)
+    if isinstance(client, AsyncHookSender):
+        # Slaves don't terminate the server, but must not exit with hooks still queued
+        client.close()
@@ -14,6 +14,7 @@ import pytest
 
 from fixtures.pytest_store import store
 from cfme.utils.blockers import Blocker, BZ, GH
+from cfme.utils.log import logger
 
 
 @pytest.fixture(scope="function")
@@ -61,10 +62,41 @@ def pytest_addoption(parser):
                     default=False,
                     dest='list_blockers',
                     help='Specify to list the blockers (takes some time though).')
+    group.addoption('--no-blocker-prefetch',
+                    action='store_false',
+                    default=True,
+                    dest='blocker_prefetch',
+                    help='Do not load the Bugzilla blockers of the collected tests up front.')
+
+
+def prefetch_bugzilla_blockers(items):
+    """Loads all the Bugzilla blockers of the items with batched requests into the bug cache"""
+    bug_ids = set([])
+    for item in items:
+        for blocker in item._metadata.get("blockers", []):
+            if isinstance(blocker, int):
+                bug_ids.add(blocker)
+                continue
+            try:
+                blocker_object = Blocker.parse(blocker)
+            except ValueError:
+                continue
+            if isinstance(blocker_object, BZ):
+                bug_ids.add(blocker_object.bug_id)
+    if not bug_ids:
+        return
+    try:
+        BZ.bugzilla.prefetch(bug_ids)
+    except Exception as e:
+        # Blockers get loaded when the tests need them then
+        logger.warning("Could not prefetch Bugzilla blockers: %s: %s", type(e).__name__, e)
 
 
 @pytest.mark.trylast
 def pytest_collection_modifyitems(session, config, items):
+    # Slaves share the on-disk bug cache the master filled
+    if config.getvalue("blocker_prefetch") and not store.slave_manager:
+        prefetch_bugzilla_blockers(items)
     if not config.getvalue("list_blockers"):
         return
     store.terminalreporter.write("Loading blockers ...\n", bold=True)
@@ -8,15 +8,23 @@ The Workflow
   the number of needed slaves
 - Slaves are started
 - Master runs collection, blocks until slaves report their collections
-- Slaves each run collection and submit them to the master, then block inside their runtest loop,
-  waiting for tests to run
+- Master writes its collection to a snapshot, along with a digest of the collection inputs
+  (see :py:mod:`fixtures.parallelizer.snapshot`)
+- Slaves whose inputs match the snapshot digest skip collection and only collect the modules of
+  the tests they are sent; other slaves each run collection and submit them to the master.
+  Either way, they then block inside their runtest loop, waiting for tests to run
 - Master diffs slave collections against its own; the test ids are verified to match
   across all nodes
 - Master enters main runtest loop, uses a generator to build lists of test groups which are then
   sent to slaves, one group at a time
+- With ``--parallel-scheduler duration``, groups are sent longest first, using the test durations
+  recorded in the pytest cache by previous runs (see :py:mod:`fixtures.parallelizer.scheduler`)
 - For each phase of each test, the slave serializes test reports, which are then unserialized on
   the master and handed to the normal pytest reporting hooks, which is able to deal with test
   reports arriving out of order
+- Slaves stream reports and messages to the master in msgpack-encoded batches without waiting
+  for acknowledgement; only requests for tests, collection results and shutdown notices wait
+  for a reply
 - Before running the last test in a group, the slave will request more tests from the master
 
   - If more tests are received, they are run
@@ -30,7 +38,6 @@ from itertools import groupby
 
 
 import difflib
-import json
 import os
 import signal
 import subprocess
@@ -48,7 +55,9 @@ import zmq
 from _pytest import runner
 
 from fixtures import terminalreporter
-from fixtures.parallelizer import remote
+from fixtures.parallelizer import remote, snapshot
+from fixtures.parallelizer.scheduler import (
+    DurationHistory, ProviderAffinityPlanner, order_longest_first, split_tail)
 from fixtures.pytest_store import store
 from cfme.utils import at_exit, conf
 from cfme.utils.log import create_sublogger
@@ -63,6 +72,17 @@ if not conf.runtime['env'].get('ts'):
     conf.runtime['env']['ts'] = ts
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme')
+    group.addoption('--parallel-scheduler', dest='parallel_scheduler', default='module',
+        choices=['module', 'duration'],
+        help='How the parallelizer master orders test groups. "module" sends them in collection '
+             'order, "duration" sends the longest groups first based on recorded durations.')
+    group.addoption('--parallel-provider-capacity', dest='parallel_provider_capacity', type=int,
+        default=1, help='How many providers each parallelizer slave may have set up at once '
+                        'before its appliance gets cleansed of all providers.')
+
+
 def pytest_addhooks(pluginmanager):
     import hooks
     pluginmanager.add_hookspecs(hooks)
@@ -144,12 +164,15 @@ class ParallelSession(object):
         self.trdist = None
         self.slaves = {}
         self.test_groups = self._test_item_generator()
+        self.scheduler = config.getoption('parallel_scheduler')
+        # durations are always recorded so the history is ready when the scheduler is switched
+        self.durations = DurationHistory(config.cache)
 
         self._pool = []
         from cfme.utils.conf import cfme_data
-        self.provs = sorted(set(cfme_data['management_systems'].keys()),
-                            key=len, reverse=True)
-        self.used_prov = set()
+        self.planner = ProviderAffinityPlanner(
+            config.cache, cfme_data['management_systems'].keys(),
+            capacity=config.getoption('parallel_provider_capacity'))
 
         self.failed_slave_test_groups = deque()
         self.slave_spawn_count = 0
@@ -162,6 +185,7 @@ class ParallelSession(object):
         ctx = zmq.Context.instance()
         self.sock = ctx.socket(zmq.ROUTER)
         self.sock.bind(zmq_endpoint)
+        self._recv_queue = deque()
 
         # clean out old slave config if it exists
         slave_config = conf_path.join('slave_config.yaml')
@@ -232,20 +256,24 @@ class ParallelSession(object):
     def send(self, slave, event_data):
         """Send data to slave.
 
-        ``event_data`` will be serialized as JSON, and so must be JSON serializable
+        ``event_data`` will be serialized with msgpack, and so must be serializable
 
         """
-        event_json = json.dumps(event_data)
-        self.sock.send_multipart([slave.id, '', event_json])
+        self.sock.send_multipart([slave.id, '', remote.pack(event_data)])
 
     def recv(self):
-        # poll the zmq socket, populate the recv queue deque with responses
-
-        events = zmq.zmq_poll([(self.sock, zmq.POLLIN)], 50)
-        if not events:
-            return None, None, None
-        slaveid, _, event_json = self.sock.recv_multipart(flags=zmq.NOBLOCK)
-        event_data = json.loads(event_json)
+        # poll the zmq socket only when the recv queue is empty, then drain every batch
+        # of events that has arrived in the meantime into the recv queue
+        if not self._recv_queue:
+            if not self.sock.poll(50):
+                return None, None, None
+            while True:
+                try:
+                    slaveid, _, payload = self.sock.recv_multipart(flags=zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                self._recv_queue.extend((slaveid, event) for event in remote.unpack(payload))
+        slaveid, event_data = self._recv_queue.popleft()
         event_name = event_data.pop('_event_name')
         if slaveid not in self.slaves:
             self.log.error("message from terminated worker %s %s %s",
@@ -389,6 +417,15 @@ class ParallelSession(object):
         # Build master collection for slave diffing and distribution
         self.collection = [item.nodeid for item in self.session.items]
 
+        # Snapshot the collection so slaves seeing the same inputs don't have to repeat it
+        self.collection_digest = snapshot.inputs_digest(store.current_appliance.version)
+        snapshot_path = self.config.cache.makedir('parallelize').join(
+            '{}-collection.json'.format(os.getpid()))
+        snapshot.write_snapshot(snapshot_path, self.collection_digest, self.collection)
+        at_exit(snapshot_path.remove)
+        conf.runtime['slave_config']['collection_snapshot'] = snapshot_path.strpath
+        conf.save('slave_config')
+
         # Fire up the workers after master collection is complete
         # master and the first slave share an appliance, this is a workaround to prevent a slave
         # from altering an appliance while master collection is still taking place
@@ -420,13 +457,20 @@ class ParallelSession(object):
                     markup = event_data.pop('markup')
                     # messages are special, handle them immediately
                     self.print_message(message, slave, **markup)
-                    self.ack(slave, event_name)
                 elif event_name == 'collectionfinish':
-                    slave_collection = event_data['node_ids']
-                    # compare slave collection to the master, all test ids must be the same
-                    self.log.debug('diffing {} collection'.format(slave.id))
-                    diff_err = report_collection_diff(
-                        slave.id, self.collection, slave_collection)
+                    if 'digest' in event_data:
+                        # slave uses the collection snapshot, the inputs must be the same
+                        if event_data['digest'] == self.collection_digest:
+                            diff_err = None
+                        else:
+                            diff_err = '{} collection snapshot digest differs\n'.format(
+                                slave.id)
+                    else:
+                        slave_collection = event_data['node_ids']
+                        # compare slave collection to the master, all test ids must be the same
+                        self.log.debug('diffing {} collection'.format(slave.id))
+                        diff_err = report_collection_diff(
+                            slave.id, self.collection, slave_collection)
                     if diff_err:
                         self.print_message(
                             'collection differs, respawning', slave.id,
@@ -441,19 +485,18 @@ class ParallelSession(object):
                     self.send_tests(slave)
                     self.log.info('starting master test distribution')
                 elif event_name == 'runtest_logstart':
-                    self.ack(slave, event_name)
                     self.trdist.runtest_logstart(
                         slave.id,
                         event_data['nodeid'],
                         event_data['location'])
                 elif event_name == 'runtest_logreport':
-                    self.ack(slave, event_name)
                     report = unserialize_report(event_data['report'])
+                    self.durations.record(report)
+                    self.planner.record(slave, report)
                     if report.when in ('call', 'teardown'):
                         slave.tests.discard(report.nodeid)
                     self.trdist.runtest_logreport(slave.id, report)
                 elif event_name == 'internalerror':
-                    self.ack(slave, event_name)
                     self.print_message(event_data['message'], slave, purple=True)
                     self.kill(slave)
                 elif event_name == 'shutdown':
@@ -481,6 +524,15 @@ class ParallelSession(object):
         # Suppress other runtestloop calls
         return True
 
+    def pytest_sessionfinish(self):
+        recorded = self.durations.save()
+        self.log.info('recorded durations for {} tests'.format(recorded))
+        self.planner.save()
+        self.print_message(self.planner.summary())
+        for slaveid in sorted(self.planner.adds):
+            self.log.info('{}: {} provider adds, {} cleanses'.format(
+                slaveid, self.planner.adds[slaveid], self.planner.cleanses[slaveid]))
+
     def _test_item_generator(self):
         for tests in self._modscope_item_generator():
             yield tests
@@ -520,68 +572,37 @@ class ParallelSession(object):
                 yield tests
 
     def get(self, slave):
-
-        def provs_of_tests(test_group):
-            found = set()
-            for test in test_group:
-                found.update(pv for pv in self.provs
-                             if '[' in test and pv in test)
-            return sorted(found)
-
         if not self._pool:
-            for test_group in self.test_groups:
-                self._pool.append(test_group)
-                self.used_prov.update(provs_of_tests(test_group))
-            if self.used_prov:
-                self.ratio = float(len(self.slaves)) / len(self.used_prov)
-            else:
-                self.ratio = 0.0
+            self._pool.extend(self.test_groups)
+            if self.scheduler == 'duration':
+                order_longest_first(self._pool, self.durations)
         if not self._pool:
             return []
-        appliance_num_limit = 1
-        for idx, test_group in enumerate(self._pool):
-            provs = provs_of_tests(test_group)
-            if provs:
-                prov = provs[0]
-                if prov in slave.provider_allocation:
-                    # provider is already with the slave, so just return the tests
-                    self._pool.remove(test_group)
-                    return test_group
-                else:
-                    if len(slave.provider_allocation) >= appliance_num_limit:
-                        continue
-                    else:
-                        # Adding provider to slave since there are not too many
-                        slave.provider_allocation.append(prov)
-                        self._pool.remove(test_group)
-                        return test_group
-            else:
-                # No providers - ie, not a provider parametrized test
-                # or no params, so not parametrized at all
-                self._pool.remove(test_group)
-                return test_group
-
-        # Here means no tests were able to be sent
-        for test_group in self._pool:
-
-            provs = provs_of_tests(test_group)
-            if provs:
-                prov = provs[0]
-                # Already too many slaves with provider
-                app = slave.appliance
-                self.print_message(
-                    'cleansing appliance', slave, purple=True)
-                try:
-                    app.delete_all_providers()
-                except Exception as e:
-                    self.print_message(
-                        'cloud not cleanse', slave, red=True)
-                    self.print_message('error:', e, red=True)
+        if self.scheduler == 'duration':
+            # the asking slave and those with nothing pending are the ones that would wait
+            idle_slaves = sum(
+                1 for other in self.slaves.values() if other is slave or not other.tests)
+            split_tail(self._pool, self.durations, idle_slaves)
+
+        idx, prov, rank = self.planner.plan(slave, self._pool, self.slaves.values())
+        test_group = self._pool.pop(idx)
+        planner = self.planner
+        if rank in (planner.ADD_NEW, planner.ADD_DUPLICATE):
+            # Adding provider to slave since there are not too many
+            slave.provider_allocation.append(prov)
+            planner.provider_added(slave, prov, test_group)
+        elif rank in (planner.CLEANSE_NEW, planner.CLEANSE_DUPLICATE):
+            # Already too many providers on the slave, start from a clean appliance
+            self.print_message(
+                'cleansing appliance to make room for {}'.format(prov), slave, purple=True)
+            try:
+                slave.appliance.delete_all_providers()
+            except Exception as e:
+                self.print_message('could not cleanse', slave, red=True)
+                self.print_message('error: {}'.format(e), slave, red=True)
             slave.provider_allocation = [prov]
-            self._pool.remove(test_group)
-            return test_group
-        assert not self._pool, self._pool
-        return []
+            planner.provider_added(slave, prov, test_group, cleansed=True)
+        return test_group
 
 
 def report_collection_diff(slaveid, from_collection, to_collection):
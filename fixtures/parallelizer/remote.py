@@ -1,44 +1,92 @@
 import json
 import signal
 
+import msgpack
+import pytest
 import zmq
+from _pytest import runner
 from py.path import local
 
 import cfme.utils
 from cfme.utils import log
 from cfme.utils.appliance import get_or_create_current_appliance
 from fixtures.log import _test_status, _format_nodeid
+from fixtures.parallelizer import snapshot
 
 SLAVEID = None
 
+#: How many fire-and-forget events a slave buffers before sending them to the master
+EVENT_BATCH_SIZE = 50
+
+
+def pack(data):
+    """Encode parallelizer events for the wire"""
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def unpack(payload):
+    """Decode parallelizer events from the wire"""
+    return msgpack.unpackb(payload, encoding='utf-8')
+
 
 class SlaveManager(object):
     """SlaveManager which coordinates with the master process for parallel testing"""
-    def __init__(self, config, slaveid, appliance_config, zmq_endpoint):
+    def __init__(self, config, slaveid, appliance_config, zmq_endpoint,
+                 collection_snapshot=None):
         self.config = config
         self.session = None
         self.collection = None
+        self.collection_snapshot = collection_snapshot
+        # set when the master's collection snapshot is trusted; only the modules of the tests
+        # received are collected then
+        self.lazy_collection = False
+        self._collected_modules = set()
         self.slaveid = conf.runtime['env']['slaveid'] = slaveid
         self.appliance_config = conf.runtime['env']['appliances'][0] = appliance_config
         self.log = cfme.utils.log.logger
         conf.clear()
         # Override the logger in utils.log
 
+        # events are streamed to the master without waiting for acks; the high water mark
+        # makes sends block if the master falls too far behind
         ctx = zmq.Context.instance()
-        self.sock = ctx.socket(zmq.REQ)
-        self.sock.set_hwm(1)
+        self.sock = ctx.socket(zmq.DEALER)
+        self.sock.set_hwm(1000)
         self.sock.setsockopt_string(zmq.IDENTITY, u'{}'.format(self.slaveid))
         self.sock.connect(zmq_endpoint)
 
         self.messages = {}
+        self._event_batch = []
 
         self.quit_signaled = False
 
+    def post_event(self, name, flush=False, **kwargs):
+        """Queue an event for the master without waiting for a reply
+
+        Queued events are sent in batches, when ``flush`` is set, when the batch is full
+        or before the next :py:meth:`send_event`.
+
+        """
+        kwargs['_event_name'] = name
+        self.log.trace("posting {} {!r}".format(name, kwargs))
+        self._event_batch.append(kwargs)
+        if flush or len(self._event_batch) >= EVENT_BATCH_SIZE:
+            self.flush_events()
+
+    def flush_events(self):
+        """Send all queued events to the master in one message"""
+        if self._event_batch:
+            batch, self._event_batch = self._event_batch, []
+            self.sock.send_multipart([b'', pack(batch)])
+
     def send_event(self, name, **kwargs):
+        """Send an event to the master and wait for its reply"""
         kwargs['_event_name'] = name
         self.log.trace("sending {} {!r}".format(name, kwargs))
-        self.sock.send_json(kwargs)
-        recv = self.sock.recv_json()
+        self._event_batch.append(kwargs)
+        self.flush_events()
+        _, payload = self.sock.recv_multipart()
+        recv = unpack(payload)
         if recv == 'die':
             self.log.info('Slave instructed to die by master; shutting down')
             raise SystemExit()
@@ -49,7 +97,31 @@ class SlaveManager(object):
 
     def message(self, message, **kwargs):
         """Send a message to the master, which should get printed to the console"""
-        self.send_event('message', message=message, markup=kwargs)  # message!
+        self.post_event('message', flush=True, message=message, markup=kwargs)  # message!
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection(self, session):
+        """pytest collection hook
+
+        - Skips collection if the master's collection snapshot was made from the same inputs
+          this slave sees; the modules of the tests are then collected as they are received
+
+        """
+        if not self.collection_snapshot:
+            return
+        digest = snapshot.inputs_digest(get_or_create_current_appliance().version)
+        node_ids = snapshot.load_snapshot(self.collection_snapshot, digest)
+        if node_ids is None:
+            self.log.info('collection snapshot does not match, running full collection')
+            return
+        self.log.info('using collection snapshot of {} tests'.format(len(node_ids)))
+        self.lazy_collection = True
+        self.session = session
+        self.collection = {}
+        session.items = []
+        terminalreporter.disable()
+        self.send_event("collectionfinish", digest=digest)
+        return True
 
     def pytest_collection_finish(self, session):
         """pytest collection hook
@@ -59,17 +131,53 @@ class SlaveManager(object):
         """
         self.log.debug('collection finished')
         self.session = session
+        if self.lazy_collection:
+            # a batch of modules collected by _collect_modules
+            self.collection.update((item.nodeid, item) for item in session.items)
+            return
         self.collection = {item.nodeid: item for item in session.items}
         terminalreporter.disable()
         self.send_event("collectionfinish", node_ids=self.collection.keys())
 
+    def _collect_modules(self, node_ids):
+        """Collect the modules of the given tests which were not collected yet
+
+        Used instead of the collection skipped in favour of the collection snapshot, so the
+        slave only ever collects the modules it runs tests from. The regular collection is used,
+        so the collection hooks (modifyitems, finish) run once over the items of every module.
+
+        """
+        modules = {nodeid.split('::')[0] for nodeid in node_ids} - self._collected_modules
+        if not modules:
+            return
+        self._collected_modules.update(modules)
+        self.log.info('collecting {} modules'.format(len(modules)))
+        self.session.perform_collect(
+            args=[self.config.rootdir.join(module).strpath for module in sorted(modules)])
+
+    def _report_not_collected(self, nodeid):
+        """Report a test the master sent but this slave doesn't have as an error
+
+        The master then stops waiting for it, like for any other finished test.
+
+        """
+        location = (nodeid.split('::')[0], None, nodeid)
+        longrepr = '{} was not collected by {}'.format(nodeid, self.slaveid)
+        self.message(longrepr, red=True)
+        self.post_event("runtest_logstart", nodeid=nodeid, location=location)
+        for when, outcome in (('setup', 'failed'), ('teardown', 'passed')):
+            report = runner.TestReport(
+                nodeid, location, {}, outcome, longrepr if outcome == 'failed' else None, when)
+            self.post_event("runtest_logreport", flush=when == 'teardown',
+                            report=serialize_report(report))
+
     def pytest_runtest_logstart(self, nodeid, location):
         """pytest runtest logstart hook
 
         - sends logstart notice to the master
 
         """
-        self.send_event("runtest_logstart", nodeid=nodeid, location=location)
+        self.post_event("runtest_logstart", flush=True, nodeid=nodeid, location=location)
 
     def pytest_runtest_logreport(self, report):
         """pytest runtest logreport hook
@@ -77,7 +185,8 @@ class SlaveManager(object):
         - sends serialized log reports to the master
 
         """
-        self.send_event("runtest_logreport", report=serialize_report(report))
+        self.post_event("runtest_logreport", flush=report.when == 'teardown',
+                        report=serialize_report(report))
         if report.when == 'teardown':
             path, lineno, domaininfo = report.location
             test_status = _test_status(_format_nodeid(report.nodeid, False))
@@ -112,7 +221,7 @@ class SlaveManager(object):
         self.log.error(msg)
         # Only send the last line (exc type/message) to keep the pytest log clean
         short_tb = 'INTERNALERROR> {}'.format(msg.strip().splitlines()[-1])
-        self.send_event("internalerror", message=short_tb)
+        self.post_event("internalerror", flush=True, message=short_tb)
 
     def pytest_runtestloop(self, session):
         """pytest runtest loop
@@ -157,9 +266,16 @@ class SlaveManager(object):
             node_ids = self.send_event('need_tests')
             if not node_ids:
                 break
+            if self.lazy_collection:
+                self._collect_modules(node_ids)
             for nodeid in node_ids:
                 # TODO: take non-unique node ids into account
-                yield self.collection[nodeid]
+                try:
+                    yield self.collection[nodeid]
+                except KeyError:
+                    if not self.lazy_collection:
+                        raise
+                    self._report_not_collected(nodeid)
 
 
 def serialize_report(rep):
@@ -245,7 +361,7 @@ if __name__ == '__main__':
         conf.runtime["cfme_data"]["basic_info"]["appliances_provider"] = provider_name
     config = _init_config(slave_options, slave_args)
     slave_manager = SlaveManager(config, args.slaveid, appliance_config,
-        conf.slave_config['zmq_endpoint'])
+        conf.slave_config['zmq_endpoint'], conf.slave_config.get('collection_snapshot'))
     config.pluginmanager.register(slave_manager, 'slave_manager')
     config.hook.pytest_cmdline_main(config=config)
     signal.signal(signal.SIGQUIT, slave_manager.handle_quit)
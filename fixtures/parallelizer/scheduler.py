@@ -0,0 +1,228 @@
+"""Duration-aware scheduling helpers for the parallelizer master
+
+The master receives every test report a slave produces, so it knows how long each phase of each
+test took. :py:class:`DurationHistory` keeps those timings in the pytest cache between runs, and
+the ``duration`` scheduler uses them to hand out the most expensive test groups first (classic
+longest-processing-time scheduling). When there are fewer groups left than slaves asking for work,
+the biggest remaining group is split so idle slaves can take part of it instead of waiting for
+one slave to finish a long module on its own.
+
+:py:class:`ProviderAffinityPlanner` decides which group a slave gets next with respect to the
+providers the slave's appliance already has set up, so providers are added (and appliances
+cleansed) as rarely as possible. Provider setup costs are measured from the setup phase of the
+first test run after a provider was assigned, and are kept in the pytest cache as well.
+
+"""
+from __future__ import division
+
+from collections import Counter, defaultdict
+
+
+class DurationHistory(object):
+    """Per-nodeid test durations, persisted in the pytest cache
+
+    Args:
+        cache: pytest ``config.cache`` instance used to load and store the history
+        weight: How much a new measurement counts against the stored one (0 < weight <= 1)
+        default: Estimate used for unknown tests when no history exists at all
+
+    """
+    cache_key = 'parallelize/durations'
+
+    def __init__(self, cache, weight=0.5, default=1.0):
+        self.cache = cache
+        self.weight = weight
+        self.default = default
+        self.durations = dict(cache.get(self.cache_key, {}))
+        self._current = defaultdict(float)
+        self._fallback = None
+
+    def record(self, report):
+        """Add the duration of a test report phase to this run's measurements"""
+        self._current[report.nodeid] += getattr(report, 'duration', 0) or 0
+
+    @property
+    def fallback(self):
+        """Estimate for tests with no history; the median of all known durations"""
+        if self._fallback is None:
+            known = sorted(self.durations.values())
+            if known:
+                self._fallback = known[len(known) // 2]
+            else:
+                self._fallback = self.default
+        return self._fallback
+
+    def estimate(self, nodeid):
+        return self.durations.get(nodeid, self.fallback)
+
+    def group_cost(self, tests):
+        return sum(self.estimate(nodeid) for nodeid in tests)
+
+    def save(self):
+        """Merge this run's measurements into the history and write it to the cache
+
+        Returns:
+            The number of tests whose duration was recorded in this run
+        """
+        for nodeid, duration in self._current.items():
+            if nodeid in self.durations:
+                old = self.durations[nodeid]
+                self.durations[nodeid] = old + self.weight * (duration - old)
+            else:
+                self.durations[nodeid] = duration
+        self.cache.set(self.cache_key, self.durations)
+        recorded = len(self._current)
+        self._current.clear()
+        self._fallback = None
+        return recorded
+
+
+def order_longest_first(groups, history):
+    """Sort test groups in place, most expensive first"""
+    groups.sort(key=history.group_cost, reverse=True)
+
+
+def split_tail(groups, history, idle_slaves):
+    """Split the most expensive group while there are fewer groups than slaves wanting work
+
+    ``groups`` must already be ordered longest first; it is modified in place and kept ordered.
+    Groups are split on test boundaries, balancing the estimated cost of both halves.
+
+    """
+    while groups and len(groups) < idle_slaves:
+        head = groups[0]
+        if len(head) < 2:
+            break
+        total = history.group_cost(head)
+        running = 0
+        for idx, nodeid in enumerate(head[:-1], 1):
+            running += history.estimate(nodeid)
+            if running >= total / 2:
+                break
+        groups[0:1] = [head[:idx], head[idx:]]
+        order_longest_first(groups, history)
+
+
+class ProviderAffinityPlanner(object):
+    """Assigns provider-parametrized test groups to slaves, minimizing provider setup churn
+
+    Args:
+        cache: pytest ``config.cache`` instance used to load and store provider setup costs
+        provider_keys: All provider keys known in ``cfme_data``
+        capacity: How many providers a slave's appliance may have set up at the same time
+        weight: How much a new cost measurement counts against the stored one
+        default_cost: Setup cost estimate (in seconds) for providers never measured
+
+    """
+    cache_key = 'parallelize/provider_costs'
+
+    # ranks of the ways a group can be handed to a slave, cheapest first
+    KEEP, ADD_NEW, NO_PROVIDER, ADD_DUPLICATE, CLEANSE_NEW, CLEANSE_DUPLICATE = range(6)
+
+    def __init__(self, cache, provider_keys, capacity=1, weight=0.5, default_cost=60.0):
+        self.cache = cache
+        # longest keys first, so that a key which is a prefix of another one doesn't shadow it
+        self.provider_keys = sorted(set(provider_keys), key=len, reverse=True)
+        self.capacity = capacity
+        self.weight = weight
+        self.default_cost = default_cost
+        self.add_costs = dict(cache.get(self.cache_key, {}))
+        self.adds = Counter()
+        self.cleanses = Counter()
+        self._test_providers = {}
+        self._pending_measurements = {}
+
+    def providers_of(self, tests):
+        found = set()
+        for nodeid in tests:
+            if nodeid not in self._test_providers:
+                self._test_providers[nodeid] = self._match_providers(nodeid)
+            found.update(self._test_providers[nodeid])
+        return sorted(found)
+
+    def _match_providers(self, nodeid):
+        if '[' not in nodeid:
+            return set()
+        params = nodeid.split('[', 1)[1]
+        matched = set()
+        for key in self.provider_keys:
+            if key in params:
+                matched.add(key)
+                params = params.replace(key, '')
+        return matched
+
+    def provider_of(self, tests):
+        providers = self.providers_of(tests)
+        return providers[0] if providers else None
+
+    def add_cost(self, provider):
+        return self.add_costs.get(provider, self.default_cost)
+
+    def plan(self, slave, pool, slaves):
+        """Pick the cheapest group from ``pool`` for ``slave``
+
+        Groups are compared by the provider work they cause on the slave's appliance; among
+        equally ranked groups the pool order wins, except that when a provider is going to be
+        set up on more than one appliance the cheaper provider is preferred.
+
+        Returns:
+            A ``(index, provider, rank)`` tuple, or ``None`` if the pool is empty
+        """
+        held = slave.provider_allocation
+        holders = Counter(
+            provider for other in slaves for provider in other.provider_allocation)
+        has_capacity = len(held) < self.capacity
+        best = None
+        for idx, tests in enumerate(pool):
+            provider = self.provider_of(tests)
+            if provider is None:
+                rank = self.NO_PROVIDER
+            elif provider in held:
+                rank = self.KEEP
+            elif has_capacity:
+                rank = self.ADD_DUPLICATE if holders[provider] else self.ADD_NEW
+            else:
+                rank = self.CLEANSE_DUPLICATE if holders[provider] else self.CLEANSE_NEW
+            if rank in (self.ADD_DUPLICATE, self.CLEANSE_DUPLICATE):
+                key = (rank, self.add_cost(provider), idx)
+            else:
+                key = (rank, 0, idx)
+            if best is None or key < best[0]:
+                best = (key, idx, provider, rank)
+            if rank == self.KEEP:
+                break
+        if best is None:
+            return None
+        key, idx, provider, rank = best
+        return idx, provider, rank
+
+    def provider_added(self, slave, provider, tests, cleansed=False):
+        """Account for a provider being assigned to a slave with the given group of tests"""
+        self.adds[slave.id] += 1
+        if cleansed:
+            self.cleanses[slave.id] += 1
+        if tests:
+            self._pending_measurements[slave.id] = (provider, tests[0])
+
+    def record(self, slave, report):
+        """Measure provider setup cost from the setup phase of a freshly assigned group"""
+        try:
+            provider, nodeid = self._pending_measurements[slave.id]
+        except KeyError:
+            return
+        if report.nodeid != nodeid or report.when != 'setup':
+            return
+        del self._pending_measurements[slave.id]
+        duration = getattr(report, 'duration', 0) or 0
+        if provider in self.add_costs:
+            old = self.add_costs[provider]
+            self.add_costs[provider] = old + self.weight * (duration - old)
+        else:
+            self.add_costs[provider] = duration
+
+    def save(self):
+        self.cache.set(self.cache_key, self.add_costs)
+
+    def summary(self):
+        return 'provider adds: {}, appliance cleanses: {}'.format(
+            sum(self.adds.values()), sum(self.cleanses.values()))
@@ -0,0 +1,81 @@
+"""Collection snapshots shared by the parallelizer master and its slaves
+
+The master collects the whole test suite once. Before any slave is started, it writes the
+collected node ids to a snapshot file, together with a digest of everything that collection
+depends on: the python sources in the project, the yaml configuration and the appliance version.
+
+A slave recomputes the digest on startup. If it matches, the slave trusts the master's collection:
+it doesn't send its node ids for diffing and starts asking for work right away. It only collects
+the modules of the tests it is sent, each of them once. Tests it then doesn't have are reported
+as errors.
+If it doesn't match (sources or conf changed under a running session), the slave falls back to a
+full collection which the master diffs against its own.
+
+"""
+import hashlib
+import json
+import os
+
+from cfme.utils.path import conf_path, project_path
+
+#: Top-level directories of the project which never influence collection
+IGNORED_DIRS = {'log', 'docs', 'notebooks', 'results', 'data'}
+
+
+def _iter_sources():
+    for dirpath, dirnames, filenames in os.walk(project_path.strpath):
+        if dirpath == project_path.strpath:
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.endswith('.py'):
+                yield os.path.join(dirpath, filename)
+
+
+def _iter_conf_files():
+    for path in sorted(conf_path.listdir(lambda p: p.ext in ('.yaml', '.eyaml'))):
+        # runtime conf files (slave config, ui-coverage, ...) are written during the session
+        if not path.basename.startswith(('.', 'slave_config')):
+            yield path
+
+
+def inputs_digest(appliance_version):
+    """Digest of everything the collection depends on
+
+    Sources are identified by their path, size and modification time, conf files by content.
+
+    """
+    digest = hashlib.sha1()
+    digest.update(str(appliance_version).encode('utf-8'))
+    for source in _iter_sources():
+        stat = os.stat(source)
+        digest.update('{}:{}:{}\n'.format(
+            os.path.relpath(source, project_path.strpath), stat.st_size,
+            stat.st_mtime).encode('utf-8'))
+    for path in _iter_conf_files():
+        digest.update(path.basename.encode('utf-8'))
+        digest.update(path.read('rb'))
+    return digest.hexdigest()
+
+
+def write_snapshot(path, digest, node_ids):
+    """Write the master's collection snapshot for the slaves to pick up"""
+    with open(str(path), 'w') as snapshot:
+        json.dump({'digest': digest, 'node_ids': list(node_ids)}, snapshot)
+
+
+def load_snapshot(path, digest):
+    """Load a collection snapshot
+
+    Returns:
+        The snapshot's node ids, or ``None`` if the snapshot is missing or was made from
+        different inputs than ``digest`` describes
+    """
+    try:
+        with open(str(path)) as snapshot:
+            data = json.load(snapshot)
+    except (IOError, ValueError):
+        return None
+    if data.get('digest') != digest:
+        return None
+    return data['node_ids']
@@ -52,10 +52,18 @@ Note:
 
 """
 import inspect
+import os
+import time
+from collections import defaultdict
+
 import pytest
+from cached_property import cached_property
 
 MARKDECORATOR_TYPE = type(pytest.mark.slip)
 
+#: How many of the most expensive ``uncollectif`` conditions are reported after collection
+COST_REPORT_SIZE = 10
+
 
 # work around https://github.com/pytest-dev/pytest/issues/2400
 def get_uncollect_function(marker_or_markdecorator):
@@ -65,37 +73,98 @@ def get_uncollect_function(marker_or_markdecorator):
         return list(marker_or_markdecorator)[0].args[0]
 
 
-def uncollectif(item):
-    """ Evaluates if an item should be uncollected
+class MarkerCost(object):
+    """Evaluation statistics of one ``uncollectif`` condition"""
+    def __init__(self):
+        self.items = 0
+        self.evaluations = 0
+        self.seconds = 0.0
 
-    Tests markers against a supplied lambda from the marker object to determine
-    if the item should be uncollected or not.
+    @property
+    def hits(self):
+        return self.items - self.evaluations
+
+
+def condition_name(condition):
+    """Identifies an ``uncollectif`` condition by the place it is defined at"""
+    code = getattr(condition, '__code__', None)
+    if code is None:
+        return repr(condition)
+    from cfme.utils.path import project_path
+    return '{}:{}'.format(
+        os.path.relpath(code.co_filename, project_path.strpath), code.co_firstlineno)
+
+
+class UncollectifEvaluator(object):
+    """Evaluates ``uncollectif`` markers, reusing whatever can be reused between items
+
+    The argument names of every condition are read only once. Results are memoised on the
+    condition, the values of the arguments it asks for and the appliance version, so a condition
+    shared by thousands of parametrized items is only evaluated once per distinct combination of
+    the values it actually looks at.
+
+    Registered as a plugin, it reports the cost of the conditions once collection is finished.
     """
+    def __init__(self, config):
+        self.config = config
+        self._arg_names = {}
+        self._results = {}
+        self.costs = defaultdict(MarkerCost)
+
+    @cached_property
+    def global_vars(self):
+        holder = self.config.pluginmanager.getplugin('appliance-holder')
+        if holder:
+            return {'appliance': holder.held_appliance}
+        else:
+            return {}
 
-    from cfme.utils.pytest_shortcuts import extract_fixtures_values
-    marker = item.get_marker('uncollectif')
-    if marker:
+    @cached_property
+    def appliance_version(self):
+        if 'appliance' not in self.global_vars:
+            return None
+        try:
+            return str(self.global_vars['appliance'].version)
+        except Exception:
+            # conditions that need the version will fail on their own
+            return None
+
+    def arg_names(self, condition):
+        """Argument names of the condition, ``None`` if it is not a callable"""
+        if condition not in self._arg_names:
+            try:
+                self._arg_names[condition] = inspect.getargspec(condition).args
+            except TypeError:
+                self._arg_names[condition] = None
+        return self._arg_names[condition]
+
+    def __call__(self, item):
+        """ Evaluates if an item should be uncollected
+
+        Returns:
+            A falsy value if the item should be uncollected
+        """
+        from cfme.utils.pytest_shortcuts import extract_fixtures_values
+        marker = item.get_marker('uncollectif')
+        if not marker:
+            return True
         from cfme.utils.log import logger
         log_msg = 'Trying uncollecting {}: {}'.format(
             item.name,
             marker.kwargs.get('reason', 'No reason given'))
 
-        try:
-            arg_names = inspect.getargspec(get_uncollect_function(marker)).args
-        except TypeError:
+        condition = get_uncollect_function(marker)
+        arg_names = self.arg_names(condition)
+        if arg_names is None:
             logger.debug(log_msg)
             return not bool(marker.args[0])
 
-        holder = item.config.pluginmanager.getplugin('appliance-holder')
-        if holder:
-            global_vars = {'appliance': holder.held_appliance}
-        else:
+        if not self.global_vars:
             logger.info("while uncollecting %s - appliance not known", item)
-            global_vars = {}
 
         try:
             values = extract_fixtures_values(item)
-            values.update(global_vars)
+            values.update(self.global_vars)
             # The test has already been uncollected
             if arg_names and not values:
                 return
@@ -109,12 +178,63 @@ def uncollectif(item):
             else:
                 raise Exception("Failed to uncollect {}, best guess a fixture wasn't "
                                 "ready".format(func_name))
-        retval = marker.args[0](*args)
+
+        cost = self.costs[condition]
+        cost.items += 1
+        key = (condition, tuple(args), self.appliance_version)
+        try:
+            hash(key)
+        except TypeError:
+            # some argument values are not hashable, no memoising for these
+            key = None
+        if key is None or key not in self._results:
+            started = time.time()
+            retval = condition(*args)
+            cost.evaluations += 1
+            cost.seconds += time.time() - started
+            if key is not None:
+                self._results[key] = retval
+        else:
+            retval = self._results[key]
         if retval:
             logger.debug(log_msg)
         return not retval
-    else:
-        return True
+
+    def report(self, terminalreporter=None):
+        """Logs the cost of all conditions and shows the most expensive ones in the terminal"""
+        from cfme.utils.log import logger
+        costs = sorted(self.costs.items(), key=lambda cost: cost[1].seconds, reverse=True)
+        lines = [
+            '  {}: {} items, {} evaluated, {} cached, {:.3f}s'.format(
+                condition_name(condition), cost.items, cost.evaluations, cost.hits, cost.seconds)
+            for condition, cost in costs]
+        total = sum(cost.seconds for condition, cost in costs)
+        header = 'uncollectif: {} conditions, {} items, {} evaluated, {:.2f}s'.format(
+            len(costs), sum(cost.items for condition, cost in costs),
+            sum(cost.evaluations for condition, cost in costs), total)
+        logger.info('%s\n%s', header, '\n'.join(lines))
+        if terminalreporter is not None and costs:
+            terminalreporter.write('{}\n'.format(header), bold=True)
+            for line in lines[:COST_REPORT_SIZE]:
+                terminalreporter.write('{}\n'.format(line))
+
+    def pytest_collection_finish(self, session):
+        self.report(session.config.pluginmanager.getplugin('terminalreporter'))
+
+
+def uncollectif(item, evaluator=None):
+    """ Evaluates if an item should be uncollected
+
+    Tests markers against a supplied lambda from the marker object to determine
+    if the item should be uncollected or not.
+
+    Args:
+        item: py.test test item
+        evaluator: :py:class:`UncollectifEvaluator` to use, allows reusing its cache
+    """
+    if evaluator is None:
+        evaluator = UncollectifEvaluator(item.config)
+    return evaluator(item)
 
 
 def pytest_collection_modifyitems(session, config, items):
@@ -123,11 +243,16 @@ def pytest_collection_modifyitems(session, config, items):
 
     new_items = []
 
+    evaluator = config.pluginmanager.getplugin('uncollectif-evaluator')
+    if evaluator is None:
+        evaluator = UncollectifEvaluator(config)
+        config.pluginmanager.register(evaluator, 'uncollectif-evaluator')
+
     from cfme.utils.path import log_path
     with log_path.join('uncollected.log').open('w') as f:
         for item in items:
             # First filter out all items who have the uncollect mark
-            if item.get_marker('uncollect') or not uncollectif(item):
+            if item.get_marker('uncollect') or not uncollectif(item, evaluator):
                 # if a uncollect marker has been added,
                 # give it priority for the explanation
                 uncollect = item.get_marker('uncollect')
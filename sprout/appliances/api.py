@@ -16,6 +16,7 @@ from appliances.models import (
 from appliances.tasks import (
     appliance_power_on, appliance_power_off, appliance_suspend, appliance_rename,
     connect_direct_lun, disconnect_direct_lun, mark_appliance_ready, wait_appliance_ready)
+from sprout import redis, settings
 from sprout.log import create_logger
 
 
@@ -23,34 +24,76 @@ def json_response(data):
     return HttpResponse(json.dumps(data), content_type="application/json")
 
 
-def json_exception(e):
-    return json_response({
+def exception_result(e):
+    return {
         "status": "exception",
         "result": {
             "class": type(e).__name__,
             "message": str(e)
         }
-    })
+    }
 
 
-def json_autherror(message):
-    return json_response({
+def autherror_result(message):
+    return {
         "status": "autherror",
         "result": {
             "message": str(message)
         }
-    })
+    }
 
 
-def json_success(result):
-    return json_response({
+def success_result(result):
+    return {
         "status": "success",
         "result": result
-    })
+    }
+
+
+def json_exception(e):
+    return json_response(exception_result(e))
+
+
+def json_autherror(message):
+    return json_response(autherror_result(message))
+
+
+def json_success(result):
+    return json_response(success_result(result))
+
+
+class JSONAuthError(Exception):
+    pass
+
+
+class JSONAuth(object):
+    """Credentials of a request, checked against the database at most once per request."""
+    def __init__(self, credentials):
+        self._credentials = credentials
+        self._user = None
+        self._error = None
+
+    def user(self, method_name):
+        if self._credentials is None:
+            raise JSONAuthError("Method {} needs authentication!".format(method_name))
+        if self._user is None and self._error is None:
+            username, password = self._credentials
+            try:
+                user = User.objects.get(username=username)
+            except ObjectDoesNotExist:
+                self._error = "User {} does not exist!".format(username)
+            else:
+                if user.check_password(password):
+                    self._user = user
+                else:
+                    self._error = "Wrong password for user {}!".format(username)
+        if self._error is not None:
+            raise JSONAuthError(self._error)
+        return self._user
 
 
 class JSONMethod(object):
-    def __init__(self, method, auth=False):
+    def __init__(self, method, auth=False, read_only=False):
         self._method = method
         if self._method.__doc__:
             try:
@@ -62,6 +105,7 @@ class JSONMethod(object):
         else:
             self._doc = ""
         self.auth = auth
+        self.read_only = read_only
 
     @property
     def __name__(self):
@@ -84,63 +128,94 @@ class JSONMethod(object):
             "defaults": defaults,
             "docstring": self._doc,
             "needs_authentication": self.auth,
+            "read_only": self.read_only,
         }
 
 
 class JSONApi(object):
+    """The JSON API entry point.
+
+    A request calls one method (``{"method": ..., "args": ..., "kwargs": ..., "auth": ...}``)
+    or a batch of them (``{"calls": [{"method": ..., "args": ..., "kwargs": ...}, ...],
+    "auth": ...}``). A batch is answered with a list of the per-call results, each of them in the
+    same format as a single call's response, so one failing call does not affect the others.
+    Credentials are checked once per request. If all the methods in a batch are read-only, the
+    whole batch runs in one database transaction so that it sees a consistent state.
+    """
     def __init__(self):
         self._methods = {}
 
-    def method(self, f):
-        self._methods[f.__name__] = JSONMethod(f)
+    def method(self, f=None, read_only=False):
+        if f is None:
+            return lambda f: self.method(f, read_only=read_only)
+        self._methods[f.__name__] = JSONMethod(f, read_only=read_only)
 
-    def authenticated_method(self, f):
-        self._methods[f.__name__] = JSONMethod(f, auth=True)
+    def authenticated_method(self, f=None, read_only=False):
+        if f is None:
+            return lambda f: self.authenticated_method(f, read_only=read_only)
+        self._methods[f.__name__] = JSONMethod(f, auth=True, read_only=read_only)
 
     def doc(self, request):
         return render(request, 'appliances/apidoc.html', {})
 
-    def __call__(self, request):
-        if request.method != 'POST':
-            return json_success({
-                "available_methods": sorted(
-                    map(lambda m: m.description, self._methods.itervalues()),
-                    key=lambda m: m["name"]),
-            })
+    def _call(self, call, auth, ipaddr, savepoint=False):
+        method = None
         try:
-            data = json.loads(request.body)
-            method_name = data["method"]
-            args = data["args"]
-            kwargs = data["kwargs"]
+            method_name = call["method"]
+            args = call["args"]
+            kwargs = call["kwargs"]
             try:
                 method = self._methods[method_name]
             except KeyError:
                 raise NameError("Method {} not found!".format(method_name))
-            ipaddr = get_ip(request)
             create_logger(method).info(
                 "Calling with parameters {!r}{!r} from {!r}".format(tuple(args), kwargs, ipaddr))
             if method.auth:
-                if "auth" in data:
-                    username, password = data["auth"]
-                    try:
-                        user = User.objects.get(username=username)
-                    except ObjectDoesNotExist:
-                        return json_autherror("User {} does not exist!".format(username))
-                    if not user.check_password(password):
-                        return json_autherror("Wrong password for user {}!".format(username))
-                    create_logger(method).info(
-                        "Called by user {}/{}".format(user.id, user.username))
-                    return json_success(method(user, *args, **kwargs))
-                else:
-                    return json_autherror("Method {} needs authentication!".format(method_name))
+                try:
+                    user = auth.user(method_name)
+                except JSONAuthError as e:
+                    return autherror_result(e)
+                create_logger(method).info(
+                    "Called by user {}/{}".format(user.id, user.username))
+                args = [user] + list(args)
+            if savepoint:
+                with transaction.atomic():
+                    result = method(*args, **kwargs)
             else:
-                return json_success(method(*args, **kwargs))
+                result = method(*args, **kwargs)
         except Exception as e:
-            create_logger(method).error(
+            create_logger(method or self).error(
                 "Exception raised during call: {}: {}".format(type(e).__name__, str(e)))
-            return json_exception(e)
+            return exception_result(e)
         else:
             create_logger(method).info("Call finished")
+            return success_result(result)
+
+    def _call_batch(self, calls, auth, ipaddr):
+        methods = [self._methods.get(call.get("method")) for call in calls]
+        if methods and all(method is not None and method.read_only for method in methods):
+            with transaction.atomic():
+                return [self._call(call, auth, ipaddr, savepoint=True) for call in calls]
+        return [self._call(call, auth, ipaddr) for call in calls]
+
+    def __call__(self, request):
+        if request.method != 'POST':
+            return json_success({
+                "available_methods": sorted(
+                    map(lambda m: m.description, self._methods.itervalues()),
+                    key=lambda m: m["name"]),
+            })
+        try:
+            data = json.loads(request.body)
+            auth = JSONAuth(data.get("auth"))
+            ipaddr = get_ip(request)
+            if "calls" in data:
+                return json_success(self._call_batch(data["calls"], auth, ipaddr))
+        except Exception as e:
+            create_logger(self).error(
+                "Exception raised during call: {}: {}".format(type(e).__name__, str(e)))
+            return json_exception(e)
+        return json_response(self._call(data, auth, ipaddr))
 
 
 jsonapi = JSONApi()
@@ -150,7 +225,7 @@ def jsonapi_doc(*args, **kwargs):
     return jsonapi.doc(*args, **kwargs)
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def has_template(template_name, preconfigured):
     """Check if Sprout tracks a template with a particular name.
 
@@ -170,7 +245,7 @@ def has_template(template_name, preconfigured):
     return query.count() > 0
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def list_appliances(used=False):
     """Returns list of appliances.
 
@@ -189,7 +264,7 @@ def list_appliances(used=False):
     return result
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def num_shepherd_appliances(user, group, version=None, date=None, provider=None):
     """Provides number of currently available shepherd appliances."""
     group = Group.objects.get(id=group)
@@ -242,9 +317,7 @@ def request_appliances(
         container, ram, cpu, provider_type).id
 
 
-@jsonapi.authenticated_method
-def request_check(user, request_id):
-    """Return status of the appliance pool"""
+def get_pool_status(request_id, user):
     request = AppliancePool.objects.get(id=request_id)
     if user != request.owner and not user.is_staff:
         raise Exception("This pool belongs to a different user!")
@@ -262,6 +335,40 @@ def request_check(user, request_id):
     }
 
 
+@jsonapi.authenticated_method(read_only=True)
+def request_check(user, request_id):
+    """Return status of the appliance pool"""
+    return get_pool_status(request_id, user)
+
+
+@jsonapi.authenticated_method
+def wait_request_change(user, request_id, version=None, timeout=None):
+    """Wait until the appliance pool changes, then return its status.
+
+    Same as ``request_check``, but the result also contains a ``version`` of the pool. Pass it
+    back in the next call, which then waits until the pool or one of its appliances changes.
+    Without ``version`` the call returns immediately.
+
+    Args:
+        request_id: Id of the appliance pool.
+        version: ``version`` from the previous result.
+        timeout: Maximum time to wait (seconds). Limited by the server, when it passes, the
+            current status is returned with an unchanged ``version``.
+    """
+    request = AppliancePool.objects.get(id=request_id)
+    if user != request.owner and not user.is_staff:
+        raise Exception("This pool belongs to a different user!")
+    if timeout is None or timeout > settings.POOL_WAIT_MAX_TIMEOUT:
+        timeout = settings.POOL_WAIT_MAX_TIMEOUT
+    if version is None:
+        version = redis.pool_version(request.id)
+    else:
+        version = redis.wait_pool_change(request.id, version, timeout)
+    status = get_pool_status(request_id, user)
+    status["version"] = version
+    return status
+
+
 @jsonapi.authenticated_method
 def prolong_appliance_lease(user, id, minutes=60):
     """Prolongs the appliance's lease time by specified amount of minutes from current time."""
@@ -289,7 +396,7 @@ def destroy_pool(user, id):
     pool.kill()
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def pool_exists(id):
     """Check whether pool does exist"""
     try:
@@ -299,7 +406,7 @@ def pool_exists(id):
         return False
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def get_number_free_appliances(user, group):
     """Get number of available appliances to keep in the pool"""
     with transaction.atomic():
@@ -324,18 +431,18 @@ def set_number_free_appliances(user, group, n):
         return True
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def available_cfme_versions(preconfigured=True):
     """Lists all versions that are available"""
     return Template.get_versions(preconfigured=preconfigured)
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def available_groups():
     return map(lambda group: group.id, Group.objects.all())
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def available_providers():
     return map(lambda group: group.id, Provider.objects.all())
 
@@ -373,7 +480,7 @@ def get_appliance(appliance, user=None):
         return appliance
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def appliance_data(user, appliance):
     """Returns data about the appliance serialized as JSON.
 
@@ -396,7 +503,7 @@ def destroy_appliance(user, appliance):
         return None
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def power_state(appliance):
     """Return appliance's current power state.
 
@@ -459,7 +566,7 @@ def set_pool_description(user, pool_id, description):
     return True
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def get_pool_description(user, pool_id):
     """Get the pool's description"""
     pool = AppliancePool.objects.get(id=pool_id)
@@ -471,7 +578,7 @@ def get_pool_description(user, pool_id):
     return pool.description
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def find_pools_by_description(user, description, partial=False):
     """Searches pools to find a pool with matching descriptions. When partial, `in` is used"""
     pools = []
@@ -501,14 +608,14 @@ def rename_appliance(user, appliance, new_name):
     return appliance_rename.delay(appliance.id, new_name).task_id
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def task_finished(task_id):
     """Returns whether specified task has already finished"""
     result = AsyncResult(task_id)
     return result.ready()
 
 
-@jsonapi.method
+@jsonapi.method(read_only=True)
 def task_result(task_id):
     """Returns result of the task. Returns None if no result yet"""
     result = AsyncResult(task_id)
@@ -517,7 +624,7 @@ def task_result(task_id):
     return result.get(timeout=1)
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def appliance_provider_type(user, appliance):
     """Return appliance's provider class.
 
@@ -529,7 +636,7 @@ def appliance_provider_type(user, appliance):
     return api_class.__name__
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def appliance_provider_key(user, appliance):
     """Return appliance's provider key.
 
@@ -585,7 +692,7 @@ def clone_pool(user, pool_id, count=None, lease_time=60):
     return pool.clone(count, lease_time, owner).id
 
 
-@jsonapi.authenticated_method
+@jsonapi.authenticated_method(read_only=True)
 def available_provider_types(user):
     """Return a list of provider types usable for provisioning."""
     return Provider.get_available_provider_types(user)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from datetime import date
+
+import yaml
+from django.db import migrations
+
+METADATA_MODELS = [
+    'DelayedProvisionTask', 'Provider', 'Group', 'GroupShepherd', 'Template', 'Appliance',
+    'AppliancePool']
+
+
+def convert_metadata(apps, schema_editor, convert):
+    for model_name in METADATA_MODELS:
+        model = apps.get_model('appliances', model_name)
+        objects = model.objects.using(schema_editor.connection.alias)
+        for pk, data in objects.values_list('pk', 'object_meta_data').iterator():
+            new_data = convert(data)
+            if new_data is not None and new_data != data:
+                objects.filter(pk=pk).update(object_meta_data=new_data)
+
+
+def json_default(o):
+    # Need to replicate the functionality from the model here
+    if isinstance(o, date):
+        return o.isoformat()
+    elif isinstance(o, (set, frozenset)):
+        return sorted(o)
+    raise TypeError("{!r} can not be stored in metadata".format(o))
+
+
+def yaml_to_json(data):
+    try:
+        json.loads(data)
+    except ValueError:
+        return json.dumps(yaml.load(data) or {}, default=json_default)
+    else:
+        return None
+
+
+def json_to_yaml(data):
+    try:
+        return yaml.dump(json.loads(data))
+    except ValueError:
+        return None
+
+
+def metadata_to_json(apps, schema_editor):
+    convert_metadata(apps, schema_editor, yaml_to_json)
+
+
+def metadata_to_yaml(apps, schema_editor):
+    convert_metadata(apps, schema_editor, json_to_yaml)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0043_provider_provider_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(metadata_to_json, metadata_to_yaml),
+    ]
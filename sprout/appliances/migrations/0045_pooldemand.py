@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('appliances', '0044_metadata_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PoolDemand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False,
+                                        verbose_name='ID')),
+                ('version', models.CharField(max_length=32, null=True)),
+                ('preconfigured', models.BooleanField(default=True)),
+                ('num_appliances', models.IntegerField()),
+                ('requested_on', models.DateTimeField(db_index=True,
+                                                      default=django.utils.timezone.now)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                            to='appliances.Group')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                            to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import base64
+import json
+import math
 import re
+import threading
 import yaml
 
 try:
@@ -12,18 +15,19 @@ import wrapanapi
 
 from cached_property import cached_property
 from celery import chain
+from collections import namedtuple
 from contextlib import contextmanager
 from datetime import timedelta, date
 from django.contrib.auth.models import User, Group as DjangoGroup
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction
-from django.db.models import Q
-from django.db.models.signals import pre_save
+from django.db.models import Case, Count, Q, Sum, When
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from json_field import JSONField
 
-from sprout import critical_section, redis
+from sprout import critical_section, redis, settings
 from sprout.log import create_logger
 
 from cfme.utils.appliance import Appliance as CFMEAppliance, IPAppliance
@@ -58,10 +62,30 @@ def apply_if_not_none(o, meth, *args, **kwargs):
     return getattr(o, meth)(*args, **kwargs)
 
 
+def _metadata_default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    elif isinstance(o, (set, frozenset)):
+        return sorted(o)
+    raise TypeError("{!r} can not be stored in metadata".format(o))
+
+
+def dump_metadata(value):
+    return json.dumps(value, default=_metadata_default)
+
+
+def load_metadata(data):
+    try:
+        return json.loads(data)
+    except ValueError:
+        # Stored before metadata was kept as JSON
+        return yaml.load(data)
+
+
 class MetadataMixin(models.Model):
     class Meta:
         abstract = True
-    object_meta_data = models.TextField(default=yaml.dump({}))
+    object_meta_data = models.TextField(default='{}\n')
     created_on = models.DateTimeField(default=timezone.now, editable=False)
     modified_on = models.DateTimeField(default=timezone.now)
 
@@ -88,25 +112,25 @@ class MetadataMixin(models.Model):
 
     @property
     def metadata(self):
-        return yaml.load(self.object_meta_data)
+        return load_metadata(self.object_meta_data)
 
     @metadata.setter
     def metadata(self, value):
         if not isinstance(value, dict):
             raise TypeError("You can store only dict in metadata!")
-        self.object_meta_data = yaml.dump(value)
+        self.object_meta_data = dump_metadata(value)
 
     @property
     @contextmanager
     def edit_metadata(self):
         with transaction.atomic():
-            with self.metadata_lock:
-                o = type(self).objects.get(pk=self.pk)
-                metadata = o.metadata
-                yield metadata
-                o.metadata = metadata
-                o.save()
-        self.reload()
+            # The row lock serializes concurrent edits of the metadata until the transaction ends
+            o = type(self).objects.select_for_update().only('object_meta_data').get(pk=self.pk)
+            metadata = o.metadata
+            yield metadata
+            self.metadata = metadata
+            # a real save, unlike queryset.update(), sends post_save to the change listeners
+            self.save(update_fields=['object_meta_data', 'modified_on'])
 
     @property
     def logger(self):
@@ -129,6 +153,13 @@ class DelayedProvisionTask(MetadataMixin):
             self.provider_to_avoid.id if self.provider_to_avoid is not None else "---")
 
 
+#: Counts of a provider's appliances and templates, as used to compute its load
+ProviderLoad = namedtuple('ProviderLoad', ['managing', 'provisioning', 'templates_preparing'])
+
+# Snapshot of all providers' loads, valid for the duration of a Provider.load_snapshot() block
+_provider_loads = threading.local()
+
+
 class Provider(MetadataMixin):
     id = models.CharField(max_length=32, primary_key=True, help_text="Provider's key in YAML.")
     working = models.BooleanField(default=False, help_text="Whether provider is available.")
@@ -197,15 +228,73 @@ class Provider(MetadataMixin):
         else:
             return get_mgmt(self.id)
 
+    @classmethod
+    def current_loads(cls):
+        """Returns a dict of :py:class:`ProviderLoad` for all providers, made with a single query"""
+        appliance = 'provider_templates__appliance'
+        providers = cls.objects.order_by().annotate(
+            num_managing=Count(appliance, distinct=True),
+            num_provisioning=Count(
+                Case(When(
+                    Q(**{
+                        appliance + '__ready': False,
+                        appliance + '__marked_for_deletion': False,
+                        appliance + '__ip_address__isnull': True}),
+                    then=appliance + '__id')),
+                distinct=True),
+            num_templates_preparing=Count(
+                Case(When(provider_templates__ready=False, then='provider_templates__id')),
+                distinct=True))
+        return {
+            provider_id: ProviderLoad(managing, provisioning, templates_preparing)
+            for provider_id, managing, provisioning, templates_preparing in providers.values_list(
+                'id', 'num_managing', 'num_provisioning', 'num_templates_preparing')}
+
+    @classmethod
+    @contextmanager
+    def load_snapshot(cls):
+        """Makes the load related properties of all providers share one snapshot of their loads
+
+        Use it around scheduling passes which look at the load of many providers or templates. The
+        snapshot is made on first use and dropped whenever an appliance or a template is saved or
+        deleted, so decisions made during the pass are accounted for. Nested blocks share the
+        outermost block's snapshot.
+        """
+        if getattr(_provider_loads, 'active', False):
+            yield
+            return
+        _provider_loads.active = True
+        _provider_loads.loads = None
+        try:
+            yield
+        finally:
+            _provider_loads.active = False
+            _provider_loads.loads = None
+
+    @property
+    def snapshot_load(self):
+        """This provider's :py:class:`ProviderLoad` if in a load snapshot block, otherwise None"""
+        if not getattr(_provider_loads, 'active', False):
+            return None
+        if _provider_loads.loads is None:
+            _provider_loads.loads = type(self).current_loads()
+        return _provider_loads.loads.get(self.id, ProviderLoad(0, 0, 0))
+
     @property
     def num_currently_provisioning(self):
-        return len(
-            Appliance.objects.filter(
-                ready=False, marked_for_deletion=False, template__provider=self, ip_address=None))
+        load = self.snapshot_load
+        if load is not None:
+            return load.provisioning
+        return Appliance.objects.filter(
+            ready=False, marked_for_deletion=False, template__provider=self,
+            ip_address=None).count()
 
     @property
     def num_templates_preparing(self):
-        return len(Template.objects.filter(provider=self, ready=False))
+        load = self.snapshot_load
+        if load is not None:
+            return load.templates_preparing
+        return Template.objects.filter(provider=self, ready=False).count()
 
     @property
     def remaining_configuring_slots(self):
@@ -225,7 +314,10 @@ class Provider(MetadataMixin):
 
     @property
     def num_currently_managing(self):
-        return len(Appliance.objects.filter(template__provider=self))
+        load = self.snapshot_load
+        if load is not None:
+            return load.managing
+        return Appliance.objects.filter(template__provider=self).count()
 
     @property
     def currently_managed_appliances(self):
@@ -522,6 +614,44 @@ class GroupShepherd(MetadataMixin):
             return 100
         return int(round((float(appliances_in_shepherd) / float(wanted_pool_size)) * 100.0))
 
+    def forecast_demand(self, preconfigured, version=None):
+        """Forecasts how many appliances this shepherd's users will request in the next hour or so
+
+        The forecast is the higher of the average demand in the same hour of the week during the
+        last ``SHEPHERD_FORECAST_WEEKS`` weeks (so eg. Monday mornings are expected) and the demand
+        during the last hour. The latter can be limited to a version, the former can't as the latest
+        version was different weeks ago.
+        """
+        now = timezone.now()
+        horizon = timedelta(**settings.SHEPHERD_FORECAST_HORIZON)
+        weeks = settings.SHEPHERD_FORECAST_WEEKS
+        demand = PoolDemand.objects.filter(
+            group=self.template_group, owner__groups=self.user_group, preconfigured=preconfigured)
+        recent_demand = demand.filter(requested_on__gte=now - horizon)
+        if version is not None:
+            recent_demand = recent_demand.filter(version=version)
+        recent = recent_demand.aggregate(total=Sum('num_appliances'))['total'] or 0
+        past_weeks_q = Q()
+        for week in range(1, weeks + 1):
+            week_ago = now - timedelta(weeks=week)
+            past_weeks_q |= Q(requested_on__gte=week_ago, requested_on__lt=week_ago + horizon)
+        past_weeks = demand.filter(past_weeks_q).aggregate(total=Sum('num_appliances'))['total']
+        return max(recent, int(math.ceil(float(past_weeks or 0) / weeks)))
+
+    def target_pool_size(self, preconfigured, version=None):
+        """The configured pool size, raised to the forecast demand by at most SHEPHERD_MAX_PREWARM
+
+        A pool size of 0 disables the shepherd, so it is never raised.
+        """
+        if preconfigured:
+            pool_size = self.template_pool_size
+        else:
+            pool_size = self.unconfigured_template_pool_size
+        if pool_size == 0:
+            return 0
+        forecast = self.forecast_demand(preconfigured, version)
+        return max(pool_size, min(forecast, pool_size + settings.SHEPHERD_MAX_PREWARM))
+
     def shepherd_appliances(self, preconfigured=True):
         return self.appliances.filter(
             appliance_pool=None, ready=True, marked_for_deletion=False,
@@ -575,6 +705,9 @@ class Template(MetadataMixin):
             'This then specifies the container name.'))
     ga_released = models.BooleanField(default=False)
 
+    # Changes of these fields can trigger scheduling tasks, see template_changed
+    SCHEDULING_FIELDS = ('ready', )
+
     class Meta:
         ordering = ['name', 'original_name', 'provider', 'id']
 
@@ -733,6 +866,9 @@ class Appliance(MetadataMixin):
 
     RESET_SWAP_STATES = {Power.OFF, Power.REBOOTING, Power.ORPHANED}
 
+    # Changes of these fields can trigger scheduling tasks, see appliance_changed
+    SCHEDULING_FIELDS = ('ready', 'appliance_pool_id')
+
     template = models.ForeignKey(
         Template, on_delete=models.CASCADE, help_text="Appliance's source template.")
     appliance_pool = models.ForeignKey("AppliancePool", null=True, on_delete=models.CASCADE,
@@ -1079,6 +1215,13 @@ class Appliance(MetadataMixin):
             return None
 
 
+@receiver([post_save, post_delete], sender=Template)
+@receiver([post_save, post_delete], sender=Appliance)
+def invalidate_provider_loads(sender, **kwargs):
+    # Any change of appliances or templates can change providers' loads
+    _provider_loads.loads = None
+
+
 class AppliancePool(MetadataMixin):
     total_count = models.IntegerField(help_text="How many appliances should be in this pool.")
     group = models.ForeignKey(
@@ -1243,6 +1386,9 @@ class AppliancePool(MetadataMixin):
         req.save()
         cls.class_logger(req.pk).info("Created")
         if num_appliances > 0:
+            PoolDemand.objects.create(
+                group=group, owner=owner, version=version, preconfigured=preconfigured,
+                num_appliances=num_appliances)
             # Only if we have any appliances to request
             request_appliance_pool.delay(req.id, time_leased)
         return req
@@ -1307,10 +1453,11 @@ class AppliancePool(MetadataMixin):
 
     @property
     def possible_provisioning_templates(self):
-        return sorted(
-            filter(lambda tpl: tpl.provider.free, self.possible_templates),
-            # Sort by date and load to pick the best match (least loaded provider)
-            key=lambda tpl: (tpl.date, 1.0 - tpl.provider.appliance_load), reverse=True)
+        with Provider.load_snapshot():
+            return sorted(
+                filter(lambda tpl: tpl.provider.free, self.possible_templates),
+                # Sort by date and load to pick the best match (least loaded provider)
+                key=lambda tpl: (tpl.date, 1.0 - tpl.provider.appliance_load), reverse=True)
 
     @property
     def possible_providers(self):
@@ -1454,23 +1601,25 @@ class AppliancePool(MetadataMixin):
 
     @property
     def num_possible_provisioning_slots(self):
-        providers = set([])
-        for template in self.possible_provisioning_templates:
-            providers.add(template.provider)
-        slots = 0
-        for provider in providers:
-            slots += provider.remaining_provisioning_slots
-        return slots
+        with Provider.load_snapshot():
+            providers = set([])
+            for template in self.possible_provisioning_templates:
+                providers.add(template.provider)
+            slots = 0
+            for provider in providers:
+                slots += provider.remaining_provisioning_slots
+            return slots
 
     @property
     def num_possible_appliance_slots(self):
-        providers = set([])
-        for template in self.possible_templates:
-            providers.add(template.provider)
-        slots = 0
-        for provider in providers:
-            slots += provider.remaining_appliance_slots
-        return slots
+        with Provider.load_snapshot():
+            providers = set([])
+            for template in self.possible_templates:
+                providers.add(template.provider)
+            slots = 0
+            for provider in providers:
+                slots += provider.remaining_appliance_slots
+            return slots
 
     @property
     def num_shepherd_appliances(self):
@@ -1488,6 +1637,16 @@ class AppliancePool(MetadataMixin):
             self.id, self.group.id, self.total_count)
 
 
+class PoolDemand(models.Model):
+    """A record of an appliance pool request, kept after the pool is gone to forecast demand"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    version = models.CharField(max_length=32, null=True)
+    preconfigured = models.BooleanField(default=True)
+    num_appliances = models.IntegerField()
+    requested_on = models.DateTimeField(default=timezone.now, db_index=True)
+
+
 class MismatchVersionMailer(models.Model):
     provider = models.ForeignKey(Provider, on_delete=models.CASCADE)
     template_name = models.CharField(max_length=64)
@@ -1565,3 +1724,82 @@ class BugQuery(models.Model):
             bq for bq in
             cls.objects.filter(Q(owner=None) | Q(owner=user)).order_by('owner', 'id')
             if not (bq.is_parametrized and not user.email)]
+
+
+# Scheduling triggers. Changes which may let the shepherd or the delayed provisioning do something
+# trigger those tasks once the change is committed, instead of waiting for their next beat.
+def trigger_tasks(*task_names):
+    def _trigger():
+        from appliances import tasks
+        for task_name in task_names:
+            tasks.trigger(getattr(tasks, task_name))
+    transaction.on_commit(_trigger)
+
+
+# Pool change counters (see sprout.RedisWrapper.wait_pool_change), bumped once a change of the
+# pool or its appliances is committed, so that waiting clients do not wake up before they can see it
+def bump_pool_versions(*pool_ids):
+    pool_ids = {pool_id for pool_id in pool_ids if pool_id is not None}
+
+    def _bump():
+        for pool_id in pool_ids:
+            redis.bump_pool_version(pool_id)
+    if pool_ids:
+        transaction.on_commit(_bump)
+
+
+@receiver(post_init, sender=Template)
+@receiver(post_init, sender=Appliance)
+def remember_scheduling_state(sender, instance, **kwargs):
+    # Read from __dict__ so that deferred fields are not loaded for this
+    instance._scheduling_state = tuple(
+        instance.__dict__.get(field) for field in sender.SCHEDULING_FIELDS)
+
+
+@receiver(post_save, sender=Appliance)
+def appliance_changed(sender, instance, created, **kwargs):
+    old_ready, old_pool_id = instance._scheduling_state
+    instance._scheduling_state = (instance.ready, instance.appliance_pool_id)
+    bump_pool_versions(old_pool_id, instance.appliance_pool_id)
+    if created:
+        return
+    if instance.ready and not old_ready:
+        # A provisioning slot got free and maybe a ready appliance showed up in the shepherd
+        trigger_tasks('process_delayed_provision_tasks')
+    if instance.appliance_pool_id != old_pool_id:
+        if instance.appliance_pool_id is None:
+            trigger_tasks('process_delayed_provision_tasks')
+        else:
+            # Taken from the shepherd, which might need refilling
+            trigger_tasks('free_appliance_shepherd')
+
+
+@receiver(post_delete, sender=Appliance)
+def appliance_deleted(sender, instance, **kwargs):
+    bump_pool_versions(instance.appliance_pool_id)
+    trigger_tasks('free_appliance_shepherd', 'process_delayed_provision_tasks')
+
+
+@receiver(post_save, sender=Template)
+def template_changed(sender, instance, created, **kwargs):
+    old_ready, = instance._scheduling_state
+    instance._scheduling_state = (instance.ready, )
+    if instance.ready and (created or not old_ready):
+        trigger_tasks('free_appliance_shepherd', 'process_delayed_provision_tasks')
+
+
+@receiver(post_save, sender=AppliancePool)
+def pool_created(sender, instance, created, **kwargs):
+    if created:
+        trigger_tasks('free_appliance_shepherd')
+
+
+@receiver([post_save, post_delete], sender=AppliancePool)
+def pool_changed(sender, instance, **kwargs):
+    bump_pool_versions(instance.id)
+
+
+@receiver(post_save, sender=DelayedProvisionTask)
+def delayed_provision_task_created(sender, instance, created, **kwargs):
+    if created:
+        trigger_tasks('process_delayed_provision_tasks')
@@ -28,7 +28,7 @@ import socket
 
 from appliances.models import (
     Provider, Group, Template, Appliance, AppliancePool, DelayedProvisionTask,
-    MismatchVersionMailer, User, GroupShepherd)
+    MismatchVersionMailer, User, GroupShepherd, bump_pool_versions)
 from sprout import settings, redis
 from sprout.irc_bot import send_message
 from sprout.log import create_logger
@@ -57,6 +57,10 @@ VERSION_REGEXPS = [
 VERSION_REGEXPS = map(re.compile, VERSION_REGEXPS)
 VERSION_REGEXP_UPSTREAM = re.compile(r'^miq-stable-([^-]+)-')
 TRACKERBOT_PAGINATE = 20
+# Appliance fields that a provider refresh can change
+REFRESHED_APPLIANCE_FIELDS = (
+    'name', 'uuid', 'ip_address', 'power_state', 'power_state_changed', 'swap', 'ssh_failed')
+REFRESH_BATCH_SIZE = 500  # appliances updated by one query during a provider refresh
 
 
 def retrieve_cfme_appliance_version(template_name):
@@ -107,10 +111,19 @@ def logged_task(*args, **kwargs):
 
 
 def singleton_task(*args, **kwargs):
+    """Task that only runs once at a time for the same arguments
+
+    Args:
+        wait: If another instance holds the lock, retry later instead of giving up
+        rerun: If another instance holds the lock, make that instance run the task again once
+            it finishes, so a request made during a run is never lost. Requests made during the
+            same run are coalesced into one rerun.
+    """
     kwargs["bind"] = True
     wait = kwargs.pop('wait', False)
     wait_countdown = kwargs.pop('wait_countdown', 10)
     wait_retries = kwargs.pop('wait_retries', 30)
+    rerun = kwargs.pop('rerun', False)
 
     def f(task):
         @wraps(task)
@@ -122,9 +135,16 @@ def singleton_task(*args, **kwargs):
             digest_base += "//" + "/".join("{}={}".format(key, kwargs[key]) for key in keys)
             digest = hashlib.sha256(digest_base).hexdigest()
             lock_id = '{0}-lock-{1}'.format(self.name, digest)
+            rerun_id = '{0}-rerun-{1}'.format(self.name, digest)
 
+            if rerun:
+                # Set before trying the lock, so the holder sees it when releasing the lock
+                cache.set(rerun_id, 'true', LOCK_EXPIRE)
             if cache.add(lock_id, 'true', LOCK_EXPIRE):
                 try:
+                    if rerun:
+                        # This run serves all the requests made so far
+                        cache.delete(rerun_id)
                     return task(self, *args, **kwargs)
                 except Exception as e:
                     self.logger.error(
@@ -134,6 +154,10 @@ def singleton_task(*args, **kwargs):
                     raise
                 finally:
                     cache.delete(lock_id)
+                    if rerun and cache.get(rerun_id):
+                        self.logger.info("Requested while running, running again.")
+                        self.apply_async(
+                            args=args, kwargs=kwargs, countdown=settings.TASK_TRIGGER_DEBOUNCE)
             elif wait:
                 self.logger.info("Waiting for another instance of the task to end.")
                 self.retry(args=args, countdown=wait_countdown, max_retries=wait_retries)
@@ -142,6 +166,13 @@ def singleton_task(*args, **kwargs):
     return f
 
 
+def trigger(task):
+    """Runs the task soon, coalescing all triggers of it within the debounce period into one run"""
+    debounce = settings.TASK_TRIGGER_DEBOUNCE
+    if cache.add('{}-trigger'.format(task.name), 'true', debounce):
+        task.apply_async(countdown=debounce)
+
+
 @singleton_task()
 def kill_unused_appliances(self):
     """This is the watchdog, that guards the appliances that were given to users. If you forget
@@ -613,15 +644,16 @@ def request_appliance_pool(self, appliance_pool_id, time_minutes):
         "Appliance pool {} requested for {} minutes.".format(appliance_pool_id, time_minutes))
     pool = AppliancePool.objects.get(id=appliance_pool_id)
     n = Appliance.give_to_pool(pool)
-    for i in range(pool.total_count - n):
-        tpls = pool.possible_provisioning_templates
-        if tpls:
-            template_id = tpls[0].id
-            clone_template_to_pool(template_id, pool.id, time_minutes)
-        else:
-            with transaction.atomic():
-                task = DelayedProvisionTask(pool=pool, lease_time=time_minutes)
-                task.save()
+    with Provider.load_snapshot():
+        for i in range(pool.total_count - n):
+            tpls = pool.possible_provisioning_templates
+            if tpls:
+                template_id = tpls[0].id
+                clone_template_to_pool(template_id, pool.id, time_minutes)
+            else:
+                with transaction.atomic():
+                    task = DelayedProvisionTask(pool=pool, lease_time=time_minutes)
+                    task.save()
     apply_lease_times_after_pool_fulfilled.delay(appliance_pool_id, time_minutes)
 
 
@@ -655,48 +687,50 @@ def apply_lease_times_after_pool_fulfilled(self, appliance_pool_id, time_minutes
             pool.kill()
 
 
-@singleton_task()
+@singleton_task(rerun=True)
 def process_delayed_provision_tasks(self):
     """This picks up the provisioning tasks that were delayed due to ocncurrency limit of provision.
 
     Goes one task by one and when some of them can be provisioned, it starts the provisioning and
     then deletes the task.
     """
-    for task in DelayedProvisionTask.objects.order_by("id"):
-        if task.pool.not_needed_anymore:
-            task.delete()
-            continue
-        # Try retrieve from shepherd
-        appliances_given = Appliance.give_to_pool(task.pool, 1)
-        if appliances_given == 0:
-            # No free appliance in shepherd, so do it on our own
-            tpls = task.pool.possible_provisioning_templates
-            if task.provider_to_avoid is not None:
-                filtered_tpls = filter(lambda tpl: tpl.provider != task.provider_to_avoid, tpls)
-                if filtered_tpls:
-                    # There are other providers to provision on, so try one of them
-                    tpls = filtered_tpls
-                # If there is no other provider to provision on, we will use the original list.
-                # This will cause additional rejects until the provider quota is met
-            if tpls:
-                clone_template_to_pool(tpls[0].id, task.pool.id, task.lease_time)
+    with Provider.load_snapshot():
+        for task in DelayedProvisionTask.objects.order_by("id"):
+            if task.pool.not_needed_anymore:
                 task.delete()
+                continue
+            # Try retrieve from shepherd
+            appliances_given = Appliance.give_to_pool(task.pool, 1)
+            if appliances_given == 0:
+                # No free appliance in shepherd, so do it on our own
+                tpls = task.pool.possible_provisioning_templates
+                if task.provider_to_avoid is not None:
+                    filtered_tpls = filter(lambda tpl: tpl.provider != task.provider_to_avoid, tpls)
+                    if filtered_tpls:
+                        # There are other providers to provision on, so try one of them
+                        tpls = filtered_tpls
+                    # If there is no other provider to provision on, we will use the original list.
+                    # This will cause additional rejects until the provider quota is met
+                if tpls:
+                    clone_template_to_pool(tpls[0].id, task.pool.id, task.lease_time)
+                    task.delete()
+                else:
+                    # Try freeing up some space in provider
+                    for provider in task.pool.possible_providers:
+                        appliances = provider.free_shepherd_appliances.exclude(
+                            task.pool.appliance_container_q,
+                            **task.pool.appliance_filter_params)
+                        if appliances:
+                            appl = random.choice(appliances)
+                            self.logger.info(
+                                'Freeing some space in provider by killing appliance {}/{}'
+                                .format(appl.id, appl.name))
+                            Appliance.kill(appl)
+                            break  # Just one
             else:
-                # Try freeing up some space in provider
-                for provider in task.pool.possible_providers:
-                    appliances = provider.free_shepherd_appliances.exclude(
-                        task.pool.appliance_container_q,
-                        **task.pool.appliance_filter_params)
-                    if appliances:
-                        appl = random.choice(appliances)
-                        self.logger.info(
-                            'Freeing some space in provider by killing appliance {}/{}'
-                            .format(appl.id, appl.name))
-                        Appliance.kill(appl)
-                        break  # Just one
-        else:
-            # There was a free appliance in shepherd, so we took it and we don't need this task more
-            task.delete()
+                # There was a free appliance in shepherd, so we took it and we don't need this task
+                # any more
+                task.delete()
 
 
 @logged_task()
@@ -1105,7 +1139,13 @@ def refresh_appliances_provider(self, provider_id):
         dict_vms[vm.name] = vm
         if vm.uuid:
             uuid_vms[vm.uuid] = vm
+    # Rows which need the same changes are updated together, unchanged rows are not written at all
+    now = timezone.now()
+    updates = {}
+    changed_pools = set()
+    changed = unchanged = orphaned = 0
     for appliance in Appliance.objects.filter(template__provider=provider):
+        original = {field: getattr(appliance, field) for field in REFRESHED_APPLIANCE_FIELDS}
         if appliance.uuid is not None and appliance.uuid in uuid_vms:
             vm = uuid_vms[appliance.uuid]
             # Using the UUID and change the name if it changed
@@ -1113,7 +1153,6 @@ def refresh_appliances_provider(self, provider_id):
             appliance.ip_address = vm.ip
             appliance.set_power_state(Appliance.POWER_STATES_MAPPING.get(
                 vm.power_state, Appliance.Power.UNKNOWN))
-            appliance.save()
         elif appliance.name in dict_vms:
             vm = dict_vms[appliance.name]
             # Using the name, and then retrieve uuid
@@ -1121,13 +1160,35 @@ def refresh_appliances_provider(self, provider_id):
             appliance.ip_address = vm.ip
             appliance.set_power_state(Appliance.POWER_STATES_MAPPING.get(
                 vm.power_state, Appliance.Power.UNKNOWN))
-            appliance.save()
-            self.logger.info("Retrieved UUID for appliance {}/{}: {}".format(
-                appliance.id, appliance.name, appliance.uuid))
+            if appliance.uuid != original['uuid']:
+                self.logger.info("Retrieved UUID for appliance {}/{}: {}".format(
+                    appliance.id, appliance.name, appliance.uuid))
         else:
             # Orphaned :(
+            orphaned += 1
             appliance.set_power_state(Appliance.Power.ORPHANED)
-            appliance.save()
+        changes = {
+            field: getattr(appliance, field) for field in REFRESHED_APPLIANCE_FIELDS
+            if getattr(appliance, field) != original[field]}
+        if not changes:
+            unchanged += 1
+            continue
+        changed += 1
+        if 'power_state_changed' in changes:
+            changes['power_state_changed'] = now
+        changes['modified_on'] = now
+        updates.setdefault(tuple(sorted(changes.items())), []).append(appliance.id)
+        changed_pools.add(appliance.appliance_pool_id)
+    with transaction.atomic():
+        for changes, appliance_ids in updates.items():
+            for i in range(0, len(appliance_ids), REFRESH_BATCH_SIZE):
+                Appliance.objects.filter(
+                    id__in=appliance_ids[i:i + REFRESH_BATCH_SIZE]).update(**dict(changes))
+        # update() sends no signals, let the waiting clients know about the changes here
+        bump_pool_versions(*changed_pools)
+    self.logger.info(
+        "Refreshed appliances in {}: {} changed, {} unchanged, {} orphaned".format(
+            provider_id, changed, unchanged, orphaned))
 
 
 @singleton_task()
@@ -1269,26 +1330,38 @@ def generic_shepherd(self, preconfigured):
         # If we then want to delete some templates, better kill the eldest. status_changed
         # says which one was provisioned when, because nothing else then touches that field.
         appliances.sort(key=lambda appliance: appliance.status_changed)
-        pool_size = gs.template_pool_size if preconfigured else gs.unconfigured_template_pool_size
+        configured_pool_size = (
+            gs.template_pool_size if preconfigured else gs.unconfigured_template_pool_size)
+        # Raised ahead of the forecast demand
+        pool_size = gs.target_pool_size(preconfigured, filter_keep.get('version'))
         if len(appliances) < pool_size and possible_templates_for_provision:
             # There must be some templates in order to run the provisioning
             # Provision ONE appliance at time for each group, that way it is possible to maintain
-            # reasonable balancing
-            new_appliance_name = settings.APPLIANCE_FORMAT.format(
-                group=template.template_group.id,
-                date=template.date.strftime("%y%m%d"),
-                rnd=fauxfactory.gen_alphanumeric(8))
-            with transaction.atomic():
-                # Now look for templates that are on non-busy providers
-                tpl_free = filter(
-                    lambda t: t.provider.free,
-                    possible_templates_for_provision)
-                if tpl_free:
-                    appliance = Appliance(
-                        template=sorted(tpl_free, key=lambda t: t.provider.appliance_load)[0],
-                        name=new_appliance_name)
-                    appliance.save()
-            if tpl_free:
+            # reasonable balancing. Only when demand is expected, provision more of them at once.
+            if pool_size > configured_pool_size:
+                provision_count = min(
+                    pool_size - len(appliances), settings.SHEPHERD_MAX_CONCURRENT_PROVISIONS)
+                self.logger.info("Pre-warming shepherd {} to {} appliances".format(gs, pool_size))
+            else:
+                provision_count = 1
+            for _ in range(provision_count):
+                new_appliance_name = settings.APPLIANCE_FORMAT.format(
+                    group=template.template_group.id,
+                    date=template.date.strftime("%y%m%d"),
+                    rnd=fauxfactory.gen_alphanumeric(8))
+                with transaction.atomic():
+                    # Now look for templates that are on non-busy providers
+                    tpl_free = filter(
+                        lambda t: t.provider.free,
+                        possible_templates_for_provision)
+                    if tpl_free:
+                        appliance = Appliance(
+                            template=sorted(tpl_free, key=lambda t: t.provider.appliance_load)[0],
+                            name=new_appliance_name)
+                        appliance.save()
+                if not tpl_free:
+                    # No provider slots left
+                    break
                 self.logger.info(
                     "Adding an appliance to shepherd: {}/{}".format(appliance.id, appliance.name))
                 clone_template_to_appliance.delay(appliance.id, None)
@@ -1316,10 +1389,11 @@ def generic_shepherd(self, preconfigured):
                     Appliance.kill(a)
 
 
-@singleton_task()
+@singleton_task(rerun=True)
 def free_appliance_shepherd(self):
-    generic_shepherd(self, True)
-    generic_shepherd(self, False)
+    with Provider.load_snapshot():
+        generic_shepherd(self, True)
+        generic_shepherd(self, False)
 
 
 @singleton_task()
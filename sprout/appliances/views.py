@@ -98,7 +98,8 @@ def providers(request, provider_id=None):
             messages.warning(request, "Provider '{}' does not exist.".format(provider_id))
             return redirect("providers")
     providers = Provider.objects.filter(hidden=False, **user_filter).order_by("id").distinct()
-    return render(request, 'appliances/providers.html', locals())
+    with Provider.load_snapshot():
+        return render(request, 'appliances/providers.html', locals())
 
 
 def provider_usage(request):
@@ -331,27 +332,29 @@ def providers_for_date_group_and_version(request):
                     for provider
                     in providers
                     if provider.provider_type == provider_type]
-            for provider in providers:
-                appl_filter = dict(
-                    appliance_pool=None, ready=True, template__provider=provider,
-                    template__preconfigured=filters["preconfigured"],
-                    template__template_group=filters["template_group"])
-                if "date" in filters:
-                    appl_filter["template__date"] = filters["date"]
-
-                if "version" in filters:
-                    appl_filter["template__version"] = filters["version"]
-                shepherd_appliances[provider.id] = len(
-                    Appliance.objects.filter(appliance_container_q, **appl_filter))
-                total_shepherd_slots += shepherd_appliances[provider.id]
-                total_appliance_slots += provider.remaining_appliance_slots
-                total_provisioning_slots += provider.remaining_provisioning_slots
+            with Provider.load_snapshot():
+                for provider in providers:
+                    appl_filter = dict(
+                        appliance_pool=None, ready=True, template__provider=provider,
+                        template__preconfigured=filters["preconfigured"],
+                        template__template_group=filters["template_group"])
+                    if "date" in filters:
+                        appl_filter["template__date"] = filters["date"]
+
+                    if "version" in filters:
+                        appl_filter["template__version"] = filters["version"]
+                    shepherd_appliances[provider.id] = len(
+                        Appliance.objects.filter(appliance_container_q, **appl_filter))
+                    total_shepherd_slots += shepherd_appliances[provider.id]
+                    total_appliance_slots += provider.remaining_appliance_slots
+                    total_provisioning_slots += provider.remaining_provisioning_slots
 
             render_providers = {}
             for provider in providers:
                 render_providers[provider.id] = {
                     "shepherd_count": shepherd_appliances[provider.id], "object": provider}
-    return render(request, 'appliances/_providers.html', locals())
+    with Provider.load_snapshot():
+        return render(request, 'appliances/_providers.html', locals())
 
 
 @only_authenticated
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import time
 from contextlib import contextmanager
 try:
     import cPickle as pickle
@@ -97,6 +98,48 @@ class RedisWrapper(object):
     def renaming_appliances(self):
         return self.get("renaming_appliances") or set([])
 
+    # Pool change counters. Every change of a pool or its appliances increments the pool's counter
+    # and publishes the new value on a channel of the same name, so that API clients can wait for
+    # a change instead of polling the database. Redis commands are atomic, no locking needed.
+    @staticmethod
+    def _pool_version_key(pool_id):
+        return "pool-version-{}".format(pool_id)
+
+    def pool_version(self, pool_id):
+        return int(self.client.get(self._pool_version_key(pool_id)) or 0)
+
+    def bump_pool_version(self, pool_id):
+        key = self._pool_version_key(pool_id)
+        pipeline = self.client.pipeline()
+        pipeline.incr(key)
+        pipeline.expire(key, settings.POOL_VERSION_EXPIRE)
+        version, _ = pipeline.execute()
+        self.client.publish(key, version)
+        return version
+
+    def wait_pool_change(self, pool_id, version, timeout):
+        """Blocks until the pool's counter differs from ``version``, at most ``timeout`` seconds.
+
+        Returns:
+            The current value of the counter.
+        """
+        key = self._pool_version_key(pool_id)
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        # Subscribe before reading the counter so that no change can slip in between
+        pubsub.subscribe(key)
+        try:
+            deadline = time.time() + timeout
+            current = self.pool_version(pool_id)
+            while current == version:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                pubsub.get_message(timeout=remaining)
+                current = self.pool_version(pool_id)
+            return current
+        finally:
+            pubsub.close()
+
 
 redis = RedisWrapper(redis_client)
 sprout_path = project_path.join("sprout")
@@ -165,7 +165,25 @@ ORPHANED_APPLIANCE_GRACE_TIME = dict(
     minutes=45,
 )
 
+# Shepherd pre-warming: pool sizes are raised ahead of the demand forecast from past pool requests
+SHEPHERD_FORECAST_WEEKS = 4
+SHEPHERD_FORECAST_HORIZON = dict(hours=1)
+SHEPHERD_MAX_PREWARM = 10  # appliances above the configured pool size
+SHEPHERD_MAX_CONCURRENT_PROVISIONS = 3  # per group and shepherd run, when pre-warming
+
+# Seconds that task triggers caused by model changes (see appliances.tasks.trigger) wait so that
+# a burst of changes results in one task run
+TASK_TRIGGER_DEBOUNCE = 5
+
+# Longest time (seconds) an API call waiting for a pool change (wait_request_change) may block.
+# Keep it below the timeouts of gunicorn and of any proxy in front of it.
+POOL_WAIT_MAX_TIMEOUT = 20
+# How long the pool change counters are kept in redis after their last change
+POOL_VERSION_EXPIRE = 7 * 24 * 3600
+
 # Celery beat
+# The shepherd and delayed provisioning are also triggered by appliance, template and pool changes,
+# their schedule is just a safety net
 CELERYBEAT_SCHEDULE = {
     'check-templates': {
         'task': 'appliances.tasks.check_templates',
@@ -179,7 +197,7 @@ CELERYBEAT_SCHEDULE = {
 
     'free-appliance-shepherd': {
         'task': 'appliances.tasks.free_appliance_shepherd',
-        'schedule': timedelta(seconds=30),
+        'schedule': timedelta(minutes=5),
     },
 
     'kill-unused-appliances': {
@@ -199,7 +217,7 @@ CELERYBEAT_SCHEDULE = {
 
     'process-delayed-provision-tasks': {
         'task': 'appliances.tasks.process_delayed_provision_tasks',
-        'schedule': timedelta(seconds=20),
+        'schedule': timedelta(minutes=2),
     },
 
     'scavenge-managed-providers': {